@@ -18,12 +18,20 @@
 #  limitations under the License.
 #
 
+# --startup_profile measures the imports, so it must be set up first.
+import sys
+startup_profiler = None
+if ('--startup_profile' in sys.argv) or ('--startup-profile' in sys.argv):
+    from ikalog.startup_profile import StartupProfiler
+    startup_profiler = StartupProfiler()
+    startup_profiler.start()
+
 from ikalog.utils import Localization, IkaUtils
 Localization.print_language_settings()
 
 import argparse
+import contextlib
 import signal
-import sys
 import time
 from ikalog import inputs
 from ikalog.engine import IkaEngine
@@ -54,6 +62,13 @@ def get_args():
                         'If this is specified, the data is not uploaded.')
     parser.add_argument('--profile', dest='profile', action='store_true',
                         default=False)
+    parser.add_argument('--profile_csv', dest='profile_csv', type=str,
+                        help='Write the profile to the CSV file at exit.')
+    parser.add_argument('--startup_profile', '--startup-profile',
+                        dest='startup_profile', action='store_true',
+                        default=False,
+                        help='Print the time took to import each module '
+                        'and to start up.')
     parser.add_argument('--time', '-t', dest='time', type=str)
     parser.add_argument('--time_msec', dest='time_msec', type=int)
     parser.add_argument('--video_id', dest='video_id', type=str)
@@ -61,10 +76,24 @@ def get_args():
                         help='Do not exit on EOFError with no next inputs.')
     parser.add_argument('--debug', dest='debug', action='store_true',
                         default=False)
+    parser.add_argument('--jobs', '-j', dest='jobs', type=int,
+                        help='Batch mode. Analyze input files (or video '
+                        'files in input directories) with this number of '
+                        'processes. 0 means the number of CPUs.')
+    parser.add_argument('--split_sessions', dest='split_sessions',
+                        action='store_true', default=False,
+                        help='Batch mode. Split each video at the boundaries '
+                        'of games to analyze it in parallel.')
 
     return vars(parser.parse_args())
 
 
+def measure_startup(name):
+    if startup_profiler:
+        return startup_profiler.measure(name)
+    return contextlib.suppress()
+
+
 def get_pos_msec(args):
     if args['time_msec']:
         return args['time_msec']
@@ -76,14 +105,25 @@ def get_pos_msec(args):
 
 
 if __name__ == "__main__":
-    signal.signal(signal.SIGINT, signal_handler)
-
     args = get_args()
-    capture, output_plugins = config_loader.config(args)
-    capture.set_pos_msec(get_pos_msec(args))
 
-    engine = IkaEngine(enable_profile=args.get('profile'),
-                       keep_alive=args.get('keep_alive'))
+    if args.get('jobs') is not None:
+        from ikalog.batch import BatchAnalyzer
+        batch = BatchAnalyzer(args, jobs=args['jobs'],
+                              split_sessions=args['split_sessions'])
+        batch.run(args['input_file'] or [])
+        IkaUtils.dprint('bye!')
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, signal_handler)
+    with measure_startup('config'):
+        capture, output_plugins = config_loader.config(args)
+        capture.set_pos_msec(get_pos_msec(args))
+
+    with measure_startup('IkaEngine'):
+        engine = IkaEngine(enable_profile=args.get('profile'),
+                           profile_csv=args.get('profile_csv'),
+                           keep_alive=args.get('keep_alive'))
     engine.pause(False)
     engine.set_capture(capture)
 
@@ -92,6 +132,11 @@ if __name__ == "__main__":
         engine.enable_plugin(op)
 
     engine.close_session_at_eof = True
+
+    if startup_profiler:
+        startup_profiler.stop()
+        startup_profiler.dump()
+
     IkaUtils.dprint('IkaLog: start.')
     engine.run()
     IkaUtils.dprint('bye!')
@@ -18,6 +18,7 @@
 #  limitations under the License.
 #
 
+import concurrent.futures
 import json
 import urllib3
 
@@ -25,7 +26,7 @@ import cv2
 import numpy as np
 import umsgpack
 
-from ikalog.api import APIServer
+from ikalog.api import APIServer, samples_codec
 from ikalog.utils import Localization, IkaUtils
 
 
@@ -39,19 +40,18 @@ class APIClient(object):
         http_headers = {
             'Content-Type': 'application/x-msgpack',
         }
-        mp_payload = ''.join(map(chr, umsgpack.packb(payload)))
 
         try:
-            pool = urllib3.PoolManager(timeout=3.0)
-            req = pool.urlopen(
+            # The pool keeps the connections alive between the requests.
+            req = self._pool.urlopen(
                 'POST',
                 url_api,
                 headers=http_headers,
-                body=mp_payload,
+                body=umsgpack.packb(payload),
             )
             return json.loads(req.data.decode('utf-8'))
 
-        except urllib3.exceptions.MaxRetryError:
+        except urllib3.exceptions.HTTPError:
             fallback = self._fallback  # or .... or ...
 
             if fallback:
@@ -62,12 +62,20 @@ class APIClient(object):
         raise Exception(
             'API Error: Failed to connect to API endpoint. (No fallback)')
 
-    def recoginize_weapons(self, weapons_list):
-        payload = []
+    def _encode_image(self, img):
+        # In local mode, the server takes the image as is.
+        if self._request_func == self._local_request_func:
+            return img
+
+        if self.image_format == 'raw':
+            img = np.ascontiguousarray(img, dtype=np.uint8)
+            return {'shape': list(img.shape), 'data': img.tobytes()}
 
-        for img_weapon in weapons_list:
-            result, img_weapon_png = cv2.imencode('.png', img_weapon)
-            payload.append(img_weapon_png.tostring())
+        result, img_png = cv2.imencode('.png', img)
+        return img_png.tobytes()
+
+    def recoginize_weapons(self, weapons_list):
+        payload = [self._encode_image(img) for img in weapons_list]
 
         response = self._request_func(
             '/api/v1/recoginizer/weapon',
@@ -86,11 +94,7 @@ class APIClient(object):
         return ret
 
     def recoginize_abilities(self, abilities_list):
-        payload = []
-
-        for img_ability in abilities_list:
-            result, img_ability_png = cv2.imencode('.png', img_ability)
-            payload.append(img_ability_png.tostring())
+        payload = [self._encode_image(img) for img in abilities_list]
 
         response = self._request_func(
             '/api/v1/recoginizer/ability',
@@ -109,71 +113,115 @@ class APIClient(object):
         return ret
 
     def pack_deadly_weapons_image(self, deadly_weapons_list):
-        h = deadly_weapons_list[0].shape[0]
-        w = deadly_weapons_list[0].shape[1]
-        print('%s: %d samples, dimension = %s' %
-              (self, len(deadly_weapons_list), (w, h)))
-
-        out_orig_image = np.zeros(
-            (h * len(deadly_weapons_list), w), dtype=np.uint8)
-        out_image = np.zeros((h * len(deadly_weapons_list), w), dtype=np.uint8)
-        out_decode_image = np.zeros(
-            (h * len(deadly_weapons_list), w, 3), dtype=np.uint8)
-
-        last_image = None
-        y = 0
-        for image in deadly_weapons_list:
-            if len(image.shape) == 3:
-                image = image[:, :, 0]
-
-            if last_image is None:
-                last_image = image
-                current_image = image
-                diff_image = image
-            else:
-                current_image = image
-                diff_image = abs(last_image - current_image)
-
-            out_image[y: y + h, :] = diff_image
-            out_orig_image[y: y + h, :] = current_image
-
-            decoded_image = abs(last_image - out_image[y:y + h, :])
-            out_decode_image[y: y + h, :, 0] = decoded_image
-            out_decode_image[y: y + h, :, 1] = current_image
-
-            y = y + h
-        if 0:
-            cv2.imshow('out', out_image)
-            cv2.imshow('decoded', out_decode_image)
-            # cv2.imshow('check', abs(out_decode_image - out_orig_image))
-            cv2.waitKey()
-
-        return out_image
+        return samples_codec.pack_samples(deadly_weapons_list)
 
     def recoginize_deadly_weapons(self, deadly_weapons_list):
         if len(deadly_weapons_list) == 0:
             return None
-        images = self.pack_deadly_weapons_image(deadly_weapons_list)
-
         payload = {
             'game_language': Localization.get_game_languages()[0],
             'sample_height': deadly_weapons_list[0].shape[0],
             'sample_width': deadly_weapons_list[0].shape[1],
-            'samples': cv2.imencode('.png', images)[1].tostring()
         }
 
-        response = self._request_func(
-            '/api/v1/recoginizer/deadly_weapon',
-            payload,
-        )
+        response = None
+        if not self._legacy_deadly_weapons:
+            payload['samples'] = samples_codec.encode_samples(
+                deadly_weapons_list)
+            response = self._request_func(
+                '/api/v2/recoginizer/deadly_weapon',
+                payload,
+            )
+
+            # The server is older than the XOR codec.
+            description = (response or {}).get('description') or ''
+            if description.startswith('Invalid API Path'):
+                IkaUtils.dprint(
+                    '%s: Using the legacy format for deadly weapons' % self)
+                self._legacy_deadly_weapons = True
+
+        if self._legacy_deadly_weapons:
+            payload['samples'] = samples_codec.encode_samples_legacy(
+                deadly_weapons_list)
+            response = self._request_func(
+                '/api/v1/recoginizer/deadly_weapon',
+                payload,
+            )
 
         if response.get('status', None) != 'ok':
             return {'status': 'error'}
 
         return response
 
-    def __init__(self, base_uri=None, local_mode=False, fallback=True):
+    # Asynchronous requests
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._max_workers)
+        return self._executor
+
+    def recoginize_weapons_async(self, weapons_list):
+        """
+        Returns:
+            concurrent.futures.Future of recoginize_weapons().
+        """
+        return self._get_executor().submit(
+            self.recoginize_weapons, weapons_list)
+
+    def recoginize_abilities_async(self, abilities_list):
+        """
+        Returns:
+            concurrent.futures.Future of recoginize_abilities().
+        """
+        return self._get_executor().submit(
+            self.recoginize_abilities, abilities_list)
+
+    def recoginize_weapons_and_abilities(self, weapons_list, abilities_list):
+        """
+        Send the weapon and ability requests of a result screen in
+        parallel.
+
+        Returns:
+            (weapons, abilities)
+        """
+        future_weapons = self.recoginize_weapons_async(weapons_list)
+        future_abilities = self.recoginize_abilities_async(abilities_list)
+        return future_weapons.result(), future_abilities.result()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._pool is not None:
+            self._pool.clear()
+
+    def __init__(self, base_uri=None, local_mode=False, fallback=True,
+                 timeout=3.0, retries=1, max_connections=4,
+                 image_format='png', max_workers=2):
+        """
+        Constructor
+
+        Args:
+            base_uri: URI of the API server, e.g. 'http://localhost:8000'.
+            local_mode: Recognize in this process, instead of the server.
+            fallback: Fall back to local mode if the server failed.
+            timeout: Timeout (in sec) to connect and to read.
+            retries: Number of retries on connection/read errors.
+            max_connections: Connections kept alive to the server.
+            image_format: 'png', or 'raw' to send the images without
+                compression (larger requests, no encoding; for LAN).
+            max_workers: Number of the asynchronous requests at once.
+        """
+        assert image_format in ('png', 'raw')
+
         self._server = APIServer()
+        self._pool = None
+        self._executor = None
+        self._max_workers = max_workers
+        self.image_format = image_format
+        # True if the server doesn't support the XOR codec.
+        self._legacy_deadly_weapons = False
 
         if local_mode:
             self._request_func = self._local_request_func
@@ -182,6 +230,20 @@ class APIClient(object):
             self._request_func = self._http_request_func
             self.base_uri = base_uri
             self._fallback = fallback
+            # The API is idempotent, so POST requests are retried too.
+            try:
+                retry = urllib3.Retry(
+                    total=retries, allowed_methods=None, backoff_factor=0.1)
+            except TypeError:
+                # urllib3 < 1.26
+                retry = urllib3.Retry(
+                    total=retries, method_whitelist=None, backoff_factor=0.1)
+
+            self._pool = urllib3.PoolManager(
+                maxsize=max_connections,
+                timeout=urllib3.Timeout(connect=timeout, read=timeout),
+                retries=retry,
+            )
 
 if __name__ == "__main__":
 
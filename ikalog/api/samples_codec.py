@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  Codec of the image samples sent to the API in one request (e.g. the
+#  deadly weapon crops of a death screen).
+#
+#  The samples are stacked along axis 0, and each sample is XORed with
+#  the previous one. The samples of a death are mostly the same, so the
+#  packed image is mostly zero and compresses well as a single PNG.
+#
+#  The legacy format (/api/v1/recoginizer/deadly_weapon) has the first
+#  sample, and then (first - sample) of each sample in uint8 (i.e.
+#  modulo 256). Clients use it for the servers without the XOR codec.
+
+import cv2
+import numpy as np
+
+
+def _to_gray(img):
+    # The samples are binary images; use the first channel.
+    return img[:, :, 0] if len(img.shape) == 3 else img
+
+
+def pack_samples(samples):
+    """
+    Pack the samples into an image.
+
+    Args:
+        samples: List of the samples of the same size.
+    Returns:
+        The packed image ((height * number of samples) x width, uint8).
+    """
+    stack = np.stack([_to_gray(img) for img in samples]).astype(
+        np.uint8, copy=False)
+    packed = stack.copy()
+    np.bitwise_xor(stack[1:], stack[:-1], out=packed[1:])
+    return packed.reshape((-1, stack.shape[2]))
+
+
+def unpack_samples(packed, sample_height):
+    """
+    Unpack the image made by pack_samples().
+
+    Returns:
+        The samples (number of samples x height x width, uint8).
+    """
+    stack = packed.reshape((-1, sample_height, packed.shape[1]))
+    samples = stack.copy()
+    # np.bitwise_xor.accumulate(stack, axis=0) is much slower than XORing
+    # a whole sample at a time.
+    for i in range(1, len(samples)):
+        np.bitwise_xor(samples[i - 1], stack[i], out=samples[i])
+    return samples
+
+
+def encode_samples(samples):
+    """
+    Returns:
+        The packed samples as PNG bytes.
+    """
+    result, img_png = cv2.imencode('.png', pack_samples(samples))
+    assert result
+    return img_png.tobytes()
+
+
+def decode_samples(data, sample_height):
+    """
+    Decode the PNG bytes made by encode_samples().
+
+    Returns:
+        The samples (number of samples x height x width, uint8).
+    """
+    packed = cv2.imdecode(
+        np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    assert packed is not None
+    return unpack_samples(packed, sample_height)
+
+
+def pack_samples_legacy(samples):
+    """
+    Pack the samples into an image in the legacy format.
+    """
+    stack = np.stack([_to_gray(img) for img in samples]).astype(
+        np.uint8, copy=False)
+    packed = stack.copy()
+    np.subtract(stack[0], stack[1:], out=packed[1:])
+    return packed.reshape((-1, stack.shape[2]))
+
+
+def unpack_samples_legacy(packed, sample_height):
+    """
+    Unpack the image made by pack_samples_legacy().
+
+    Returns:
+        The samples (number of samples x height x width, uint8).
+    """
+    stack = packed.reshape((-1, sample_height, packed.shape[1]))
+    samples = stack.copy()
+    np.subtract(stack[0], stack[1:], out=samples[1:])
+    return samples
+
+
+def encode_samples_legacy(samples):
+    """
+    Returns:
+        The samples packed in the legacy format as PNG bytes.
+    """
+    result, img_png = cv2.imencode('.png', pack_samples_legacy(samples))
+    assert result
+    return img_png.tobytes()
+
+
+def decode_samples_legacy(data, sample_height):
+    """
+    Decode the PNG bytes made by encode_samples_legacy().
+
+    Returns:
+        The samples (number of samples x height x width, uint8).
+    """
+    packed = cv2.imdecode(
+        np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    assert packed is not None
+    return unpack_samples_legacy(packed, sample_height)
@@ -18,78 +18,334 @@
 #  limitations under the License.
 #
 
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+import argparse
+import collections
+from http.server import HTTPServer, BaseHTTPRequestHandler
 import json
 import logging
+from socketserver import ThreadingMixIn
+import threading
 import time
+import traceback
 
 import ikalog.constants
+from ikalog.api import samples_codec
 from ikalog.utils import *
 from ikalog.utils.character_recoginizer import DeadlyWeaponRecoginizer
 from ikalog.utils.neuralnet.weapon import WeaponClassifier
+from ikalog.utils.profiler import TimingHistogram
 import cv2
 import numpy as np
 import umsgpack
 
-weapons = WeaponClassifier()
-weapons.load_model_from_file()
-
-abilities = GearPowerRecoginizer()
-abilities.load_model_from_file()
-abilities.knn_train()
+# The models are loaded on the first request, not at import, as the
+# scenes import this module even if they don't use the API.
+_weapons = None
+_abilities = None
+_deadly_weapons_lang = None
+_models_lock = threading.Lock()
+# DeadlyWeaponRecoginizer is a singleton, so only one language is loaded
+# at a time. Held while the recognizer is in use.
+_deadly_weapons_lock = threading.Lock()
+
+
+def get_weapon_classifier():
+    global _weapons
+    with _models_lock:
+        if _weapons is None:
+            weapons = WeaponClassifier()
+            weapons.load_model_from_file()
+            _weapons = weapons
+    return _weapons
+
+
+def get_gearpower_recoginizer():
+    global _abilities
+    with _models_lock:
+        if _abilities is None:
+            abilities = GearPowerRecoginizer()
+            abilities.load_model_from_file()
+            abilities.knn_train()
+            _abilities = abilities
+    return _abilities
+
+
+def get_deadly_weapon_recoginizer(lang):
+    """
+    Return DeadlyWeaponRecoginizer with the model of the language.
+    The caller must hold _deadly_weapons_lock.
+    """
+    global _deadly_weapons_lang
+    recoginizer = DeadlyWeaponRecoginizer()
+    if _deadly_weapons_lang != lang:
+        recoginizer.load_model_from_file(
+            IkaUtils.get_path('data', 'deadly_weapons.%s.model' % lang))
+        recoginizer.train()
+        _deadly_weapons_lang = lang
+    return recoginizer
+
+
+class _BatchRequest(object):
+
+    def __init__(self, items):
+        self.items = items
+        self.results = None
+        self.exception = None
+        self.time_enqueue = time.time()
+        self.event = threading.Event()
+
+
+class MicroBatcher(object):
+    """
+    Coalesces the requests from concurrent threads into batches.
+
+    Each predict() call queues its items and blocks. The worker thread
+    takes the queued requests (waiting up to max_wait for more, unless
+    the batch is full), calls batch_func() once for all of their items,
+    and returns each request its part of the results.
+    """
+
+    def predict(self, items):
+        """
+        Args:
+            items: List of the items (e.g. images).
+        Returns:
+            List of the results of batch_func(), for the items.
+        Raises:
+            RuntimeError: The batcher is stopped.
+        """
+        if len(items) == 0:
+            return []
+
+        request = _BatchRequest(items)
+        with self._cond:
+            if self._stop:
+                raise RuntimeError('%s: stopped' % self)
+            self._queue.append(request)
+            self._queue_items += len(items)
+            self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+            self._cond.notify()
+
+        request.event.wait()
+        if request.exception is not None:
+            raise request.exception
+        return request.results
+
+    def _next_batch(self):
+        with self._cond:
+            while (not self._queue) and (not self._stop):
+                self._cond.wait()
+            if not self._queue:
+                return None
+
+            # Wait a little for the other clients, unless the batch is full.
+            deadline = time.time() + self.max_wait
+            while (self._queue_items < self.max_batch_size) and \
+                    (not self._stop):
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                self._cond.wait(timeout)
+
+            batch = []
+            num_items = 0
+            while self._queue:
+                request = self._queue[0]
+                if batch and \
+                        (num_items + len(request.items) > self.max_batch_size):
+                    break
+                batch.append(self._queue.popleft())
+                num_items += len(request.items)
+            self._queue_items -= num_items
+            return batch
+
+    def _run_batch(self, batch):
+        items = []
+        for request in batch:
+            items.extend(request.items)
+
+        t1 = time.time()
+        try:
+            results = self.batch_func(items)
+            assert len(results) == len(items)
+        except Exception as e:
+            IkaUtils.dprint('%s: batch failed' % self)
+            IkaUtils.dprint(traceback.format_exc())
+            for request in batch:
+                request.exception = e
+                request.event.set()
+            return
+        t2 = time.time()
+
+        i = 0
+        for request in batch:
+            request.results = results[i: i + len(request.items)]
+            i += len(request.items)
+            request.event.set()
+
+        with self._cond:
+            for request in batch:
+                self._latency.add(t2 - request.time_enqueue)
+            self._batch_time.add(t2 - t1)
+            self._batches += 1
+            self._requests += len(batch)
+            self._items += len(items)
+            self._batch_sizes[len(items)] = \
+                self._batch_sizes.get(len(items), 0) + 1
+
+    def _worker_func(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            self._run_batch(batch)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._worker_func, name='MicroBatcher-%s' % self.name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        # The worker drains the queue before it exits, but no worker
+        # takes the requests if it was not running.
+        with self._cond:
+            requests = list(self._queue)
+            self._queue.clear()
+            self._queue_items = 0
+        for request in requests:
+            request.exception = RuntimeError('%s: stopped' % self)
+            request.event.set()
+
+    def get_stats(self):
+        with self._cond:
+            return {
+                'queue_depth': len(self._queue),
+                'queue_items': self._queue_items,
+                'max_queue_depth': self._max_queue_depth,
+                'requests': self._requests,
+                'batches': self._batches,
+                'items': self._items,
+                'mean_batch_size':
+                    (self._items / self._batches) if self._batches else None,
+                'batch_sizes': dict(
+                    (str(k), v) for k, v in sorted(self._batch_sizes.items())),
+                'batch_time': self._batch_time.get_stats(),
+                'latency': self._latency.get_stats(),
+            }
+
+    def __init__(self, name, batch_func, max_batch_size=64, max_wait=0):
+        """
+        Constructor
+
+        Args:
+            name: The name in the metrics.
+            batch_func: Function which takes a list of items and returns
+                the list of the results.
+            max_batch_size: Max number of items in a batch. A request is
+                never split, so a larger request makes a larger batch.
+            max_wait: Time (in sec) to wait for more requests.
+        """
+        self.name = name
+        self.batch_func = batch_func
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._cond = threading.Condition()
+        self._queue = collections.deque()
+        self._queue_items = 0
+        self._stop = False
+        self._thread = None
+
+        self._max_queue_depth = 0
+        self._requests = 0
+        self._batches = 0
+        self._items = 0
+        self._batch_sizes = {}
+        self._batch_time = TimingHistogram()
+        self._latency = TimingHistogram()
+
+        self.start()
 
 
 class APIServer(object):
-
-    def _decode_deadly_weapons_image(self, payload):
-        h = payload['sample_height']
-        w = payload['sample_width']
-        img_bytes = payload['samples']
-        samples1 = cv2.imdecode(np.fromstring(img_bytes, dtype='uint8'), 1)
-        num_samples = int(samples1.shape[0] / h)
-
-        last_image = None
-        y = 0
-
-        votes = {}
-        for i in range(num_samples):
-            image = samples1[y: y + h, :]
-            if last_image is None:
-                last_image = np.array(image, dtype=np.uint8)
-                current_image = image
-            else:
-                diff_image = image
-                current_image = abs(last_image - diff_image)
-                samples1[y:y + h, :] = current_image
-
-            y = y + h
-        return samples1
+    """
+    Recognizers of the API. The models are shared by all APIServer
+    instances in the process.
+    """
+
+    def _decode_image(self, img_data):
+        if isinstance(img_data, np.ndarray):
+            # From APIClient in local mode.
+            img = img_data
+        elif isinstance(img_data, dict):
+            # Raw uint8 image: {'shape': [h, w, c], 'data': bytes}
+            img = np.frombuffer(img_data['data'], dtype=np.uint8).reshape(
+                img_data['shape'])
+        else:
+            img = cv2.imdecode(np.frombuffer(img_data, dtype='uint8'), 1)
+        assert img is not None
+
+        # Make it BGR, as cv2.imdecode(..., 1) does.
+        if len(img.shape) == 2 or img.shape[2] == 1:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        elif img.shape[2] == 4:
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        return img
+
+    def _decode_images(self, payload):
+        return [self._decode_image(img_data) for img_data in payload]
 
     def _unpack_deadly_weapons_image(self, payload):
-        image1 = self._decode_deadly_weapons_image(payload)
-        h = payload['sample_height']
-        num_samples = int(image1.shape[0] / h)
-
-        y = 0
-
-        images = []
+        """
+        Returns:
+            The samples (number of samples x height x width, gray).
+        """
+        if payload.get('encoding') == 'xor':
+            return samples_codec.decode_samples(
+                payload['samples'], payload['sample_height'])
+        return samples_codec.decode_samples_legacy(
+            payload['samples'], payload['sample_height'])
+
+    def recoginize_deadly_weapons_v2(self, payload):
+        """
+        /api/v2/recoginizer/deadly_weapon: the samples are always in the
+        XOR codec. Servers without the codec reject the path, so clients
+        never have the samples decoded in the wrong format.
+        """
+        payload = dict(payload)
+        payload['encoding'] = 'xor'
+        return self.recoginize_deadly_weapons(payload)
 
-        for i in range(num_samples):
-            images.append(image1[y: y + h, :])
-            y = y + h
+    def recoginize_deadly_weapons(self, payload):
+        samples = self._unpack_deadly_weapons_image(payload)
+        n, h, w = samples.shape
+        images = cv2.cvtColor(
+            samples.reshape((n * h, w)), cv2.COLOR_GRAY2BGR).reshape(
+            (n, h, w, 3))
 
-        return images
+        # Consecutive samples are often the same; recognize them once.
+        changed = np.ones(n, dtype=bool)
+        changed[1:] = np.any(samples[1:] != samples[:-1], axis=(1, 2))
 
-    def recoginize_deadly_weapons(self, payload):
-        h = payload['sample_height']
-        images = self._unpack_deadly_weapons_image(payload)
         lang = payload['game_language']
-        deadly_weapon_recoginizer = DeadlyWeaponRecoginizer(lang)
 
         votes = {}
-        for image in images:
-            weapon_id = deadly_weapon_recoginizer.predict(image)
-            votes[weapon_id] = votes.get(weapon_id, 0) + 1
+        with _deadly_weapons_lock:
+            deadly_weapon_recoginizer = get_deadly_weapon_recoginizer(lang)
+            weapon_id = None
+            for i in range(n):
+                if changed[i]:
+                    weapon_id = deadly_weapon_recoginizer.match(images[i])
+                votes[weapon_id] = votes.get(weapon_id, 0) + 1
 
         best_result = (None, 0)
         for weapon_id in votes.keys():
@@ -105,14 +361,27 @@ class APIServer(object):
 
         return response_payload
 
-    def recoginize_weapons(self, payload):
-        weapons_list = []
+    def _predict_weapons(self, features):
+        return get_weapon_classifier().predict_features(np.vstack(features))
+
+    def _predict_abilities(self, features):
+        return get_gearpower_recoginizer().predict_features(
+            np.vstack(features))
 
-        for img_bytes in payload:
-            img = cv2.imdecode(np.fromstring(img_bytes, dtype='uint8'), 1)
-            assert img is not None
-            weapon_id, distance = weapons.predict(img)
-            weapons_list.append({'weapon': weapon_id})
+    def recoginize_weapons(self, payload):
+        # Decode the images and extract the features in the request
+        # thread, and batch only the prediction.
+        images = self._decode_images(payload)
+        if not images:
+            results = []
+        elif self._weapons_batcher:
+            features = get_weapon_classifier().images_to_features(images)
+            results = self._weapons_batcher.predict(list(features))
+        else:
+            results = get_weapon_classifier().predict_batch(images)
+
+        weapons_list = [{'weapon': weapon_id}
+                        for weapon_id, distance in results]
 
         response_payload = {
             'status': 'ok',
@@ -122,13 +391,20 @@ class APIServer(object):
         return response_payload
 
     def recoginize_abilities(self, payload):
-        abilities_list = []
-        for img_bytes in payload:
-            img = cv2.imdecode(np.fromstring(img_bytes, dtype='uint8'), 1)
-            assert img is not None
-            result, distance = abilities.predict(img)
-
-            abilities_list.append({'ability': result, 'distance': distance})
+        images = self._decode_images(payload)
+        abilities = get_gearpower_recoginizer()
+        if (not images) or (not abilities.trained):
+            results = abilities.predict_batch(images)
+        elif self._abilities_batcher:
+            features = abilities.extract_features_batch(images)
+            results = self._abilities_batcher.predict(list(features))
+        else:
+            results = abilities.predict_batch(images)
+
+        abilities_list = [
+            {'ability': result,
+             'distance': None if distance is None else float(distance)}
+            for result, distance in results]
 
         response_payload = {
             'status': 'ok',
@@ -142,53 +418,195 @@ class APIServer(object):
             '/api/v1/recoginizer/ability': self.recoginize_abilities,
             '/api/v1/recoginizer/weapon': self.recoginize_weapons,
             '/api/v1/recoginizer/deadly_weapon': self.recoginize_deadly_weapons,
+            '/api/v2/recoginizer/deadly_weapon':
+                self.recoginize_deadly_weapons_v2,
         }.get(path, None)
 
         if handler is None:
             return {'status': 'error', 'description': 'Invalid API Path %s' % path}
 
+        t1 = time.time()
         try:
             response_payload = handler(payload)
         except:
-            return {'status': 'error', 'description': 'Exception', 'detail': traceback.format_exc()}
+            response_payload = {'status': 'error', 'description': 'Exception', 'detail': traceback.format_exc()}
+        t2 = time.time()
+
+        with self._metrics_lock:
+            histogram = self._request_time.get(path)
+            if histogram is None:
+                histogram = TimingHistogram()
+                self._request_time[path] = histogram
+            histogram.add(t2 - t1)
+            if response_payload.get('status') != 'ok':
+                self._errors[path] = self._errors.get(path, 0) + 1
 
         return response_payload
 
+    def get_metrics(self):
+        with self._metrics_lock:
+            requests = dict(
+                (path, dict(histogram.get_stats(),
+                            errors=self._errors.get(path, 0)))
+                for path, histogram in self._request_time.items())
+
+        batchers = {}
+        for batcher in (self._weapons_batcher, self._abilities_batcher):
+            if batcher:
+                batchers[batcher.name] = batcher.get_stats()
+
+        return {
+            'uptime': time.time() - self._time_start,
+            'requests': requests,
+            'batchers': batchers,
+        }
 
-class HTTPRequestHandler(SimpleHTTPRequestHandler):
-
-    def _send_response_json(self, response):
-        body = json.dumps(response)
-
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html; charset=utf-8')
+    def load_models(self):
+        """
+        Load the models now, instead of on the first request.
+        """
+        get_weapon_classifier()
+        get_gearpower_recoginizer()
+
+    def stop(self):
+        for batcher in (self._weapons_batcher, self._abilities_batcher):
+            if batcher:
+                batcher.stop()
+
+    def __init__(self, batching=False, max_batch_size=64, max_wait=0):
+        """
+        Constructor
+
+        Args:
+            batching: Coalesce the weapon/ability requests from concurrent
+                threads into batches (see MicroBatcher).
+            max_batch_size: Max number of images in a batch.
+            max_wait: Time (in sec) to wait for more requests.
+        """
+        self._weapons_batcher = None
+        self._abilities_batcher = None
+        if batching:
+            self._weapons_batcher = MicroBatcher(
+                'weapon', self._predict_weapons,
+                max_batch_size=max_batch_size, max_wait=max_wait)
+            self._abilities_batcher = MicroBatcher(
+                'ability', self._predict_abilities,
+                max_batch_size=max_batch_size, max_wait=max_wait)
+
+        self._metrics_lock = threading.Lock()
+        self._request_time = {}
+        self._errors = {}
+        self._time_start = time.time()
+
+
+class HTTPRequestHandler(BaseHTTPRequestHandler):
+
+    # Keep the connections alive. Every response has Content-Length.
+    protocol_version = 'HTTP/1.1'
+    # The headers and the body are sent separately. With Nagle's
+    # algorithm, the body of a kept-alive connection waits for the
+    # delayed ACK (40ms).
+    disable_nagle_algorithm = True
+
+    def _get_api_server(self):
+        api_server = getattr(self.server, 'api_server', None)
+        if api_server is None:
+            api_server = APIServer()
+            self.server.api_server = api_server
+        return api_server
+
+    def _send_response_json(self, response, code=200):
+        body = bytearray(json.dumps(response), 'utf-8')
+
+        self.send_response(code)
+        self.send_header('Content-type', 'application/json; charset=utf-8')
         self.send_header('Pragma', 'no-cache')
         self.send_header('Content-length', len(body))
         self.end_headers()
-        self.wfile.write(bytearray(body, 'utf-8'))
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._send_response_json(self._get_api_server().get_metrics())
+            return
+
+        self._send_response_json(
+            {'status': 'error', 'description': 'Invalid API Path %s' % self.path},
+            code=404)
 
     def do_POST(self):
-        length = int(self.headers.get('content-length'))
+        length = int(self.headers.get('content-length', 0))
         data = self.rfile.read(length)
 
         # FIXME: support both of msgpack and JSON format.
-        payload = umsgpack.unpackb(data)
+        try:
+            payload = umsgpack.unpackb(data)
+        except Exception:
+            self._send_response_json(
+                {'status': 'error', 'description': 'Invalid payload'},
+                code=400)
+            return
 
-        # FixMe: catch expcetion.
-        response = self.api_server.process_request(self.path, payload)
+        response = self._get_api_server().process_request(self.path, payload)
 
         self._send_response_json(response)
 
         if hasattr(self, 'callback_func'):
             self.callback_func(self.path, payload, response)
 
-    def __init__(self, *args, **kwargs):
-        self.api_server = APIServer()
-        super(HTTPRequestHandler, self).__init__(*args, **kwargs)
+    def log_message(self, format, *args):
+        if getattr(self.server, 'verbose', True):
+            super(HTTPRequestHandler, self).log_message(format, *args)
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    """Handle requests in a separate thread."""
+
+    daemon_threads = True
+    # Many clients connect at once.
+    request_queue_size = 128
+    verbose = True
+
+
+def create_server(host='localhost', port=8000, batching=True,
+                  max_batch_size=64, max_wait=0, verbose=True):
+    """
+    Create the HTTP server with a shared APIServer.
+
+    Usage:
+        httpd = create_server(port=8000)
+        httpd.serve_forever()
+    """
+    httpd = ThreadedHTTPServer((host, port), HTTPRequestHandler)
+    httpd.api_server = APIServer(
+        batching=batching, max_batch_size=max_batch_size, max_wait=max_wait)
+    httpd.verbose = verbose
+    return httpd
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max_batch_size', type=int, default=64)
+    parser.add_argument('--max_wait_ms', type=float, default=0,
+                        help='time to wait for more requests to batch. '
+                        'With 0, a batch has the requests queued while '
+                        'the previous batch was running.')
+    parser.add_argument('--no_batching', action='store_true')
+    parser.add_argument('--quiet', action='store_true',
+                        help='do not log the requests')
+    return vars(parser.parse_args())
 
 if __name__ == "__main__":
-    host = 'localhost'
-    port = 8000
-    httpd = HTTPServer((host, port), HTTPRequestHandler)
-    print('serving at port', port)
+    args = get_args()
+    httpd = create_server(
+        args['host'], args['port'],
+        batching=not args['no_batching'],
+        max_batch_size=args['max_batch_size'],
+        max_wait=args['max_wait_ms'] / 1000,
+        verbose=not args['quiet'],
+    )
+    httpd.api_server.load_models()
+    print('serving at port', args['port'])
     httpd.serve_forever()
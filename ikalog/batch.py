@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Batch analysis of recorded videos.
+#
+#  Each video file is analyzed by its own IkaEngine in a worker process.
+#  Outputs which would be shared among the files (JSON and CSV logs, and
+#  stat.ink payload files) are written to temporary files by the workers,
+#  and merged in the order of the input files when all the workers
+#  finished. This applies to the logs configured in IkaConfig, too.
+#  Per-game files named after the video (__INPUT_FILE__) are merged per
+#  video, since the segments of a video are analyzed in parallel.
+#
+#  Long videos can also be split into segments of games. The first pass
+#  samples the video sparsely, looking for the timer icon and the lobby
+#  only. Then each segment is analyzed by its own worker as a video file.
+
+import collections
+import multiprocessing
+import math
+import os
+import shutil
+import signal
+import tempfile
+import time
+import traceback
+
+import cv2
+
+from ikalog import scenes
+from ikalog.engine import IkaEngine
+from ikalog.utils import IkaUtils
+from ikalog.utils import config_loader
+
+video_extensions = ['.mp4', '.avi', '.mkv', '.mov', '.m4v', '.ts', '.m2ts',
+                    '.flv', '.webm', '.wmv']
+
+
+def find_video_files(paths, extensions=None):
+    """
+    Returns the list of video files. Directories in paths are expanded
+    to the video files in them, sorted by the name.
+    """
+    extensions = extensions or video_extensions
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in sorted(names):
+                if os.path.splitext(name)[1].lower() in extensions:
+                    files.append(os.path.join(root, name))
+    return files
+
+
+def _numbered_file_names(filename):
+    """
+    Yields filename, filename-1, filename-2, ... in the same manner as
+    IkaUtils.get_file_name() for game index 0, 1, 2, ...
+    """
+    yield filename
+    base, ext = os.path.splitext(filename)
+    index = 1
+    while True:
+        yield '%s-%d%s' % (base, index, ext)
+        index += 1
+
+
+def _existing_numbered_files(filename):
+    files = []
+    for f in _numbered_file_names(filename):
+        if not os.path.exists(f):
+            break
+        files.append(f)
+    return files
+
+
+def get_video_duration_msec(filename):
+    video_capture = cv2.VideoCapture(filename)
+    try:
+        if not video_capture.isOpened():
+            return None
+        frames = video_capture.get(cv2.CAP_PROP_FRAME_COUNT)
+        fps = video_capture.get(cv2.CAP_PROP_FPS)
+        if not (frames > 0 and fps > 0):
+            return None
+        return int(frames / fps * 1000)
+    finally:
+        video_capture.release()
+
+
+class SessionScanner(IkaEngine):
+    """
+    IkaEngine with the minimum scenes to find games in a video.
+    """
+
+    def _initialize_scenes(self):
+        self.scenes = [
+            scenes.GameTimerIcon(self),
+            scenes.Lobby(self),
+        ]
+
+    def _process_sample(self, frame, msec):
+        context = self.context
+        if frame.shape[0:2] != (720, 1280):
+            frame = cv2.resize(frame, (1280, 720))
+
+        context['engine']['frame'] = frame
+        context['engine']['msec'] = msec
+        self._frame_cache.set_frame(frame)
+
+        self.process_scenes()
+        return {
+            'msec': msec,
+            'in_game': self.find_scene_object('GameTimerIcon')._matched,
+            'lobby': self.find_scene_object('Lobby')._matched,
+        }
+
+    def scan(self, filename, start_msec, end_msec, interval_msec):
+        """
+        Samples the video every interval_msec, and returns the list of
+        {'msec', 'in_game', 'lobby'}.
+        """
+        samples = []
+        video_capture = cv2.VideoCapture(filename)
+        try:
+            msec = start_msec
+            while msec < end_msec:
+                video_capture.set(cv2.CAP_PROP_POS_MSEC, msec)
+                ret, frame = video_capture.read()
+                if not ret:
+                    break
+                samples.append(self._process_sample(frame, msec))
+                msec += interval_msec
+        finally:
+            video_capture.release()
+        return samples
+
+
+def find_games(samples, max_gap_msec=15 * 1000):
+    """
+    Returns the list of (start_msec, end_msec) of games, where the timer
+    icon was seen. Gaps shorter than max_gap_msec are joined.
+    """
+    games = []
+    for sample in samples:
+        if not sample['in_game']:
+            continue
+
+        msec = sample['msec']
+        if games and (msec - games[-1][1] <= max_gap_msec):
+            games[-1][1] = msec
+        else:
+            games.append([msec, msec])
+    return [tuple(game) for game in games]
+
+
+def find_segments(samples, pre_margin_msec=20 * 1000,
+                  max_gap_msec=15 * 1000):
+    """
+    Splits the video into segments each of which has a game, and the
+    result screens following it.
+
+    The split point before a game is the last lobby seen after the
+    previous game, or pre_margin_msec before the game otherwise, so that
+    the game start screen belongs to the game. In the latter case, the
+    result screens of the previous game fall into the previous segment
+    unless the games are back to back; then the pre-roll of the next
+    game wins, and the split point is only clamped to the end of the
+    previous game.
+
+    Returns the list of (start_msec, end_msec). end_msec of the last
+    segment is None (the end of the video).
+    """
+    games = find_games(samples, max_gap_msec=max_gap_msec)
+
+    split_points = [0]
+    for i in range(1, len(games)):
+        last_game_end = games[i - 1][1]
+        game_start = games[i][0]
+
+        lobby = [s['msec'] for s in samples
+                 if s['lobby'] and (last_game_end < s['msec'] < game_start)]
+        if lobby:
+            split_point = lobby[-1]
+        else:
+            split_point = max(last_game_end, game_start - pre_margin_msec)
+        split_points.append(split_point)
+
+    segments = []
+    for i, start_msec in enumerate(split_points):
+        end_msec = split_points[i + 1] if i + 1 < len(split_points) else None
+        segments.append((start_msec, end_msec))
+    return segments
+
+
+def _scan_range(task):
+    """
+    Scans a range of a video file. Runs on worker processes.
+    """
+    scanner = SessionScanner()
+    scanner.pause(False)
+    return scanner.scan(task['file'], task['start_msec'], task['end_msec'],
+                        task['interval_msec'])
+
+
+def _worker_init():
+    # The parent process handles Ctrl-C.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _analyze_file(task):
+    """
+    Analyzes a video file with a new IkaEngine. Runs on worker processes.
+    """
+    opts = task['opts'].copy()
+    opts['input_file'] = [task['file']]
+    opts['disabled_outputs'] = task['disabled_outputs']
+    for key, filename in task['outputs'].items():
+        opts[key] = filename
+
+    result = {
+        'index': task['index'],
+        'file': task['file'],
+        'segment': task['segment'],
+        'frames': 0,
+        'time': 0.0,
+        'error': None,
+    }
+
+    t1 = time.time()
+    try:
+        capture, output_plugins = config_loader.config(opts)
+
+        start_msec, end_msec = task['segment'] or (None, None)
+        if start_msec:
+            capture.set_pos_msec(start_msec)
+        if end_msec is not None:
+            capture.set_end_pos_msec(end_msec)
+
+        engine = IkaEngine(enable_profile=opts.get('profile'))
+        engine.pause(False)
+        engine.set_capture(capture)
+
+        engine.set_plugins(output_plugins)
+        for op in output_plugins:
+            engine.enable_plugin(op)
+
+        engine.close_session_at_eof = True
+        engine.run()
+        result['frames'] = engine.get_scheduler_stats()['frames']
+    except:
+        result['error'] = traceback.format_exc()
+    result['time'] = time.time() - t1
+
+    return result
+
+
+class BatchAnalyzer(object):
+
+    # Command line options to be redirected to per-file temporary files,
+    # and merged at the end.
+    merged_outputs = ['output_json', 'output_csv', 'statink_payload']
+
+    # Output plugins (and their filename arguments) in IkaConfig, which
+    # are also redirected if configured.
+    config_outputs = {
+        'output_json': ('JSON', 'json_filename'),
+        'output_csv': ('CSV', 'csv_filename'),
+    }
+
+    # Output plugins which make no sense for many processes in parallel.
+    disabled_outputs = ['Screen', 'WebSocketServer', 'RESTAPIServer',
+                        'VideoRecorder', 'Switcher', 'PreviewDetected']
+
+    # Minimum length of the video to be scanned by a worker.
+    min_scan_range_msec = 5 * 60 * 1000
+
+    def _merge_appended_file(self, filename, task_files):
+        with open(filename, 'ab') as f_out:
+            for task_file in task_files:
+                if not os.path.exists(task_file):
+                    continue
+                with open(task_file, 'rb') as f_in:
+                    shutil.copyfileobj(f_in, f_out)
+
+    def _merge_numbered_files(self, filename, task_files):
+        # Per-game files (file, file-1, file-2, ...) of each task are
+        # renumbered sequentially in the order of the input files.
+        dest_names = _numbered_file_names(filename)
+        for task_file in task_files:
+            for f in _existing_numbered_files(task_file):
+                shutil.move(f, next(dest_names))
+
+    def _merge_outputs(self, tasks):
+        for key in self.merged_outputs:
+            filename = self._get_output_filename(key)
+            if not filename:
+                continue
+
+            task_files = [task['outputs'][key] for task in tasks]
+
+            # CSV log is appended to a file. So is JSON log unless
+            # IkaConfig says so. The plugins write them to the filename
+            # as it is.
+            if (key == 'output_csv') or \
+                    ((key == 'output_json') and self._json_append_data()):
+                self._merge_appended_file(filename, task_files)
+                continue
+
+            if '__INPUT_FILE__' not in filename:
+                self._merge_numbered_files(filename, task_files)
+                continue
+
+            # Per-game files of each video (see IkaUtils.get_file_name()).
+            # The segments of a video are merged in their order.
+            task_files_of_video = collections.OrderedDict()
+            for task in tasks:
+                task_files_of_video.setdefault(task['file'], []).append(
+                    task['outputs'][key])
+            for video_file, files in task_files_of_video.items():
+                self._merge_numbered_files(
+                    filename.replace('__INPUT_FILE__', video_file), files)
+
+    def _get_config(self):
+        try:
+            import IkaConfig
+            return IkaConfig
+        except:
+            return None
+
+    def _get_output_filename(self, key):
+        """
+        Returns the file the workers' output for the key is merged into,
+        given by the command line option, or by IkaConfig.
+        """
+        filename = self._opts.get(key)
+        if filename or (key not in self.config_outputs):
+            return filename
+
+        config = self._get_config()
+        plugin, arg = self.config_outputs[key]
+        if (config is None) or (plugin not in config.OUTPUT_PLUGINS) or \
+                (plugin in self.disabled_outputs):
+            return None
+        return (config.OUTPUT_ARGS.get(plugin) or {}).get(arg)
+
+    def _json_append_data(self):
+        config = self._get_config()
+        try:
+            return config.OUTPUT_ARGS['JSON'].get('append_data', True)
+        except:
+            return True
+
+    def _scan_sessions(self, pool, files):
+        """
+        The first pass of split mode. Returns the list of (file, segment).
+        """
+        scan_tasks = []
+        for f in files:
+            duration_msec = get_video_duration_msec(f)
+            if duration_msec is None:
+                continue
+
+            # Split the scan itself among the workers.
+            num_ranges = max(1, min(self._jobs,
+                                    duration_msec // self.min_scan_range_msec))
+            range_msec = int(math.ceil(duration_msec / num_ranges))
+            for start_msec in range(0, duration_msec, range_msec):
+                scan_tasks.append({
+                    'file': f,
+                    'start_msec': start_msec,
+                    'end_msec': min(start_msec + range_msec, duration_msec),
+                    'interval_msec': self._scan_interval_msec,
+                })
+
+        t1 = time.time()
+        samples = {}
+        for task, r in zip(scan_tasks, pool.map(_scan_range, scan_tasks)):
+            samples.setdefault(task['file'], []).extend(r)
+
+        file_segments = []
+        for f in files:
+            if not f in samples:
+                # Unknown duration. Analyze the whole file.
+                file_segments.append((f, None))
+                continue
+
+            segments = find_segments(samples[f])
+            IkaUtils.dprint('%s: %s: %d samples, %d segments' % (
+                self, f, len(samples[f]), len(segments)))
+            for segment in segments:
+                file_segments.append((f, segment))
+
+        IkaUtils.dprint('%s: scanned %d files in %.1fs' % (
+            self, len(files), time.time() - t1))
+        return file_segments
+
+    def _create_tasks(self, file_segments, tmp_dir):
+        tasks = []
+        for index, (f, segment) in enumerate(file_segments):
+            outputs = {}
+            for key in self.merged_outputs:
+                filename = self._get_output_filename(key)
+                if filename:
+                    ext = os.path.splitext(filename)[1]
+                    outputs[key] = os.path.join(
+                        tmp_dir, '%s.%d%s' % (key, index, ext))
+            tasks.append({
+                'index': index,
+                'file': f,
+                'segment': segment,
+                'opts': self._opts,
+                'outputs': outputs,
+                'disabled_outputs': self.disabled_outputs,
+            })
+        return tasks
+
+    def _report(self, results, wall_time):
+        total_frames = 0
+        for r in results:
+            total_frames += r['frames']
+            fps = r['frames'] / r['time'] if r['time'] > 0 else 0.0
+            status = 'ERROR' if r['error'] else 'OK'
+            segment = ''
+            if r['segment']:
+                segment = ' [%s - %s]' % (
+                    r['segment'][0], r['segment'][1] or 'EOF')
+            IkaUtils.dprint('%s: %s %d frames %.1fs (%.1f fps) %s%s' % (
+                self, status, r['frames'], r['time'], fps, r['file'],
+                segment))
+            if r['error']:
+                IkaUtils.dprint(r['error'])
+
+        fps = total_frames / wall_time if wall_time > 0 else 0.0
+        IkaUtils.dprint(
+            '%s: %d tasks, %d frames in %.1fs, %.1f frames/sec with %d jobs' % (
+                self, len(results), total_frames, wall_time, fps, self._jobs))
+
+    def run(self, files):
+        """
+        Analyze the files, and returns the list of results in the order
+        of the files.
+        """
+        files = find_video_files(files)
+        tmp_dir = tempfile.mkdtemp(prefix='ikalog_batch_')
+        tasks = []
+
+        t1 = time.time()
+        pool = multiprocessing.Pool(self._jobs, initializer=_worker_init,
+                                    maxtasksperchild=self._maxtasksperchild)
+        results = []
+        try:
+            if self._split_sessions:
+                file_segments = self._scan_sessions(pool, files)
+            else:
+                file_segments = [(f, None) for f in files]
+            tasks = self._create_tasks(file_segments, tmp_dir)
+            for key in self.merged_outputs:
+                filename = self._get_output_filename(key)
+                if filename:
+                    IkaUtils.dprint(
+                        '%s: %s: merging the outputs of the workers into %s' %
+                        (self, key, filename))
+
+            for r in pool.imap_unordered(_analyze_file, tasks):
+                IkaUtils.dprint('%s: finished %s (%d/%d)' % (
+                    self, r['file'], len(results) + 1, len(tasks)))
+                results.append(r)
+            pool.close()
+        except BaseException as e:
+            # Stop the workers before join(), and keep the original error.
+            if isinstance(e, KeyboardInterrupt):
+                IkaUtils.dprint('%s: interrupted' % self)
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+            results.sort(key=lambda r: r['index'])
+            self._merge_outputs(tasks)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self._report(results, time.time() - t1)
+        return results
+
+    def __init__(self, opts, jobs=None, maxtasksperchild=None,
+                 split_sessions=False, scan_interval_msec=1000):
+        """
+        Constructor
+
+        Args:
+            opts: Options as IkaLog.py command line arguments.
+            jobs: Number of worker processes. Defaults to the number of CPUs.
+            maxtasksperchild: Restart worker processes after this number of
+                files.
+            split_sessions: Split each video into segments of games, and
+                analyze them in parallel.
+            scan_interval_msec: Sampling interval to find games.
+        """
+        self._opts = opts
+        self._jobs = jobs or multiprocessing.cpu_count()
+        self._maxtasksperchild = maxtasksperchild
+        self._split_sessions = split_sessions
+        self._scan_interval_msec = scan_interval_msec
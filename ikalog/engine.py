@@ -20,14 +20,17 @@
 
 from __future__ import print_function
 
-import copy
+import collections
+
 import cv2
+import numpy as np
 import pprint
 import sys
 import time
 import traceback
 
 from ikalog.utils import *
+from ikalog.utils.plugin_executor import snapshot_event
 from . import scenes
 
 # The IkaLog core engine.
@@ -40,16 +43,42 @@ class IkaEngine:
 
     def _profile_dump_scenes(self):
         for scene in self.scenes:
-            print('%4.3fs %s' % (scene._prof_time_took, scene))
+            print('%4.3fs %s (skipped %d frames)' % (
+                scene._prof_time_took, scene, scene._prof_skipped_frames))
+
+    def _profile_dump_scheduler(self):
+        stats = self.get_scheduler_stats()
+        print('Scene scheduler: %d frames, %d scenes evaluated, %d scenes skipped' % (
+            stats['frames'], stats['evaluated'], stats['skipped']))
 
     def _profile_dump(self):
         self._profile_dump_scenes()
+        self._profile_dump_scheduler()
+
+        if self.profiler is not None:
+            self.profiler.dump()
+
+            if self._profile_csv:
+                self.profiler.dump_csv(self._profile_csv)
+                self.dprint('%s: wrote profile to %s' %
+                            (self, self._profile_csv))
+
+    def get_profile(self):
+        """
+        Return the profile as a dict, or None if profiling is disabled.
+        """
+        if self.profiler is None:
+            return None
+        return self.profiler.get_stats()
 
     def enable_profile(self):
         self._enable_profile = True
+        if self.profiler is None:
+            self.profiler = Profiler()
 
     def disble_profile(self):
         self._enable_profile = False
+        self.profiler = None
 
     # Exception Logging
 
@@ -107,36 +136,93 @@ class IkaEngine:
     def dprint(self, text):
         print(text, file=sys.stderr)
 
-    def call_plugin(self, plugin, event_name,
-                    params=None, debug=False, context=None):
-        if not context:
-            context = self.context
-
-        if hasattr(plugin, event_name):
-            if debug:
-                self.dprint('Call  %s' % plugin.__class__.__name__)
-            try:
-                if params is None:
-                    getattr(plugin, event_name)(context)
-                else:
-                    getattr(plugin, event_name)(context, params)
-            except:
-                self.dprint('%s.%s() raised a exception >>>>' %
-                            (plugin.__class__.__name__, event_name))
-                self.dprint(traceback.format_exc())
-                self.dprint('<<<<<')
-
-        elif hasattr(plugin, 'on_uncaught_event'):
+    def _call_plugin_method(self, plugin, event_name, method, uncaught,
+                            params, debug, context):
+        if uncaught:
             if debug:
                 self.dprint(
                     'call plug-in hook (on_uncaught_event, %s):' % event_name)
             try:
-                getattr(plugin, 'on_uncaught_event')(event_name, context)
+                method(event_name, context)
             except:
                 self.dprint('%s.%s() raised a exception >>>>' %
                             (plugin.__class__.__name__, event_name))
                 self.dprint(traceback.format_exc())
                 self.dprint('<<<<<')
+            return
+
+        if debug:
+            self.dprint('Call  %s' % plugin.__class__.__name__)
+
+        profiler = self.profiler
+        if profiler is not None:
+            time_enter = profiler.plugin_enter()
+        try:
+            if params is None:
+                method(context)
+            else:
+                method(context, params)
+        except:
+            self.dprint('%s.%s() raised a exception >>>>' %
+                        (plugin.__class__.__name__, event_name))
+            self.dprint(traceback.format_exc())
+            self.dprint('<<<<<')
+        finally:
+            if profiler is not None:
+                profiler.plugin_exit(
+                    plugin.__class__.__name__, event_name, time_enter)
+
+    def call_plugin(self, plugin, event_name,
+                    params=None, debug=False, context=None):
+        if not context:
+            context = self.context
+
+        if hasattr(plugin, event_name):
+            self._call_plugin_method(
+                plugin, event_name, getattr(plugin, event_name), False,
+                params, debug, context)
+
+        elif hasattr(plugin, 'on_uncaught_event'):
+            self._call_plugin_method(
+                plugin, event_name, plugin.on_uncaught_event, True,
+                params, debug, context)
+
+    def _get_dispatch_table(self, event_name):
+        """
+        Return the handlers of the event: a list of (plugin, bound method,
+        whether the method is on_uncaught_event), in the order of
+        output_plugins. Plugins without either method are not listed.
+
+        For the plugins running in PluginExecutor, the method of the game
+        events is replaced with the one which queues the event.
+        """
+        table = self._dispatch_tables.get(event_name)
+        if table is None:
+            table = []
+            is_async = PluginExecutor.is_async_event(event_name)
+            for plugin in self.output_plugins:
+                if hasattr(plugin, event_name):
+                    method, uncaught = getattr(plugin, event_name), False
+                elif hasattr(plugin, 'on_uncaught_event'):
+                    method, uncaught = plugin.on_uncaught_event, True
+                else:
+                    continue
+
+                executor = self._plugin_executors.get(id(plugin))
+                if is_async and (executor is not None):
+                    method = executor.wrap(
+                        event_name, method, uncaught, self._snapshot_event)
+                table.append((plugin, method, uncaught))
+            self._dispatch_tables[event_name] = table
+        return table
+
+    def invalidate_dispatch_tables(self):
+        """
+        Discard the dispatch tables. Call this after changing
+        output_plugins or the event handlers of the plugins, except via
+        set_plugins().
+        """
+        self._dispatch_tables = {}
 
     def call_plugins(self, event_name, params=None, debug=False, context=None):
         if not context:
@@ -145,12 +231,53 @@ class IkaEngine:
         if debug:
             self.dprint('call plug-in hook (%s):' % event_name)
 
-        for op in self.output_plugins:
-            self.call_plugin(op, event_name, params, debug, context)
+        profiler = self.profiler
+        if profiler is not None:
+            dispatch = profiler.dispatch_enter()
+
+        self._dispatch_serial += 1
+        for plugin, method, uncaught in self._get_dispatch_table(event_name):
+            self._call_plugin_method(
+                plugin, event_name, method, uncaught, params, debug, context)
+
+        if profiler is not None:
+            profiler.dispatch_exit(event_name, dispatch)
 
     def call_plugins_later(self, event_name, params=None, debug=False, context=None):
         self._event_queue.append((event_name, params, context))
 
+    # Preview
+
+    def get_preview(self, context=None):
+        """
+        Return the writable preview image for the current frame.
+
+        The preview is a copy of the frame that plugins may draw on.
+        It is prepared only on the first request in each frame, and the
+        buffer is reused across frames as long as the frame size is the same.
+        """
+        if not context:
+            context = self.context
+
+        preview = context['engine'].get('preview')
+        if preview is not None:
+            return preview
+
+        frame = context['engine'].get('frame')
+        if frame is None:
+            return None
+
+        buf = self._preview_buffer
+        if (buf is None) or (buf.shape != frame.shape) or \
+                (buf.dtype != frame.dtype):
+            buf = frame.copy()
+            self._preview_buffer = buf
+        else:
+            np.copyto(buf, frame)
+
+        context['engine']['preview'] = buf
+        return buf
+
     def read_next_frame(self, skip_frames=0):
         context = self.context
 
@@ -159,6 +286,8 @@ class IkaEngine:
         frame = self.capture.read_frame()
 
         while frame is None:
+            if self.profiler is not None:
+                self.profiler.add_dropped_frames()
             self.call_plugins('on_frame_read_failed')
             if self._stop:
                 return None, None
@@ -168,18 +297,67 @@ class IkaEngine:
         t = self.capture.get_current_timestamp()
         context['engine']['msec'] = t
         context['engine']['frame'] = frame
-        context['engine']['preview'] = copy.deepcopy(frame)
+        self._frame_cache.set_frame(frame)
+        # The preview is prepared on demand. See get_preview().
+        context['engine'].pop('preview', None)
         context['game']['offset_msec'] = IkaUtils.get_game_offset_msec(context)
 
         self.call_plugins('on_debug_read_next_frame')
 
         return frame, t
 
-    def stop(self):
+    def stop(self, timeout=10):
         if not self._stop:
+            # Deliver the queued game events before on_stop.
+            self.flush_plugin_executors(timeout)
             self.call_plugins('on_stop')
+            # Stop the worker threads once on_stop is delivered.
+            self._shutdown_plugin_executors(timeout)
         self._stop = True
 
+    # Plugin executors
+
+    def _get_profiler(self):
+        return self.profiler
+
+    def _snapshot_event(self, context, params):
+        # Copy the event once per call_plugins(), and share the copy among
+        # the executors.
+        key = (self._dispatch_serial, id(context), id(params))
+        if self._event_snapshot_key != key:
+            self._event_snapshot = snapshot_event(context, params)
+            self._event_snapshot_key = key
+        return self._event_snapshot
+
+    def _set_plugin_executors(self, plugins):
+        self._shutdown_plugin_executors()
+        for plugin in plugins:
+            if PluginExecutor.is_enabled_for(plugin):
+                self._plugin_executors[id(plugin)] = \
+                    PluginExecutor(plugin, get_profiler=self._get_profiler)
+
+    def _shutdown_plugin_executors(self, timeout=None):
+        executors = self._plugin_executors
+        self._plugin_executors = {}
+        for executor in executors.values():
+            executor.shutdown(timeout)
+
+    def flush_plugin_executors(self, timeout=None):
+        """
+        Wait until the plugins running in PluginExecutor process the
+        queued events.
+        """
+        for executor in list(self._plugin_executors.values()):
+            executor.flush(timeout)
+
+    def get_plugin_executor_stats(self):
+        """
+        Returns:
+            dict of the plugin name and PluginExecutor.get_stats().
+        """
+        return dict((executor.name, executor.get_stats())
+                    for executor in self._plugin_executors.values())
+
     def is_stopped(self):
         return self._stop
 
@@ -235,10 +413,12 @@ class IkaEngine:
                 'epoch_time': None,
                 'source_file': None,  # file path if input is a file.
                 'frame': None,
+                'frame_cache': self._frame_cache,
                 'msec': None,
                 'service': {
                     'call_plugins': self.call_plugins,
                     'call_plugins_later': self.call_plugins_later,
+                    'get_preview': self.get_preview,
                     # For backward compatibility
                     'callPlugins': self.call_plugins,
                 },
@@ -304,16 +484,91 @@ class IkaEngine:
 
             self._exception_log_append(context, scene_name, desc)
 
+    # Scene scheduler
+
+    def get_game_phase(self, context=None):
+        """
+        Return the game phase of the current frame, 'in_game' or
+        'out_of_game'. GameTimerIcon must be processed on the frame.
+        """
+        if not context:
+            context = self.context
+
+        timer_icon = self.find_scene_object('GameTimerIcon')
+        if (timer_icon is not None) and timer_icon.match(context):
+            return 'in_game'
+        return 'out_of_game'
+
+    def get_scheduler_stats(self):
+        """
+        Return counters of the scene scheduler: number of frames, and
+        number of scenes evaluated and skipped in total.
+        """
+        return self._scheduler_stats.copy()
+
+    def process_scenes(self):
+        context = self.context
+        stats = self._scheduler_stats
+        phase = None
+        skipped = 0
+
+        for scene in self.scenes:
+            if self.scene_scheduler and (scene.game_phases is not None):
+                if phase is None:
+                    phase = self.get_game_phase(context)
+
+                if (not phase in scene.game_phases) and scene.is_idle():
+                    scene.skip_frame(context)
+                    skipped += 1
+                    continue
+
+            self.process_scene(scene)
+
+        stats['frames'] += 1
+        stats['evaluated'] += len(self.scenes) - skipped
+        stats['skipped'] += skipped
+        context['engine']['scenes_skipped'] = skipped
+
+        if self.profiler is not None:
+            for scene in self.scenes:
+                if scene._prof_frame_time is not None:
+                    self.profiler.record(
+                        'scene', scene.__class__.__name__,
+                        scene._prof_frame_time)
+                    scene._prof_frame_time = None
+
     def find_scene_object(self, scene_class_name):
         for scene in self.scenes:
             if scene.__class__.__name__ == scene_class_name:
                 return scene
         return None
 
+    def _profile_frame(self, time_start, time_read):
+        profiler = self.profiler
+        profiler.record('engine', 'read_frame', time_read - time_start)
+        profiler.frame_done(time.time() - time_start)
+
+        capture = self.capture
+        dropped_frames = getattr(capture, 'dropped_frames', 0)
+        if dropped_frames > self._capture_dropped_frames:
+            profiler.add_dropped_frames(
+                dropped_frames - self._capture_dropped_frames)
+        self._capture_dropped_frames = dropped_frames
+
+        if hasattr(capture, 'get_decode_ahead_depth'):
+            profiler.set_queue_depth(
+                'decode_ahead', capture.get_decode_ahead_depth())
+
+        for executor in self._plugin_executors.values():
+            profiler.set_queue_depth(
+                'executor.%s' % executor.name, executor.get_depth())
+
     def process_frame(self):
         context = self.context
 
+        time_start = time.time()
         frame, t = self.read_next_frame()
+        time_read = time.time()
 
         if frame is None:
             return False
@@ -323,8 +578,7 @@ class IkaEngine:
 
         self.call_plugins('on_frame_read')
 
-        for scene in self.scenes:
-            self.process_scene(scene)
+        self.process_scenes()
 
         if self.session_close_wdt is not None:
             if self.session_close_wdt < context['engine']['msec']:
@@ -339,24 +593,30 @@ class IkaEngine:
         # FixMe: Since on_frame_next and on_key_press has non-standard arguments,
         # self.call_plugins() doesn't work for those.
 
-        for op in self.output_plugins:
-            if hasattr(op, 'on_frame_next'):
+        for op, method, uncaught in self._get_dispatch_table('on_frame_next'):
+            if not uncaught:
                 try:
-                    key = op.on_frame_next(context)
+                    key = method(context)
                 except:
                     pass
 
-        for op in self.output_plugins:
-            if hasattr(op, 'on_key_press'):
+        for op, method, uncaught in self._get_dispatch_table('on_key_press'):
+            if not uncaught:
                 try:
-                    op.on_key_press(context, key)
+                    method(context, key)
                 except:
                     pass
 
-        while len(self._event_queue) > 0:
-            event = self._event_queue.pop(0)
+        if self.profiler is not None:
+            self.profiler.set_queue_depth('event', len(self._event_queue))
+
+        while self._event_queue:
+            event = self._event_queue.popleft()
             self.call_plugins(event_name=event[0], params=event[1], context=event[2])
 
+        if self.profiler is not None:
+            self._profile_frame(time_start, time_read)
+
     def put_source_file(self, file_path):
         return self.capture.put_source_file(file_path)
 
@@ -411,6 +671,7 @@ class IkaEngine:
 
     def set_capture(self, capture):
         self.capture = capture
+        self._capture_dropped_frames = getattr(capture, 'dropped_frames', 0)
         self.reset_capture()
 
     def reset_capture(self):
@@ -428,6 +689,8 @@ class IkaEngine:
         self.output_plugins = [self]
         self.output_plugins.extend(self.scenes)
         self.output_plugins.extend(plugins)
+        self._set_plugin_executors(plugins)
+        self.invalidate_dispatch_tables()
         self.call_plugins('on_initialize_plugin')
 
     def enable_plugin(self, plugin):
@@ -442,6 +705,8 @@ class IkaEngine:
 
     def _initialize_scenes(self):
         self.scenes = [
+            # GameTimerIcon decides the game phase for the scene scheduler,
+            # so it must be the first.
             scenes.GameTimerIcon(self),
             scenes.GameStart(self),
             scenes.GameGoSign(self),
@@ -476,7 +741,17 @@ class IkaEngine:
         self.call_plugins('on_engine_destroy')
 
     def __init__(self, enable_profile=False, abort_at_scene_exception=False,
-                 keep_alive=False):
+                 keep_alive=False, scene_scheduler=True, profile_csv=None):
+        # Scenes refer to the profiler. See Scene._prof_time().
+        self.profiler = None
+        # event name -> handlers. See _get_dispatch_table().
+        self._dispatch_tables = {}
+        # id(plugin) -> PluginExecutor. See set_plugins().
+        self._plugin_executors = {}
+        # The copy of the last event queued to the executors.
+        self._dispatch_serial = 0
+        self._event_snapshot_key = None
+        self._event_snapshot = None
         self._initialize_scenes()
 
         self.output_plugins = [self]
@@ -485,13 +760,22 @@ class IkaEngine:
 
         self._stop = False
         self._pause = True
-        self._event_queue = []
+        self._event_queue = collections.deque()
+        self._preview_buffer = None
+        self._frame_cache = FrameCache()
 
         self.close_session_at_eof = False
-        self._enable_profile = enable_profile
+        self._enable_profile = False
+        self._profile_csv = profile_csv
+        self._capture_dropped_frames = 0
+        if enable_profile or profile_csv:
+            self.enable_profile()
         self._abort_at_scene_exception = abort_at_scene_exception
         # Whether exit on EOFError with no next inputs.
         self._keep_alive = keep_alive
+        # Whether skip scenes which cannot match in the current game phase.
+        self.scene_scheduler = scene_scheduler
+        self._scheduler_stats = {'frames': 0, 'evaluated': 0, 'skipped': 0}
 
         self.context = {}
         self.create_context()
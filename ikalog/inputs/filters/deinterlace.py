@@ -31,8 +31,8 @@ class DeinterlaceFilter(Filter):
         if not (self.enabled):
             return img
 
-        for y in range(img.shape[0])[1::2]:
-            img[y, :] = img[y - 1, :]
+        # Copy each even line to the following odd line, in place.
+        img[1::2] = img[0:img.shape[0] - 1:2]
 
         return img
 
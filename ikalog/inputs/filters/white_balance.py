@@ -18,6 +18,9 @@
 #  limitations under the License.
 #
 
+import cv2
+import numpy as np
+
 from ikalog.inputs.filters import Filter
 from ikalog.utils import *
 
@@ -46,22 +49,34 @@ class WhiteBalanceFilter(Filter):
     def execute(self, img):
         if not (self.pre_execute(img)):
             return img
-        return self.filterImage(img)
-
-    def filterImage(self, img, coffs=None):
+        return self.filterImage(img, dst=img)
+
+    def _get_lut(self, coffs):
+        # Lookup table of (value * coff) clipped at 255, for each channel.
+        coffs = tuple(coffs)
+        if self._lut_coffs != coffs:
+            values = np.arange(256, dtype=np.float32)
+            lut = np.empty((1, 256, len(coffs)), np.uint8)
+            for n in range(len(coffs)):
+                lut[0, :, n] = np.minimum(values * coffs[n], 255)
+            self._lut = lut
+            self._lut_coffs = coffs
+        return self._lut
+
+    ##
+    # filterImage(self, img, coffs=None, dst=None)
+    # @param img    the source image
+    # @param coffs  gains for each channel. Defaults to the calibrated ones.
+    # @param dst    the output image. Can be img itself.
+    # @return       the white-balanced image
+    def filterImage(self, img, coffs=None, dst=None):
         if coffs is None:
             coffs = self.coffs
 
         if coffs is None:
             return img
 
-        img_work = np.array(img, np.float32)
-
-        for n in range(len(coffs)):
-            img_work[:, :, n] = img_work[:, :, n] * coffs[n]
-            img_work[img_work > 255] = 255
-
-        return np.array(img_work, np.uint8)
+        return cv2.LUT(img, self._get_lut(coffs), dst=dst)
 
     def calibrateColor(self, capture_image):
         img_720p = cv2.resize(capture_image, (1280, 720))
@@ -94,6 +109,8 @@ class WhiteBalanceFilter(Filter):
 
     def reset(self):
         self.coffs = None
+        self._lut = None
+        self._lut_coffs = None
 
     def __init__(self, parent, debug=False):
         super().__init__(parent, debug=debug)
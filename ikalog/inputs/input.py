@@ -20,6 +20,7 @@
 
 import threading
 import os
+import queue
 import time
 
 import cv2
@@ -125,6 +126,7 @@ class VideoInput(object):
         else:
             r = self._select_device_by_name_func(name)
 
+        self._stop_decode_ahead()
         self.set_frame_rate(None)  # Default framerate
 
     ##
@@ -150,20 +152,23 @@ class VideoInput(object):
         if self.frame_skip_rt:
             tick = self.get_tick()
         elif self.fps_requested is not None:
-            tick = self.get_current_timestamp() + (1000 / self.fps_requested)
+            tick = self._get_current_timestamp_func() + (1000 / self.fps_requested)
         else:
             return
 
-        video_msec = self.get_current_timestamp()
-        skip = video_msec < tick
-        while skip:
-            frame_ = self._read_frame_func()
-
-            video_msec = self.get_current_timestamp()
-            skip = video_msec < tick
-
+        self._skip_frames_func(tick)
         return None
 
+    ##
+    # _skip_frames_func()
+    # Skips frames until the timestamp reaches |msec|. Sources which can
+    # skip frames without decoding them should override this.
+    # @param self    the object
+    # @param msec    the timestamp to skip to.
+    def _skip_frames_func(self, msec):
+        while self._get_current_timestamp_func() < msec:
+            self._read_frame_func()
+
     ##
     # read_frame(self)
     #
@@ -172,6 +177,11 @@ class VideoInput(object):
     #
     # @return Image if capture succeeded. Otherwise None.
     def read_frame(self):
+        if self._decode_ahead_frames > 0:
+            return self._read_frame_ahead()
+        return self._read_frame_sync()
+
+    def _read_frame_sync(self):
         try:
             self.lock.acquire()
             if not self.is_active():
@@ -224,6 +234,114 @@ class VideoInput(object):
         img = self._offset_filter.execute(img)
         return img
 
+    ##
+    # Decode-ahead
+    #
+    # A producer thread reads, resizes and filters frames in advance,
+    # and keeps them in a bounded queue with their timestamps, so that
+    # decoding (which releases the GIL in OpenCV) overlaps with the
+    # scene matching on the main thread.
+    #
+    # For recorded videos without realtime mode, the producer waits while
+    # the queue is full, so no frames are lost. Otherwise the oldest frame
+    # is dropped, so that read_frame() never returns stale frames.
+    #
+    # After a failed read (None or an exception), the producer pauses
+    # until the consumer asks for the next frame, so that the consumer
+    # can handle it first (e.g. open the next file on EOFError).
+
+    def _decode_ahead_thread_func(self, frame_queue, stop_event, resume_event):
+        drop_oldest = self.frame_skip_rt or (not self.cap_recorded_video)
+
+        while not stop_event.is_set():
+            try:
+                img = self._read_frame_sync()
+                item = (img, self._get_current_timestamp_func(), None)
+            except Exception as e:
+                item = (None, None, e)
+
+            failed = (item[0] is None) or (item[2] is not None)
+            if failed:
+                resume_event.clear()
+
+            while not stop_event.is_set():
+                try:
+                    frame_queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    if drop_oldest:
+                        try:
+                            frame_queue.get_nowait()
+                            self.dropped_frames += 1
+                        except queue.Empty:
+                            pass
+
+            if failed:
+                while not (stop_event.is_set() or resume_event.wait(0.1)):
+                    pass
+
+    def _start_decode_ahead(self):
+        self._decode_ahead_queue = queue.Queue(
+            maxsize=self._decode_ahead_frames)
+        self._decode_ahead_stop = threading.Event()
+        self._decode_ahead_resume = threading.Event()
+        self._decode_ahead_paused = False
+        self._decode_ahead_thread = threading.Thread(
+            target=self._decode_ahead_thread_func,
+            args=(self._decode_ahead_queue, self._decode_ahead_stop,
+                  self._decode_ahead_resume),
+            name='%s-decode-ahead' % self.__class__.__name__,
+        )
+        self._decode_ahead_thread.daemon = True
+        self._decode_ahead_thread.start()
+
+    def _stop_decode_ahead(self):
+        thread = self._decode_ahead_thread
+        if thread is None:
+            return
+
+        self._decode_ahead_stop.set()
+        thread.join()
+        self._decode_ahead_thread = None
+        self._decode_ahead_queue = None
+        self._decode_ahead_msec = None
+
+    def _read_frame_ahead(self):
+        if self._decode_ahead_thread is None:
+            self._start_decode_ahead()
+
+        # Let the producer go on, if it is waiting after a failed read.
+        if self._decode_ahead_paused:
+            self._decode_ahead_paused = False
+            self._decode_ahead_resume.set()
+
+        img, msec, e = self._decode_ahead_queue.get()
+        self._decode_ahead_paused = (img is None) or (e is not None)
+
+        if e is not None:
+            raise e
+
+        self._decode_ahead_msec = msec
+        return img
+
+    ##
+    # get_decode_ahead_depth(self)
+    # @return The number of frames decoded ahead.
+    def get_decode_ahead_depth(self):
+        frame_queue = self._decode_ahead_queue
+        if frame_queue is None:
+            return 0
+        return frame_queue.qsize()
+
+    ##
+    # set_decode_ahead(self, frames=0)
+    #
+    # Decode up to |frames| frames ahead on a separate thread.
+    # @param frames  The size of the frame queue. 0 disables decode-ahead.
+    def set_decode_ahead(self, frames=0):
+        self._stop_decode_ahead()
+        self._decode_ahead_frames = int(frames or 0)
+
     def _get_current_timestamp_func(self):
         return self.get_tick()
     ##
@@ -247,6 +365,9 @@ class VideoInput(object):
     # Get current timestamp information.
     # @return Timestamp (in msec)
     def get_current_timestamp(self):
+        if self._decode_ahead_msec is not None:
+            # The timestamp of the last frame returned by read_frame().
+            return self._decode_ahead_msec
         return self._get_current_timestamp_func()
 
     def get_epoch_time(self):
@@ -255,6 +376,10 @@ class VideoInput(object):
     def set_pos_msec(self, pos_msec):
         pass
 
+    # Sets the position to stop reading. Only inputs from a file support this.
+    def set_end_pos_msec(self, end_pos_msec):
+        pass
+
     # Returns the source file if the input is from a file. Otherwise None.
     def get_source_file(self):
         return None
@@ -307,6 +432,14 @@ class VideoInput(object):
         self.effective_lines = 720
         self.lock = threading.Lock()
 
+        self._decode_ahead_frames = 0
+        self._decode_ahead_thread = None
+        self._decode_ahead_queue = None
+        self._decode_ahead_msec = None
+
+        # Number of frames dropped to catch up with realtime.
+        self.dropped_frames = 0
+
         self.is_realtime = True
         self.reset()
         self.reset_tick()
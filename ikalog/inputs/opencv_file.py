@@ -32,6 +32,10 @@ class CVFile(VideoInput):
 
     cap_recorded_video = True
 
+    # Skip frames by seeking instead of grabbing if the destination is
+    # this far (in msec) from the current position.
+    seek_threshold_msec = 3000
+
     # override
     def _initialize_driver_func(self):
         # OpenCV File doesn't need pre-initialization.
@@ -39,6 +43,7 @@ class CVFile(VideoInput):
 
     # override
     def _cleanup_driver_func(self):
+        self._stop_decode_ahead()
         self.lock.acquire()
         try:
             if self.video_capture is not None:
@@ -85,6 +90,7 @@ class CVFile(VideoInput):
             return False
 
         self._source_file = self._file_queue.get()
+        self._stop_decode_ahead()
 
         self.lock.acquire()
         try:
@@ -115,30 +121,61 @@ class CVFile(VideoInput):
         return video_msec or self.get_tick()
 
 
+    def _check_end_pos(self):
+        if self._end_pos_msec is not None:
+            video_msec = self.video_capture.get(cv2.CAP_PROP_POS_MSEC)
+            if video_msec >= self._end_pos_msec:
+                raise EOFError()
+
     # override
     def _read_frame_func(self):
         ret, frame = self.video_capture.read()
         if not ret:
             raise EOFError()
 
+        self._check_end_pos()
+
         if self.frame_skip_rt:
             systime_msec = self.get_tick()
             video_msec = self.video_capture.get(cv2.CAP_PROP_POS_MSEC)
             assert systime_msec >= 0
 
-            skip = video_msec < systime_msec
-            while skip:
-                ret, frame_ = self.video_capture.read()
-
-                if not ret:
-                    break
-
-                frame = frame_
-                video_msec = self.video_capture.get(cv2.CAP_PROP_POS_MSEC)
-                skip = video_msec < systime_msec
+            if video_msec < systime_msec:
+                pos_frames = self.video_capture.get(cv2.CAP_PROP_POS_FRAMES)
+                try:
+                    self._skip_frames_func(systime_msec)
+                except EOFError:
+                    return frame
+                finally:
+                    skipped = self.video_capture.get(
+                        cv2.CAP_PROP_POS_FRAMES) - pos_frames - 1
+                    self.dropped_frames += max(0, int(skipped))
+
+                # Decode only the last frame.
+                ret, frame_ = self.video_capture.retrieve()
+                if ret:
+                    frame = frame_
 
         return frame
 
+    # override
+    def _skip_frames_func(self, msec):
+        # Skipped frames are grabbed but not decoded into images. If the
+        # destination is far enough, seek to it instead; the decoder
+        # starts from the nearest keyframe.
+        video_msec = self._get_current_timestamp_func()
+        if msec - video_msec >= self.seek_threshold_msec:
+            self.video_capture.set(cv2.CAP_PROP_POS_MSEC, msec)
+            # The grab loop below doesn't run if the seek reached msec.
+            self._check_end_pos()
+            video_msec = self._get_current_timestamp_func()
+
+        while video_msec < msec:
+            if not self.video_capture.grab():
+                raise EOFError()
+            self._check_end_pos()
+            video_msec = self._get_current_timestamp_func()
+
     # override
     def get_epoch_time(self):
         if self._use_file_timestamp:
@@ -162,9 +199,16 @@ class CVFile(VideoInput):
     # override
     def set_pos_msec(self, pos_msec):
         """Moves the video position to |pos_msec| in msec."""
+        self._stop_decode_ahead()
         if self.video_capture:
             self.video_capture.set(cv2.CAP_PROP_POS_MSEC, pos_msec)
 
+    # override
+    def set_end_pos_msec(self, end_pos_msec):
+        """Stops reading the video at |end_pos_msec| in msec."""
+        self._stop_decode_ahead()
+        self._end_pos_msec = end_pos_msec
+
     # override
     def get_source_file(self):
         return self._source_file
@@ -195,6 +239,7 @@ class CVFile(VideoInput):
         self._source_file = None
         self._file_queue = queue.Queue()
         self._epoch_time = None
+        self._end_pos_msec = None
         self._use_file_timestamp = True
         super(CVFile, self).__init__()
 
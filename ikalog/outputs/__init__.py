@@ -18,26 +18,80 @@
 #  limitations under the License.
 #
 
-from .console import Console
-from .csv import CSV
-from .debug import DebugLog
-from .description import Description
-from .fluentd import Fluentd
-from .hue import Hue
-from .webserver.server import RESTAPIServer
-from .printjson import JSON
-from .preview import Screen
-from .preview_detected import PreviewDetected
-from .screenshot import Screenshot
-from .slack import Slack
-from .statink import StatInk
-from .switcher import Switcher
-from .twitter import Twitter
-from .videorecorder import OBS
-from .weapon_training import WeaponTraining
-from .gearpower_training import GearpowerTraining
-from .websocket_server import WebSocketServer
-from .boyomi import Boyomi
-from .mikumikumouth import MikuMikuMouth
-
-from .osx.say import Say
+import importlib
+import sys
+
+# Output plugins and the modules which define them.
+#
+# A plugin module is imported when the plugin is first loaded (e.g.
+# load_plugin('StatInk')), so only the configured plugins and their
+# dependencies (tornado, requests_oauthlib, wx, ...) are loaded.
+_plugin_modules = {
+    'Console': '.console',
+    'CSV': '.csv',
+    'DebugLog': '.debug',
+    'Description': '.description',
+    'Fluentd': '.fluentd',
+    'Hue': '.hue',
+    'RESTAPIServer': '.webserver.server',
+    'JSON': '.printjson',
+    'Screen': '.preview',
+    'PreviewDetected': '.preview_detected',
+    'Screenshot': '.screenshot',
+    'Slack': '.slack',
+    'StatInk': '.statink',
+    'Switcher': '.switcher',
+    'Twitter': '.twitter',
+    'OBS': '.videorecorder',
+    'WeaponTraining': '.weapon_training',
+    'GearpowerTraining': '.gearpower_training',
+    'WebSocketServer': '.websocket_server',
+    'Boyomi': '.boyomi',
+    'MikuMikuMouth': '.mikumikumouth',
+
+    'Say': '.osx.say',
+}
+
+__all__ = list(_plugin_modules.keys()) + ['load_plugin']
+
+
+def load_plugin(name):
+    """
+    Import the module of the output plugin.
+
+    Args:
+        name: Name of the plugin (e.g. 'StatInk').
+    Returns:
+        The plugin class.
+    """
+    plugin = globals().get(name)
+    if plugin is not None:
+        return plugin
+
+    module_name = _plugin_modules.get(name)
+    if module_name is None:
+        raise AttributeError(
+            'module %r has no attribute %r' % (__name__, name))
+
+    module = importlib.import_module(module_name, __name__)
+    plugin = getattr(module, name)
+    globals()[name] = plugin
+    return plugin
+
+
+if sys.version_info >= (3, 7):
+    # outputs.StatInk etc. import the module on the first access
+    # (PEP 562).
+    def __getattr__(name):
+        return load_plugin(name)
+
+    def __dir__():
+        return sorted(set(globals().keys()) | set(__all__))
+else:
+    # Module __getattr__ is not supported. Import all the plugins, for
+    # the scripts and IkaConfig.py which access outputs.StatInk etc.
+    # config_loader still loads only the configured ones via
+    # load_plugin(), but pays for all of them here.
+    for _name in _plugin_modules:
+        load_plugin(_name)
+    del _name
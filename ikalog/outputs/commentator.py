@@ -91,6 +91,9 @@ class Commentator(object):
     '''
     実況者基底クラス
     '''
+    # Process the game events on a worker thread. See PluginExecutor.
+    run_in_executor = True
+
     custom_read = {
         'unknown': '未知の武器',
     }
@@ -40,6 +40,9 @@ except:
 
 class CSV(object):
 
+    # Process the game events on a worker thread. See PluginExecutor.
+    run_in_executor = True
+
     def apply_ui(self):
         self.enabled = self.checkEnable.GetValue()
         self.csv_filename = self.editCsvFilename.GetValue()
@@ -32,6 +32,9 @@ except:
 
 class Fluentd(object):
 
+    # Process the game events on a worker thread. See PluginExecutor.
+    run_in_executor = True
+
     def apply_ui(self):
         self.enabled = self.checkEnable.GetValue()
         self.host = self.editHost.GetValue()
@@ -33,13 +33,22 @@ class PreviewDetected(object):
             self.rects.append(rect)
 
     def on_draw_preview(self, context):
-        if not ('preview' in context['engine']):
+        if len(self.rects) == 0:
             return
 
+        get_preview = context['engine']['service'].get('get_preview')
+        if get_preview is None:
+            return
+
+        # The engine copies the frame into the preview buffer only when
+        # someone actually draws on it.
+        preview = get_preview(context)
+        if preview is None:
+            return
 
         for rect in self.rects:
             cv2.rectangle(
-                context['engine']['preview'],
+                preview,
                 rect[0], rect[1],
                 color=(255, 255, 255),  # BGR
                 thickness=4
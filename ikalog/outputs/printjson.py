@@ -45,6 +45,9 @@ def _set(dest, dest_key, src, src_key):
 
 class JSON(object):
 
+    # Process the game events on a worker thread. See PluginExecutor.
+    run_in_executor = True
+
     def apply_ui(self):
         self.enabled = self.checkEnable.GetValue()
         self.json_filename = self.editJsonFilename.GetValue()
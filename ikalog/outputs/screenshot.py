@@ -20,6 +20,7 @@
 
 import os
 import time
+import traceback
 
 from ikalog.scenes.plaza_user_stat import *  # Fixme...
 
@@ -39,6 +40,9 @@ _ = Localization.gettext_translation('screenshot', fallback=True).gettext
 
 class Screenshot(object):
 
+    # Process the game events on a worker thread. See PluginExecutor.
+    run_in_executor = True
+
     def apply_ui(self):
         self.result_detail_enabled = self.checkResultDetailEnable.GetValue()
         self.dir = self.editDir.GetValue()
@@ -114,8 +118,24 @@ class Screenshot(object):
                                 time.localtime(IkaUtils.getTime(context)))
         destfile = os.path.join(self.dir, 'ikabattle_%s.png' % timestr)
 
-        if IkaUtils.writeScreenshot(destfile, context['engine']['frame']):
-            print(_('Saved a screenshot %s') % destfile)
+        # Encode and write the file in background.
+        future = get_image_encoder().encode_png(context['engine']['frame'])
+        future.add_done_callback(
+            lambda future: self._write_screenshot(destfile, future))
+
+    def _write_screenshot(self, destfile, future):
+        try:
+            img_png = future.result()
+            assert img_png is not None
+            with open(destfile, 'wb') as f:
+                f.write(img_png)
+        except Exception:
+            IkaUtils.dprint('Screenshot: failed to save %s' % destfile)
+            IkaUtils.dprint(traceback.format_exc())
+            return False
+
+        print(_('Saved a screenshot %s') % destfile)
+        return True
 
     def on_key_press(self, context, key):
         if not (key == 0x53 or key == 0x73):
@@ -35,6 +35,9 @@ _ = Localization.gettext_translation('slack', fallback=True).gettext
 
 class Slack(object):
 
+    # Process the game events on a worker thread. See PluginExecutor.
+    run_in_executor = True
+
     def apply_ui(self):
         self.enabled = self.checkEnable.GetValue()
         self.url = self.editURL.GetValue()
@@ -21,7 +21,6 @@
 import json
 import os
 import pprint
-import threading
 import time
 import traceback
 import uuid
@@ -32,7 +31,7 @@ import umsgpack
 
 from datetime import datetime
 from ikalog.constants import fes_rank_titles, stages, weapons, special_weapons
-from ikalog.utils.statink_uploader import UploadToStatInk
+from ikalog.utils.statink_uploader import StatInkUploader
 import ikalog.version
 from ikalog.utils import *
 from ikalog.utils.anonymizer import anonymize
@@ -62,6 +61,8 @@ class StatInk(object):
         self.anon_others = self.radio_anon_others.GetValue()
         self.anon_all = self.radio_anon_all.GetValue()
         self.api_key = self.editApiKey.GetValue()
+        if self._uploader is not None:
+            self._uploader.api_key = self.api_key
 
     def refresh_ui(self):
         self.checkEnable.SetValue(self.enabled)
@@ -117,6 +118,8 @@ class StatInk(object):
         self.anon_others = conf.get('anon_others', False)
         self.anon_all = conf.get('anon_all', False)
         self.api_key = conf.get('APIKEY', '')
+        if self._uploader is not None:
+            self._uploader.api_key = self.api_key
 
         self.refresh_ui()
         return True
@@ -216,21 +219,49 @@ class StatInk(object):
                 '%s: Failed convert weapon name %s to stas.ink value' % (self, weapon))
         return weapon_id
 
-    def encode_image(self, img):
-        result, img_png = cv2.imencode('.png', img)
+    def encode_image_async(self, img):
+        """
+        Start encoding the screenshot on the ImageEncoder.
 
-        if not result:
+        Returns:
+            Future of the PNG bytes, or None if the plugin is disabled.
+        """
+        if (not self.enabled) and (not self.dry_run):
+            return None
+        return get_image_encoder().encode_png(img)
+
+    def encode_image(self, img, future=None):
+        """
+        Returns:
+            The PNG bytes of the image. If the future from
+            encode_image_async() is given, the result of it.
+        """
+        if future is None:
+            future = get_image_encoder().encode_png(img)
+
+        try:
+            s = future.result()
+        except:
+            IkaUtils.dprint(traceback.format_exc())
+            s = None
+
+        if s is None:
             IkaUtils.dprint('%s: Failed to encode the image (%s)' %
                             (self, img.shape))
             return None
 
-        s = img_png.tostring()
-
         IkaUtils.dprint('%s: Encoded screenshot (%dx%d %d bytes)' %
                         (self, img.shape[1], img.shape[0], len(s)))
 
         return s
 
+    def _anonymize_scoreboard(self, img):
+        return anonymize(
+            img,
+            anonOthers = self.anon_others,
+            anonAll = self.anon_all,
+        )
+
     def _set_values(self, fields, dest, src):
         for field in fields:
 
@@ -391,7 +422,8 @@ class StatInk(object):
             }
 
         if self.img_gears is not None:
-            payload['image_gear'] = self.encode_image(self.img_gears)
+            payload['image_gear'] = self.encode_image(
+                self.img_gears, self._img_gears_png)
 
         # Agent Information
 
@@ -581,17 +613,19 @@ class StatInk(object):
         # Screenshots
 
         if self.img_result_detail is not None:
-            img_scoreboard = anonymize(
-                self.img_result_detail,
-                anonOthers = self.anon_others,
-                anonAll = self.anon_all,
-            )
-            payload['image_result'] = self.encode_image(img_scoreboard)
+            if self._img_result_detail_png is not None:
+                payload['image_result'] = self.encode_image(
+                    self.img_result_detail, self._img_result_detail_png)
+            else:
+                img_scoreboard = self._anonymize_scoreboard(
+                    self.img_result_detail)
+                payload['image_result'] = self.encode_image(img_scoreboard)
         else:
             IkaUtils.dprint('%s: img_result_detail is empty.' % self)
 
         if self.img_judge is not None:
-            payload['image_judge'] = self.encode_image(self.img_judge)
+            payload['image_judge'] = self.encode_image(
+                self.img_judge, self._img_judge_png)
         else:
             IkaUtils.dprint('%s: img_judge is empty.' % self)
 
@@ -630,15 +664,25 @@ class StatInk(object):
             IkaUtils.dprint('%s: Failed to write msgpack file' % self)
             IkaUtils.dprint(traceback.format_exc())
 
-    def _post_payload_worker(self, context, payload, api_key,
-                             call_plugins_later_func=None):
-        # This function runs on worker thread.
-        error, statink_response = UploadToStatInk(payload,
-                                                  api_key,
-                                                  self.url_statink_v1_battle,
-                                                  self.show_response_enabled,
-                                                  (self.dry_run == 'server'))
+    def _get_uploader(self):
+        # The uploader posts the battles left in the spool directory on
+        # start, so start it only when the plugin posts.
+        if self._uploader is None:
+            self._uploader = StatInkUploader(
+                url=self.url_statink_v1_battle,
+                spool_dir=self.spool_dir,
+                api_key=self.api_key,
+                show_response=self.show_response_enabled,
+                dry_run=(self.dry_run == 'server'),
+            )
+        # The key may be changed in the GUI. The battles are posted with
+        # the current key, including the retries.
+        self._uploader.api_key = self.api_key
+        return self._uploader
 
+    def _post_payload_done(self, context, call_plugins_later_func,
+                           error, statink_response):
+        # This function runs on worker thread.
         if not call_plugins_later_func:
             return
 
@@ -673,19 +717,18 @@ class StatInk(object):
                 'skipping POST to stat.ink.' % (self, self.payload_file))
             return
 
-        if api_key is None:
-            api_key = self.api_key
-
-        if api_key is None:
+        if (api_key is None) and (self.api_key is None):
             raise('No API key specified')
 
         copied_context = IkaUtils.copy_context(context)
         call_plugins_later_func = context['engine']['service']['call_plugins_later']
 
-        thread = threading.Thread(
-            target=self._post_payload_worker,
-            args=(copied_context, payload, api_key, call_plugins_later_func))
-        thread.start()
+        def callback(error, statink_response):
+            self._post_payload_done(copied_context, call_plugins_later_func,
+                                    error, statink_response)
+
+        # api_key None: the current key of the plugin.
+        self._get_uploader().submit(payload, api_key, callback=callback)
 
     def print_payload(self, payload):
         payload = payload.copy()
@@ -731,6 +774,9 @@ class StatInk(object):
         self.img_result_detail = None
         self.img_judge = None
         self.img_gears = None
+        self._img_result_detail_png = None
+        self._img_judge_png = None
+        self._img_gears_png = None
 
         IkaUtils.dprint('%s: Discarded screenshots' % self)
 
@@ -743,11 +789,15 @@ class StatInk(object):
         self.img_result_detail = context['game']['image_scoreboard']
         IkaUtils.dprint('%s: Gathered img_result (%s)' %
                         (self, self.img_result_detail.shape))
+        # Encode the screenshots in background, until the session ends.
+        self._img_result_detail_png = self.encode_image_async(
+            self._anonymize_scoreboard(self.img_result_detail))
 
     def on_result_judge(self, context):
         self.img_judge = context['game'].get('image_judge', None)
         IkaUtils.dprint('%s: Gathered img_judge(%s)' %
                         (self, self.img_judge.shape))
+        self._img_judge_png = self.encode_image_async(self.img_judge)
 
     def _close_game_session(self, context):
         if self._called_close_game_session:
@@ -781,6 +831,7 @@ class StatInk(object):
         self.img_gears = context['game']['image_gears']
         IkaUtils.dprint('%s: Gathered img_gears (%s)' %
                         (self, self.img_gears.shape))
+        self._img_gears_png = self.encode_image_async(self.img_gears)
 
     def on_game_session_end(self, context):
         self._close_game_session(context)
@@ -788,6 +839,17 @@ class StatInk(object):
     def on_game_session_abort(self, context):
         self._close_game_session(context)
 
+    def on_stop(self, context):
+        if self._uploader is None:
+            return
+        # Wait for the posts in flight, but not for the retries; they
+        # may take long while stat.ink is unreachable. The battles not
+        # posted are left in the spool directory, and posted on the
+        # next start.
+        self._uploader.wait_in_flight(timeout=10)
+        self._uploader.stop(timeout=5)
+        self._uploader = None
+
     def on_game_killed(self, context, params):
         self._add_event(context, {'type': 'killed'})
 
@@ -951,7 +1013,7 @@ class StatInk(object):
                  track_special_gauge=False, track_special_weapon=False,
                  anon_all = False, anon_others = False,
                  debug=False, dry_run=False, url='https://stat.ink',
-                 video_id=None, payload_file=None):
+                 video_id=None, payload_file=None, spool_dir=None):
         self.enabled = not (api_key is None)
         self.api_key = api_key
         self.dry_run = dry_run
@@ -974,6 +1036,10 @@ class StatInk(object):
         self.img_result_detail = None
         self.img_judge = None
         self.img_gears = None
+        # Futures of the encoded screenshots. See encode_image_async().
+        self._img_result_detail_png = None
+        self._img_judge_png = None
+        self._img_gears_png = None
 
 
         self.url_statink_v1_battle = '%s/api/v1/battle' % url
@@ -981,6 +1047,9 @@ class StatInk(object):
         self.video_id = video_id
         self.payload_file = payload_file
 
+        self.spool_dir = spool_dir or IkaUtils.get_path('spool', 'statink')
+        self._uploader = None
+
         # If true, it means the payload is not posted or saved.
         self._called_close_game_session = False
 
@@ -23,8 +23,6 @@
 import os
 import json
 
-import cv2
-
 from ikalog.utils import *
 
 
@@ -43,6 +41,9 @@ _ = Localization.gettext_translation('twitter', fallback=True).gettext
 
 class Twitter(object):
 
+    # Process the game events on a worker thread. See PluginExecutor.
+    run_in_executor = True
+
     # TODO
     _preset_ck = None
     _preset_cs = None
@@ -430,17 +431,24 @@ class Twitter(object):
     # Post a screenshot to Twitter
     # @param  self    The object pointer.
     # @param  img     The image to be posted.
+    # @param  future  Future of the PNG image from ImageEncoder, if any.
     # @return media   The media ID
     #
-    def post_media(self, img):
-        result, img_png = cv2.imencode('.png', img)
+    def post_media(self, img, future=None):
+        if future is None:
+            future = get_image_encoder().encode_png(img)
+
+        try:
+            img_png = future.result()
+        except:
+            img_png = None
 
-        if not result:
+        if img_png is None:
             IkaUtils.dprint('%s: Failed to encode the image (%s)' %
                             (self, img.shape))
             return None
 
-        files = { "media": img_png.tostring() }
+        files = { "media": img_png }
 
         CK = self._preset_ck if self.consumer_key_type == 'ikalog' else self.consumer_key
         CS = self._preset_cs if self.consumer_key_type == 'ikalog' else self.consumer_secret
@@ -510,6 +518,11 @@ class Twitter(object):
     #
     def on_result_detail_still(self, context):
         self.img_result_detail = context['game']['image_scoreboard']
+        # Encode the screenshot in background, until the session ends.
+        self._img_result_detail_png = None
+        if self.enabled and self.attach_image:
+            self._img_result_detail_png = \
+                get_image_encoder().encode_png(self.img_result_detail)
 
     def on_game_session_end(self, context):
         IkaUtils.dprint('%s (enabled = %s)' % (self, self.enabled))
@@ -523,7 +536,8 @@ class Twitter(object):
         s = self.get_text_game_individual_result(context)
         IkaUtils.dprint('Tweet: %s' % s)
 
-        media = self.post_media(self.img_result_detail
+        media = self.post_media(self.img_result_detail,
+                                self._img_result_detail_png
                                 ) if self.attach_image else None
 
         response = self.tweet(s, media=media)
@@ -531,6 +545,7 @@ class Twitter(object):
             IkaUtils.dprint('%s: Tweeting failed. Status code = %d' % (self, response.status_code))
 
         self.img_result_detail = None
+        self._img_result_detail_png = None
 
     ##
     # check_import
@@ -574,6 +589,7 @@ class Twitter(object):
         self.footer = footer
 
         self.img_result_detail = None
+        self._img_result_detail_png = None
 
         self.check_import()
 
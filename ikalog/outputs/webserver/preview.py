@@ -18,57 +18,241 @@
 #  limitations under the License.
 #
 
+#  MJPEG preview of the engine.
+#
+#  The engine publishes each frame to PreviewBroadcaster, and the
+#  clients (PreviewRequestHandler) wait for new frames on a condition
+#  variable. Each frame is encoded once per stream setting (width and
+#  JPEG quality), by the first client which needs it, and the encoded
+#  part is shared among the clients.
+
+import collections
 import threading
 import time
 
 import cv2
 
 
-class PreviewRequestHandler(object):
+class PreviewBroadcaster(object):
+
+    # The boundary is sent as is, for compatibility with the clients.
+    part_header = (
+        '--frame_boundary\r\n'
+        'Content-type: image/jpeg\r\n'
+        'Content-length: %d\r\n'
+        '\r\n'
+    )
+
+    def publish(self, frame):
+        """
+        Set the new frame. Called on the engine thread.
+
+        The frame must not be modified after this call.
+        """
+        with self._cond:
+            self._frame = frame
+            self._serial += 1
+            self.frames += 1
+            self._cond.notify_all()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def is_stopped(self):
+        return self._stopped
+
+    def wait_frame(self, serial, timeout=None):
+        """
+        Wait for a frame newer than the serial.
+
+        Returns:
+            The serial of the new frame, or None if stopped or timed out.
+        """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._stopped or (
+                    (self._serial != serial) and (self._frame is not None)),
+                timeout)
+            if self._stopped or (self._serial == serial):
+                return None
+            return self._serial
+
+    def _encode(self, frame, width, quality):
+        if width:
+            height = max(1, int(frame.shape[0] * width / frame.shape[1]))
+            frame = cv2.resize(frame, (width, height),
+                               interpolation=cv2.INTER_AREA)
+
+        params = []
+        if quality is not None:
+            params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+        result, jpeg = cv2.imencode('.jpg', frame, params)
+        if not result:
+            return None
+
+        jpeg = jpeg.tobytes()
+        return (self.part_header % len(jpeg)).encode('utf-8') + jpeg
+
+    def get_part(self, width=None, quality=None):
+        """
+        Return the multipart chunk (the part header and the JPEG image)
+        of the latest frame, encoded in the setting.
 
-    def __init__(self, http_handler):
-        self._http_handler = http_handler
-        self._plugin = http_handler.server.parent
+        Returns:
+            (serial, chunk). chunk is None if failed to encode.
+        """
+        with self._cond:
+            # Not upscaled. The settings larger than the frame share the
+            # frame as is.
+            frame = self._frame
+            if (width is not None) and (frame is not None) and \
+                    (width >= frame.shape[1]):
+                width = None
+            key = (width, quality)
+
+            while True:
+                serial = self._serial
+                entry = self._parts.get(key)
+                if (entry is not None) and (entry[0] == serial):
+                    self._parts.move_to_end(key)
+                    return entry
+                if key not in self._encoding:
+                    break
+                # The other client is encoding the frame.
+                self._cond.wait()
+
+            self._encoding.add(key)
+            frame = self._frame
+
+        part = None
+        try:
+            part = self._encode(frame, width, quality)
+        finally:
+            with self._cond:
+                self._encoding.discard(key)
+                self._parts[key] = (serial, part)
+                self._parts.move_to_end(key)
+                # Drop the settings no longer used.
+                while len(self._parts) > self.max_parts:
+                    self._parts.popitem(last=False)
+                self.encodes += 1
+                self._cond.notify_all()
+
+        return (serial, part)
+
+    def add_client(self):
+        with self._cond:
+            self.clients += 1
+
+    def remove_client(self):
+        with self._cond:
+            self.clients -= 1
+            if self.clients == 0:
+                # Release the frames and the images.
+                self._frame = None
+                self._parts.clear()
+
+    def get_stats(self):
+        with self._cond:
+            return {
+                'clients': self.clients,
+                'frames': self.frames,
+                'encodes': self.encodes,
+            }
+
+    def __init__(self, max_parts=8):
+        """
+        Constructor
+
+        Args:
+            max_parts: Number of the stream settings to keep the encoded
+                parts for.
+        """
+        self.max_parts = max_parts
+
+        self._cond = threading.Condition()
         self._frame = None
-        self._new_image = False
+        self._serial = 0
         self._stopped = False
+        # (width, quality) -> (serial, chunk), the recently used last.
+        self._parts = collections.OrderedDict()
+        # (width, quality) being encoded.
+        self._encoding = set()
 
-        self._http_handler.send_response(200)
-        self._http_handler.send_header(
-            'Content-type', 'multipart/x-mixed-replace; boundary=--frame_boundary')
-        self._http_handler.end_headers()
+        self.clients = 0
+        self.frames = 0
+        self.encodes = 0
 
-        self._plugin._listeners.append(self)
 
-        while not self._stopped:
-            time.sleep(0.05)
+class PreviewRequestHandler(object):
 
-            if (self._frame is None):
-                continue
+    def _get_int_param(self, payload, name, default):
+        try:
+            value = payload.get(name)
+            return default if value is None else int(value)
+        except ValueError:
+            return default
 
-            # FIXME: JPEG data should be shared among connections, for
-            # performance
-            result, jpeg = cv2.imencode('.jpg', self._frame)
-            if not result:
-                continue
+    def __init__(self, http_handler, broadcaster, payload=None,
+                 width=None, quality=None, max_fps=None):
+        """
+        Stream the preview until the client disconnects, or the
+        broadcaster stops.
 
-            jpeg_length = len(jpeg)
-            self.new_image = False
+        Args:
+            http_handler: The BaseHTTPRequestHandler.
+            broadcaster: PreviewBroadcaster.
+            payload: The query of the request. 'width', 'quality' and
+                'fps' override the defaults below.
+            width: Downscale the frames to the width (1 or more).
+            quality: JPEG quality (0-100).
+            max_fps: Max frames per second.
+        """
+        payload = payload or {}
+        width = self._get_int_param(payload, 'width', width)
+        quality = self._get_int_param(payload, 'quality', quality)
+        max_fps = self._get_int_param(payload, 'fps', max_fps)
+        # The width is also limited to the frame by the broadcaster.
+        if width is not None:
+            width = max(1, width)
+        if quality is not None:
+            quality = min(100, max(0, quality))
+        interval = (1.0 / max_fps) if max_fps else 0
 
-            self._http_handler.wfile.write(
-                '--frame_boundary\r\n'.encode('utf-8')
-            )
-            self._http_handler.send_header('Content-type', 'image/jpeg')
-            self._http_handler.send_header('Content-length', str(jpeg_length))
-            self._http_handler.end_headers()
-            self._http_handler.wfile.write(jpeg)
+        http_handler.send_response(200)
+        http_handler.send_header(
+            'Content-type', 'multipart/x-mixed-replace; boundary=--frame_boundary')
+        http_handler.end_headers()
 
-        self._plugin._listeners.remove(self)
+        broadcaster.add_client()
+        try:
+            serial = 0
+            time_next = 0
+            while True:
+                # Limit the frame rate.
+                time_wait = time_next - time.time()
+                if time_wait > 0:
+                    time.sleep(time_wait)
 
-    def on_event(self, event_name, context, params=None):
-        if event_name == 'on_show_preview':
-            self._frame = context['engine']['frame']
-            self._new_image = (self._frame is not None)
+                new_serial = broadcaster.wait_frame(serial, timeout=1.0)
+                if broadcaster.is_stopped():
+                    break
+                if new_serial is None:
+                    continue
 
-        elif event_name == 'on_stop':
-            self._stopped = True
+                time_next = time.time() + interval
+                serial, part = broadcaster.get_part(width, quality)
+                if part is None:
+                    continue
+
+                try:
+                    http_handler.wfile.write(part)
+                    http_handler.wfile.flush()
+                except (OSError, ValueError):
+                    # The client disconnected.
+                    break
+        finally:
+            broadcaster.remove_client()
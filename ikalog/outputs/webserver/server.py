@@ -23,9 +23,10 @@ from socketserver import ThreadingMixIn
 import json
 import threading
 import traceback
+import urllib.parse
 
 from ikalog.utils import *
-from .preview import PreviewRequestHandler
+from .preview import PreviewBroadcaster, PreviewRequestHandler
 
 def _get_type_name(var):
     return type(var).__name__
@@ -61,6 +62,21 @@ class APIServer(object):
                        default=_get_type_name),
             'utf-8'))
 
+    def _engine_profile(self, request_handler, payload):
+        engine = request_handler.server.ikalog_context['engine']['engine']
+        profile = engine.get_profile()
+        if profile is None:
+            profile = {'status': 'error',
+                       'description': 'Profiling is disabled (--profile)'}
+
+        request_handler.send_response(200)
+        request_handler.send_header(
+            'Content-type', 'application/json; charset=UTF-8')
+        request_handler.send_header('Pragma', 'no-cache')
+        request_handler.end_headers()
+        request_handler.wfile.write(bytearray(
+            json.dumps(profile, default=_get_type_name), 'utf-8'))
+
     def _engine_source(self, request_handler, payload):
         engine = request_handler.server.ikalog_context['engine']['engine']
         file_path = payload.get('file_path')
@@ -74,7 +90,13 @@ class APIServer(object):
         request_handler.wfile.write(bytearray(file_path, 'utf-8'))
 
     def _engine_preview(self, request_handler, payload):
-        handler = PreviewRequestHandler(request_handler)
+        plugin = request_handler.server.parent
+        handler = PreviewRequestHandler(
+            request_handler, plugin._preview, payload,
+            width=plugin.preview_width,
+            quality=plugin.preview_quality,
+            max_fps=plugin.preview_max_fps,
+        )
 
     def _engine_stop(self, request_handler, payload):
         request_handler.server.ikalog_context['engine']['engine'].stop()
@@ -86,6 +108,7 @@ class APIServer(object):
             '/api/v1/engine/context/game': self._engine_context_game,
             '/api/v1/engine/source': self._engine_source,
             '/api/v1/engine/preview': self._engine_preview,
+            '/api/v1/engine/profile': self._engine_profile,
             '/api/v1/engine/stop': self._engine_stop,
         }.get(path, None)
 
@@ -113,8 +136,13 @@ class HTTPRequestHandler(BaseHTTPRequestHandler):
         self.wfile.write(bytearray(body, 'utf-8'))
 
     def do_GET(self):
+        # The query is passed as the payload, e.g. the settings of the
+        # preview: /api/v1/engine/preview?width=640&quality=70&fps=10
+        url = urllib.parse.urlsplit(self.path)
+        payload = dict((k, v[-1]) for k, v in
+                       urllib.parse.parse_qs(url.query).items())
         response = self.api_server.process_request(
-            self, self.path, {})
+            self, url.path, payload)
 
     def do_POST(self):
         length = int(self.headers.get('content-length'))
@@ -161,12 +189,29 @@ class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
 
 class RESTAPIServer(object):
 
-    def __init__(self, enabled=False, bind_addr='127.0.0.1', port=8888):
+    def __init__(self, enabled=False, bind_addr='127.0.0.1', port=8888,
+                 preview_width=None, preview_quality=None,
+                 preview_max_fps=20):
+        """
+        Constructor
+
+        Args:
+            preview_width: Downscale the preview to the width.
+            preview_quality: JPEG quality (0-100) of the preview.
+            preview_max_fps: Max frames per second of the preview.
+
+        The clients can override the preview settings by the query, e.g.
+        /api/v1/engine/preview?width=640&quality=70&fps=10
+        """
         self._bind_addr = bind_addr
         self._port = port
-        self._listeners = []
         self._httpd = None
 
+        self.preview_width = preview_width
+        self.preview_quality = preview_quality
+        self.preview_max_fps = preview_max_fps
+        self._preview = PreviewBroadcaster()
+
         self._worker_thread = None
 
     def initialize_server(self, context):
@@ -205,9 +250,12 @@ class RESTAPIServer(object):
         if self._httpd:
             self._httpd.ikalog_context = context
 
-    def on_uncaught_event(self, event_name, context, params=None):
-        for listener in self._listeners:
-            listener.on_event(event_name, context, params)
+    def on_show_preview(self, context):
+        if self._preview.clients > 0:
+            self._preview.publish(context['engine']['frame'])
+
+    def on_stop(self, context):
+        self._preview.stop()
 
 if __name__ == "__main__":
     host = 'localhost'
@@ -29,6 +29,8 @@ from ikalog.scenes.scene import Scene
 
 class Blank(Scene):
 
+    game_phases = ['out_of_game']
+
     def reset(self):
         super(Blank, self).reset()
 
@@ -30,6 +30,8 @@ from ikalog.utils import *
 
 class Downie(StatefulScene):
 
+    game_phases = ['out_of_game']
+
     def reset(self):
         super(Downie, self).reset()
         self._last_lottery_start_msec = - 100 * 1000
@@ -27,6 +27,9 @@ from ikalog.utils.character_recoginizer import *
 
 
 class GameDead(StatefulScene):
+
+    game_phases = ['in_game']
+
     choordinates = {
         'ja': {'top': 218, 'left': 452},
         'en': {'top': 263, 'left': 432},
@@ -43,13 +46,12 @@ class GameDead(StatefulScene):
         except KeyError:
             c = self.choordinates['en']
 
-        img_weapon = context['engine']['frame'][
-            c['top']:c['top'] + 51,
-            c['left']:c['left'] + 410
-        ]
+        roi = (c['left'], c['top'], c['left'] + 410, c['top'] + 51)
+        frame_cache = get_frame_cache(context)
 
-        img_weapon_gray = cv2.cvtColor(img_weapon, cv2.COLOR_BGR2GRAY)
-        img_weapon_hsv = cv2.cvtColor(img_weapon, cv2.COLOR_BGR2HSV)
+        # Cached images are shared, so copy the one we will modify.
+        img_weapon_gray = frame_cache.gray(*roi).copy()
+        img_weapon_hsv = frame_cache.hsv(*roi)
 
         img_weapon_gray[img_weapon_hsv[:, :, 1] > 32] = 0
         ret, img_weapon_b = cv2.threshold(
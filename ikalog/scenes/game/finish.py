@@ -27,6 +27,8 @@ from ikalog.scenes.scene import Scene
 
 class GameFinish(Scene):
 
+    game_phases = ['out_of_game']
+
     def reset(self):
         super(GameFinish, self).reset()
 
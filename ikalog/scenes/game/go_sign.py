@@ -27,6 +27,8 @@ from ikalog.scenes.scene import Scene
 
 class GameGoSign(Scene):
 
+    game_phases = ['in_game']
+
     def reset(self):
         super(GameGoSign, self).reset()
 
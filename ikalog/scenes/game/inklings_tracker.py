@@ -28,6 +28,8 @@ from ikalog.utils import *
 
 class InklingsTracker(StatefulScene):
 
+    game_phases = ['in_game']
+
     meter_center = 640
     meter_width_half = 210
     meter_x1 = meter_center - meter_width_half
@@ -64,10 +66,11 @@ class InklingsTracker(StatefulScene):
     # (e.g. at the beginning of the game, and low-quality input)
     #
     def _get_vs_xpos(self, context):
-        img = self._crop_frame(context,
-                               self.meter_x1, 24 + 38, self.meter_x2, 24 + 40)
+        roi = (self.meter_x1, 24 + 38, self.meter_x2, 24 + 40)
+        img = self._crop_frame(context, *roi)
         img_w = matcher.MM_WHITE(
-            sat=(0, 8), visibility=(248, 256))(img)
+            sat=(0, 8), visibility=(248, 256))(
+                img, img_hsv=get_frame_cache(context).hsv(*roi))
 
         img_vs_hist = np.sum(img_w, axis=0)
         img_vs_x = np.extract(img_vs_hist > 128, np.arange(1024))
@@ -102,19 +105,21 @@ class InklingsTracker(StatefulScene):
         frame = context['engine']['frame']
         team = team.copy()
 
+        frame_cache = get_frame_cache(context)
+
         # Manipulate histgram array of inkling eyes.
+        roi_eye = (self.meter_x1, 24 + 16, self.meter_x2, 24 + 30)
         img_eye = matcher.MM_WHITE()(
-            self._crop_frame(context,
-                             self.meter_x1, 24 + 16, self.meter_x2, 24 + 30))
+            self._crop_frame(context, *roi_eye),
+            img_hsv=frame_cache.hsv(*roi_eye))
         img_eye_hist = np.sum(img_eye, axis=0)
 
         # Manipulate histgram array of inkling bodies.
-        img_body = self._crop_frame(
-            context, self.meter_x1, 24 + 30, self.meter_x2, 24 + 34
-        )
+        roi_body = (self.meter_x1, 24 + 30, self.meter_x2, 24 + 34)
+        img_body = self._crop_frame(context, *roi_body)
 
         white_filter = matcher.MM_WHITE(sat=(40, 255), visibility=(60, 255))
-        img_body_b = white_filter(img_body)
+        img_body_b = white_filter(img_body, img_hsv=frame_cache.hsv(*roi_body))
         img_body_hist = np.sum(img_body_b / 255, axis=0)
 
         # Mask false-positive values in img_eye_hist.
@@ -26,6 +26,8 @@ from ikalog.utils import *
 
 class GameKillCombo(Scene):
 
+    game_phases = ['in_game']
+
     def reset(self):
         super(GameKillCombo, self).reset()
         self.resetParams()
@@ -27,6 +27,8 @@ from ikalog.utils import *
 
 class GameLowInk(Scene):
 
+    game_phases = ['in_game']
+
     def reset(self):
         super(GameLowInk, self).reset()
 
@@ -29,6 +29,9 @@ from ikalog.utils import *
 
 
 class ObjectiveTracker(Scene):
+
+    game_phases = ['in_game']
+
     # 720p サイズでの値
     tower_width = 580
     tower_left = int(1280 / 2 - tower_width / 2)
@@ -47,7 +50,10 @@ class ObjectiveTracker(Scene):
         img = context['engine']['frame'][self.tower_line_top:self.tower_line_top +
                                          self.tower_line_height, self.tower_left:self.tower_left + self.tower_width]
         img2 = cv2.resize(img, (self.tower_width, 100))
-        img_hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        img_hsv = get_frame_cache(context).hsv(
+            self.tower_left, self.tower_line_top,
+            self.tower_left + self.tower_width,
+            self.tower_line_top + self.tower_line_height)
         for i in range(2):
             img2[20:40, :, i] = cv2.resize(
                 img_hsv[:, :, 0], (self.tower_width, 20))
@@ -29,6 +29,8 @@ from ikalog.scenes.scene import Scene
 
 class GameOutOfBound(Scene):
 
+    game_phases = ['out_of_game']
+
     def reset(self):
         super(GameOutOfBound, self).reset()
 
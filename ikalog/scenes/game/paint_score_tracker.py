@@ -28,6 +28,8 @@ from ikalog.utils import *
 
 class PaintScoreTracker(Scene):
 
+    game_phases = ['in_game']
+
     def match_no_cache(self, context):
         if self.is_another_scene_matched(context, 'GameTimerIcon') == False:
             return False
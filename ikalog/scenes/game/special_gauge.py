@@ -29,6 +29,8 @@ from ikalog.scenes.scene import Scene
 
 class GameSpecialGauge(Scene):
 
+    game_phases = ['in_game']
+
     def reset(self):
         super(GameSpecialGauge, self).reset()
 
@@ -40,9 +42,8 @@ class GameSpecialGauge(Scene):
 
         frame = context['engine']['frame']
 
-        img = frame[34:34+102, 1117:1117+102]
-        img_hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        img_filtered = img_hsv[:, :, 1]
+        img_hsv = get_frame_cache(context).hsv(1117, 34, 1117 + 102, 34 + 102)
+        img_filtered = img_hsv[:, :, 1].copy()
         img_filtered[img_hsv[:, :, 1] > 64] = 255
         img_filtered[img_hsv[:, :, 2] > 64] = 255
         img_filtered[img_filtered <= 64] = 0
@@ -56,7 +57,8 @@ class GameSpecialGauge(Scene):
 
         charged = False
         if value > 95:
-            img_white = matcher.MM_WHITE()(frame[34:34+102, 1117:1117+102, :])
+            img_white = matcher.MM_WHITE()(
+                frame[34:34+102, 1117:1117+102, :], img_hsv=img_hsv)
             img_white_masked = img_white & self._mask_gauge[:, :, 0]
             white_score = np.sum(img_white_masked / 255)
             charged = (white_score > 0)
@@ -56,6 +56,8 @@ from ikalog.utils.ikamatcher2.matcher import MultiClassIkaMatcher2 as MultiClass
 #
 class GameSpecialWeapon(StatefulScene):
 
+    game_phases = ['in_game']
+
     # Called per Engine's reset.
     def reset(self):
         super(GameSpecialWeapon, self).reset()
@@ -29,6 +29,8 @@ from ikalog.scenes.scene import Scene
 
 class SplatzoneTracker(Scene):
 
+    game_phases = ['in_game']
+
     def reset(self):
         super(SplatzoneTracker, self).reset()
 
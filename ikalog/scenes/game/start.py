@@ -30,6 +30,8 @@ from ikalog.utils.ikamatcher2.matcher import MultiClassIkaMatcher2 as MultiClass
 
 class GameStart(StatefulScene):
 
+    game_phases = ['out_of_game']
+
     # 720p サイズでの値
     mapname_width = 430
     mapname_left = 1280 - mapname_width
@@ -24,10 +24,13 @@ import numpy as np
 
 from ikalog.scenes.scene import Scene
 from ikalog.utils import *
+from ikalog.utils.ikamatcher2.matcher import MultiClassIkaMatcher2 as MultiClassIkaMatcher
 
 
 class Lobby(Scene):
 
+    game_phases = ['out_of_game']
+
     def match_tag_lobby(self, context):
         frame = context['engine']['frame']
 
@@ -409,5 +412,20 @@ class Lobby(Scene):
             debug=debug
         )
 
+        # Masks sharing the area and the background filter are evaluated
+        # together, once per frame.
+        self._masks = MultiClassIkaMatcher()
+        for mask in [
+            self.mask_rule, self.mask_stage,
+            self.mask_tag_rule, self.mask_tag_stage,
+            self.mask_matching, self.mask_matched,
+            self.mask_tag_matched, self.mask_tag_matching,
+            self.mask_fes_matched,
+            self.mask_private_rule, self.mask_private_stage,
+            self.mask_private_matching_alpha, self.mask_private_matching_bravo,
+            self.mask_private_matched_alpha, self.mask_private_matched_bravo,
+        ]:
+            self._masks.register(mask)
+
 if __name__ == "__main__":
     Lobby.main_func()
@@ -41,6 +41,8 @@ from ikalog.utils.player_name import *
 
 class ResultDetail(StatefulScene):
 
+    game_phases = ['out_of_game']
+
     def evaluate_image_accuracy(self, frame):
         r_win = self.mask_win.match_score(frame)[1]
         r_lose = self.mask_lose.match_score(frame)[1]
@@ -261,7 +263,7 @@ class ResultDetail(StatefulScene):
         best_match = (context['engine']['frame'], 0.0, 0, 0)
         offset_list = [0, -5, -4, -3, -2, -1, 1, 2, 3, 4, 5]
 
-        gray_frame = cv2.cvtColor(context['engine']['frame'], cv2.COLOR_BGR2GRAY)
+        gray_frame = get_frame_cache(context).gray()
         for ox in offset_list:
             for oy in offset_list:
                 filter.offset = (ox, oy)
@@ -548,7 +550,7 @@ class ResultDetail(StatefulScene):
                             player['my_kills']
                         ))
 
-    def analyze_entry(self, img_entry):
+    def _analyze_entry(self, img_entry):
         # 各プレイヤー情報のスタート左位置
         entry_left = 610
         # 各プレイヤー報の横幅
@@ -643,6 +645,9 @@ class ResultDetail(StatefulScene):
             if fes_level and ('boy' in fes_level):
                 entry['prefix_en'] = fes_level['boy']
 
+        return entry, isRankedBattle, isNawabariBattle
+
+    def _recoginize_entry_characters(self, entry, isRankedBattle, isNawabariBattle):
         if self.udemae_recoginizer and isRankedBattle:
             try:
                 entry['udemae_pre'] = self.udemae_recoginizer.match(
@@ -667,7 +672,44 @@ class ResultDetail(StatefulScene):
                 IkaUtils.dprint('Exception occured in K/D recoginization.')
                 IkaUtils.dprint(traceback.format_exc())
 
-        return entry
+    def _recoginize_entries_characters(self, analyzed_entries):
+        # Recoginize udemae and numbers of all the entries at once.
+        # Falls back to per-entry recoginition on errors.
+        try:
+            if self.udemae_recoginizer:
+                entries = [e[0] for e in analyzed_entries if e[1]]
+                udemae_list = self.udemae_recoginizer.match_many(
+                    [entry['img_score'] for entry in entries])
+                for entry, udemae in zip(entries, udemae_list):
+                    entry['udemae_pre'] = udemae.upper()
+
+            if self.number_recoginizer:
+                targets = []
+                for entry, isRankedBattle, isNawabariBattle in analyzed_entries:
+                    keys = ['rank', 'kills', 'deaths']
+                    if isNawabariBattle:
+                        keys.append('score')
+                    targets.extend([(entry, key) for key in keys])
+
+                digits = self.number_recoginizer.match_digits_many(
+                    [entry['img_%s' % key] for entry, key in targets])
+                for (entry, key), value in zip(targets, digits):
+                    entry[key] = value
+
+        except Exception:
+            IkaUtils.dprint('%s: failed to recognize the entries at once.' %
+                            self)
+            IkaUtils.dprint(traceback.format_exc())
+            for entry, isRankedBattle, isNawabariBattle in analyzed_entries:
+                for key in ('udemae_pre', 'rank', 'kills', 'deaths', 'score'):
+                    entry.pop(key, None)
+                self._recoginize_entry_characters(
+                    entry, isRankedBattle, isNawabariBattle)
+
+    def analyze_entry(self, img_entry):
+        analyzed_entry = self._analyze_entry(img_entry)
+        self._recoginize_entry_characters(*analyzed_entry)
+        return analyzed_entry[0]
 
     def extract_entries(self, context, img=None):
         if img is None:
@@ -752,9 +794,12 @@ class ResultDetail(StatefulScene):
                 cv2.imshow('b', img_entries[index])
                 cv2.waitKey(0)
 
+        analyzed_entries = \
+            [self._analyze_entry(img_entry) for img_entry in img_entries]
+        self._recoginize_entries_characters(analyzed_entries)
+
         for entry_id in range(len(img_entries)):
-            img_entry = img_entries[entry_id]
-            e = self.analyze_entry(img_entry)
+            e = analyzed_entries[entry_id][0]
 
             if e.get('rank', None) is None:
                 continue
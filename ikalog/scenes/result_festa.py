@@ -29,6 +29,8 @@ from ikalog.utils import *
 
 class ResultFesta(StatefulScene):
 
+    game_phases = ['out_of_game']
+
     def reset(self):
         super(ResultFesta, self).reset()
 
@@ -32,6 +32,8 @@ from ikalog.inputs.filters import OffsetFilter
 
 class ResultGears(StatefulScene):
 
+    game_phases = ['out_of_game']
+
     def on_result_detail_calibration(self, context, param):
         # result_detailで検出したオフセットを流用する
         IkaUtils.dprint('%s: cache offset (%d,%d)' % (self, param[0], param[1]))
@@ -28,6 +28,8 @@ from ikalog.utils import *
 
 class ResultJudge(Scene):
 
+    game_phases = ['out_of_game']
+
     def reset(self):
         super(ResultJudge, self).reset()
 
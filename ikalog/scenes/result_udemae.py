@@ -28,6 +28,8 @@ from ikalog.utils import *
 
 class ResultUdemae(StatefulScene):
 
+    game_phases = ['out_of_game']
+
     def reset(self):
         super(ResultUdemae, self).reset()
 
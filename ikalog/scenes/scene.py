@@ -27,6 +27,11 @@ from ikalog.utils import *
 
 class Scene(object):
 
+    # Game phases in which this scene can match ('in_game' and/or
+    # 'out_of_game'). IkaEngine skips idle scenes in other phases.
+    # None means the scene is evaluated on every frame.
+    game_phases = None
+
     # シーンクラスを単体で動作させるためのクラスメソッド
     @classmethod
     def main_func(cls):
@@ -67,6 +72,16 @@ class Scene(object):
     def new_frame(self, context):
         self._matched = None
 
+    # 現在のゲームフェーズではマッチしないので、解析をスキップするときに呼ばれる
+    def skip_frame(self, context):
+        '''Called instead of match() when the scene cannot match the frame.'''
+        self._matched = False
+        self._prof_skipped_frames = self._prof_skipped_frames + 1
+
+    def is_idle(self):
+        '''Returns True if the scene may be skipped by the engine.'''
+        return True
+
     # 現在のフレームにマッチしたときの処理
     def _set_matched(self, context):
         self._matched = True
@@ -91,17 +106,25 @@ class Scene(object):
     def match_no_cache(self, context):
         raise Exception('%s: _match_no_cache must be overrided' % self)
 
+    def _prof_time(self):
+        # Plugin calls from the scene are profiled by the engine's
+        # profiler, if any. Exclude them from the time of the scene.
+        profiler = getattr(self._engine, 'profiler', None)
+        if profiler is None:
+            return time.time()
+        return time.time() - profiler.plugin_time
+
     def _prof_enter(self):
-        self._prof_time_enter = time.time()
-        # FIXME: Scene profile includes plugin calls
+        self._prof_time_enter = self._prof_time()
 
     def _prof_exit(self):
         if self._prof_time_enter is None:
             IkaUtils.dprint(
                 '%s: _prof_time_enter is None at _prof_exit(). Fix me.' % self)
             return
-        duration = time.time() - self._prof_time_enter
+        duration = self._prof_time() - self._prof_time_enter
         self._prof_time_took = self._prof_time_took + duration
+        self._prof_frame_time = (self._prof_frame_time or 0.0) + duration
         self._prof_time_enter = None
 
     def match(self, context):
@@ -171,5 +194,8 @@ class Scene(object):
 
         self._prof_time_enter = False
         self._prof_time_took = 0.0
+        # Time took in the current frame, reported to the engine's profiler.
+        self._prof_frame_time = None
+        self._prof_skipped_frames = 0
 
         self.reset()
@@ -35,6 +35,10 @@ class StatefulScene(Scene):
     def match_no_cache(self, context):
         return self._state(context)
 
+    def is_idle(self):
+        # Scenes tracking something must see every frame to finish it.
+        return self._state == self._state_default
+
     def __init__(self, engine):
         super(StatefulScene, self).__init__(engine)
 
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  Startup profiler: measures the import time of each module, and the
+#  time of startup phases (loading the config, initializing the engine).
+#
+#  This module is imported before anything else (see IkaLog.py), so it
+#  must not import ikalog.utils or any third-party module.
+
+import contextlib
+import sys
+import time
+
+
+class StartupProfiler(object):
+    """
+    Import hook and timer of startup phases.
+
+    StartupProfiler is installed in sys.meta_path, and wraps the
+    exec_module() of the loader of every module imported after start().
+    """
+
+    # Import hook
+
+    def find_spec(self, fullname, path, target=None):
+        if self._finding:
+            return None
+
+        # Let the other finders find the module, and time its loader.
+        self._finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._finding = False
+
+        loader = spec.loader
+        # Built-in and frozen modules are loaded by classes.
+        if (loader is not None) and (not isinstance(loader, type)) and \
+                hasattr(loader, 'exec_module'):
+            loader.exec_module = self._wrap_exec_module(
+                fullname, loader.exec_module)
+        return spec
+
+    def _wrap_exec_module(self, fullname, exec_module):
+        def timed_exec_module(module):
+            self._stack.append(0.0)
+            t = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                duration = time.perf_counter() - t
+                children = self._stack.pop()
+                if self._stack:
+                    self._stack[-1] += duration
+                self._imports[fullname] = (duration, duration - children)
+        return timed_exec_module
+
+    # Phases
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        """
+        Measure the phase of startup.
+
+        Usage:
+            with startup_profiler.measure('config'):
+                config_loader.config(args)
+        """
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._phases.append((name, time.perf_counter() - t))
+
+    def start(self):
+        if not self in sys.meta_path:
+            sys.meta_path.insert(0, self)
+        self._time_start = time.perf_counter()
+
+    def stop(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+        self._time_stop = time.perf_counter()
+
+    def get_imports(self):
+        """
+        Returns:
+            List of (module, cumulative sec, self sec), in the descending
+            order of the cumulative time.
+        """
+        return sorted(
+            [(name, t[0], t[1]) for name, t in self._imports.items()],
+            key=lambda x: x[1], reverse=True)
+
+    def get_phases(self):
+        return list(self._phases)
+
+    def dump(self, limit=40, file=None):
+        """
+        Print the summary.
+
+        Args:
+            limit: Number of modules to print.
+            file: Output (default: stderr).
+        """
+        file = file or sys.stderr
+        time_stop = self._time_stop or time.perf_counter()
+        imports = self.get_imports()
+        import_time = sum(self_t for name, t, self_t in imports)
+
+        print('Startup profile: %.1f ms total, %d modules imported in '
+              '%.1f ms' % ((time_stop - self._time_start) * 1000,
+                           len(imports), import_time * 1000),
+              file=file)
+        for name, duration in self._phases:
+            print('  %-58s %8.1f ms' % (name, duration * 1000), file=file)
+
+        print('%-60s %8s %8s' % ('module', 'cumul', 'self'), file=file)
+        for name, duration, self_duration in imports[:limit]:
+            print('%-60s %8.1f %8.1f' % (
+                name, duration * 1000, self_duration * 1000), file=file)
+
+    def __init__(self):
+        self._finding = False
+        self._stack = []
+        self._imports = {}
+        self._phases = []
+        self._time_start = time.perf_counter()
+        self._time_stop = None
@@ -22,6 +22,11 @@ from __future__ import print_function
 from .image_loader import imread
 
 from .ikautils import IkaUtils
+from .frame_cache import FrameCache, get_frame_cache
+from .image_encoder import ImageEncoder, configure_image_encoder, \
+    get_image_encoder
+from .profiler import Profiler
+from .plugin_executor import PluginExecutor
 from .image_utils import ImageUtils
 from .matcher import IkaMatcher
 from .certifi import Certifi
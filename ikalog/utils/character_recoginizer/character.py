@@ -22,6 +22,7 @@ import cv2
 import numpy as np
 import pickle
 
+from ikalog.utils import model_file
 from ikalog.utils.character_recoginizer import *
 
 
@@ -104,17 +105,38 @@ class CharacterRecoginizer(object):
         white_mask = white_mask_s & white_mask_v
         return white_mask
 
+    def _get_model_meta(self):
+        return {}
+
+    def _set_model_meta(self, meta):
+        pass
+
     def save_model_to_file(self, file):
-        f = open(file, 'wb')
-        pickle.dump([self.samples, self.responses], f)
-        f.close()
+        # Save the samples in the format train() uses, so that the model
+        # can be used as is.
+        samples = np.array(self.samples, np.float32)
+        responses = np.array(self.responses, np.float32)
+        model_file.save_model(
+            file, {'samples': samples, 'responses': responses},
+            meta=self._get_model_meta())
 
-    def load_model_from_file(self, file):
+    def _load_legacy_model_from_file(self, file):
         f = open(file, 'rb')
         l = pickle.load(f)
         f.close()
         self.samples = l[0]
         self.responses = l[1]
+        return l
+
+    def load_model_from_file(self, file):
+        if not model_file.is_model_file(file):
+            self._load_legacy_model_from_file(file)
+            return
+
+        arrays, meta = model_file.load_model(file)
+        self.samples = arrays['samples']
+        self.responses = arrays['responses']
+        self._set_model_meta(meta)
 
     def add_sample(self, response, img):
         img = cv2.resize(
@@ -126,6 +148,9 @@ class CharacterRecoginizer(object):
         if self.samples is None:
             self.samples = np.empty((0, img.shape[0] * img.shape[1]))
             self.responses = []
+        elif not isinstance(self.responses, list):
+            # Loaded from the model file.
+            self.responses = self.responses.tolist()
 
         self.samples = np.append(self.samples, sample, 0)
 
@@ -138,10 +163,9 @@ class CharacterRecoginizer(object):
         self.responses.append(response)
 
     def train(self):
-        samples = np.array(self.samples, np.float32)
-        responses = np.array(self.responses, np.float32)
-        responses = responses.reshape((responses.size, 1))
-        responses = np.array(self.responses, np.float32)
+        # No copies if loaded from the model file.
+        samples = np.asarray(self.samples, np.float32)
+        responses = np.asarray(self.responses, np.float32)
         self.model.train(samples, cv2.ml.ROW_SAMPLE, responses)
         self.trained = True
 
@@ -157,7 +181,6 @@ class CharacterRecoginizer(object):
         # 文字と判断したところを 1 にして縦に足し算
         img_chars1 = np.sum(img_chars / 255, axis=0)  # 列毎の検出dot数
 
-        array0to1280 = np.array(range(1280), dtype=np.int32)
         #img_chars1_hist_x = np.extract(img_chars1 > 0, array0to1280[0:len(img_chars1) -1])
 
         # FixMe: 255 px まで
@@ -207,7 +230,11 @@ class CharacterRecoginizer(object):
 
         return samples
 
-    def match1(self, img):
+    def _normalize_sample(self, img):
+        """
+        Return the sample of the character for the KNN model, or None if
+        the image is almost black.
+        """
         if (img.shape[0] != self.sample_width) or (img.shape[1] != self.sample_height):
             img = cv2.resize(
                 img, (self.sample_width, self.sample_height), interpolation=cv2.INTER_NEAREST)
@@ -222,24 +249,54 @@ class CharacterRecoginizer(object):
 
         if raito < 0.1:
             # ほぼ真っ黒
-            return 0
+            return None
 
         sample = img.reshape((1, img.shape[0] * img.shape[1]))
-        sample = np.array(sample, np.float32)
+        return np.array(sample, np.float32)
+
+    def match1(self, img):
+        sample = self._normalize_sample(img)
+        if sample is None:
+            return 0
 
         k = 3
 
         retval, results, neigh_resp, dists = self.model.findNearest(sample, k)
 
-        # 学習データを集めたいときなど
-        if 0:
-            import time
-            cv2.imwrite('training/numbers/%s.%s.png' %
-                        (retval, time.time()), img)
-
         d = int(results.ravel())
         return d
 
+    def match1_many(self, images):
+        """
+        match1() for the characters, with one findNearest() call.
+
+        Args:
+            images: List of the images of characters.
+        Returns:
+            List of the responses, in the same order.
+        """
+        responses = [0] * len(images)
+
+        indexes = []
+        samples = []
+        for i, img in enumerate(images):
+            sample = self._normalize_sample(img)
+            if sample is not None:
+                indexes.append(i)
+                samples.append(sample)
+
+        if len(samples) == 0:
+            return responses
+
+        k = 3
+
+        retval, results, neigh_resp, dists = \
+            self.model.findNearest(np.vstack(samples), k)
+
+        for i, d in zip(indexes, results.ravel()):
+            responses[i] = int(d)
+        return responses
+
     def match(self, img, num_digits=None, char_width=None, char_height=None):
         if not self.trained:
             return None
@@ -258,6 +315,42 @@ class CharacterRecoginizer(object):
 
         return s
 
+    def match_many(self, images, num_digits=None, char_width=None, char_height=None):
+        """
+        match() for the images. The characters of all the images are
+        recoginized at once.
+
+        Args:
+            images: List of the images.
+            num_digits, char_width, char_height: See find_samples().
+        Returns:
+            List of the strings (or None if not trained), in the same
+            order as the images.
+        """
+        if not self.trained:
+            return [None] * len(images)
+
+        samples_list = []
+        for img in images:
+            samples_list.append(self.find_samples(
+                img,
+                num_digits=num_digits,
+                char_width=char_width,
+                char_height=char_height,
+            ))
+
+        responses = self.match1_many(
+            [sample for samples in samples_list for sample in samples])
+
+        strings = []
+        i = 0
+        for samples in samples_list:
+            strings.append(
+                ''.join(map(chr, responses[i: i + len(samples)])))
+            i += len(samples)
+
+        return strings
+
     def match_digits(self, img, num_digits=None, char_width=None, char_height=None):
         try:
             return int(self.match(img, num_digits=num_digits,
@@ -265,6 +358,21 @@ class CharacterRecoginizer(object):
         except ValueError:
             return None
 
+    def match_digits_many(self, images, num_digits=None, char_width=None, char_height=None):
+        """
+        match_digits() for the images, with match_many().
+        """
+        strings = self.match_many(images, num_digits=num_digits,
+                                  char_width=char_width, char_height=char_height)
+
+        digits = []
+        for s in strings:
+            try:
+                digits.append(int(s))
+            except ValueError:
+                digits.append(None)
+        return digits
+
     def match_float(self, img, num_digits=None, char_width=None, char_height=None):
         try:
             return float(self.match(img, num_digits=num_digits,
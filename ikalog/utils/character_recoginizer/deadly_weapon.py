@@ -112,18 +112,17 @@ class DeadlyWeaponRecoginizer(CharacterRecoginizer):
         return list
 
     # 保存項目追加のために save/load をオーバーライド
-    def save_model_to_file(self, file):
-        f = open(file, 'wb')
-        pickle.dump([self.samples, self.responses, self.name2id_table], f)
-        f.close()
-
-    def load_model_from_file(self, file):
-        f = open(file, 'rb')
-        l = pickle.load(f)
-        f.close()
-        self.samples = l[0]
-        self.responses = l[1]
+    def _get_model_meta(self):
+        return {'name2id_table': self.name2id_table}
+
+    def _set_model_meta(self, meta):
+        self.name2id_table = meta['name2id_table']
+
+    def _load_legacy_model_from_file(self, file):
+        l = super(DeadlyWeaponRecoginizer,
+                  self)._load_legacy_model_from_file(file)
         self.name2id_table = l[2]
+        return l
 
     def __new__(cls, *args, **kwargs):
 
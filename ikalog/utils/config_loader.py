@@ -26,18 +26,24 @@ except:
 
 from ikalog import inputs
 from ikalog import outputs
+from ikalog.utils.image_encoder import configure_image_encoder
 
 
-def _init_source(opts):
-    # 使いたい入力を設定
-    source = None
-
-    # Set the input type
+def _get_input_type(opts):
     input_type = (opts.get('input') or IkaConfig.INPUT_SOURCE)
     if opts.get('input_file'):
         input_type = 'CVFile'
     if not input_type:
         input_type = 'GStreamer'
+    return input_type
+
+
+def _init_source(opts):
+    # 使いたい入力を設定
+    source = None
+
+    # Set the input type
+    input_type = _get_input_type(opts)
 
     # Set the input arguments
     input_args = (IkaConfig.INPUT_ARGS.get(input_type) or {})
@@ -122,6 +128,10 @@ def _init_outputs(opts):
 
     output_plugins = IkaConfig.OUTPUT_PLUGINS
 
+    # Some plugins are not wanted in some modes (e.g. servers in batch mode).
+    disabled_outputs = opts.get('disabled_outputs') or []
+    output_plugins = [p for p in output_plugins if not p in disabled_outputs]
+
     # Set output_args with command line options.
     output_args = IkaConfig.OUTPUT_ARGS.copy()
 
@@ -134,43 +144,45 @@ def _init_outputs(opts):
     # Screen: IkaLog 実行中にキャプチャ画像を表示します。
     if 'Screen' in output_plugins:
         args = _replace_vars(output_args['Screen'], vars)
-        OutputPlugins.append(outputs.Screen(**args))
+        OutputPlugins.append(outputs.load_plugin('Screen')(**args))
 
     # Console(): 各種メッセージを表示します。
     if 'Console' in output_plugins:
         args = _replace_vars(output_args['Console'], vars)
-        OutputPlugins.append(outputs.Console(**args))
+        OutputPlugins.append(outputs.load_plugin('Console')(**args))
 
     # IkaOutput_CSV: CSVログファイルを出力します。
     if 'CSV' in output_plugins:
+        if opts.get('output_csv'):
+            output_args['CSV']['csv_filename'] = opts['output_csv']
         args = _replace_vars(output_args['CSV'], vars)
-        OutputPlugins.append(outputs.CSV(**args))
+        OutputPlugins.append(outputs.load_plugin('CSV')(**args))
 
     # Fluentd: Fluentd にデータを投げます。
     if 'Fluentd' in output_plugins:
         args = _replace_vars(output_args['Fluentd'], vars)
-        OutputPlugins.append(outputs.Fluentd(**args))
+        OutputPlugins.append(outputs.load_plugin('Fluentd')(**args))
 
     if 'Hue' in output_plugins:
         args = _replace_vars(output_args['Hue'], vars)
-        OutputPlugins.append(outputs.Hue(**args))
+        OutputPlugins.append(outputs.load_plugin('Hue')(**args))
 
     # JSON: JSONログファイルを出力します。
     if ('JSON' in output_plugins) or opts.get('output_json'):
         if opts.get('output_json'):
             output_args['JSON']['json_filename'] = opts['output_json']
         args = _replace_vars(output_args['JSON'], vars)
-        OutputPlugins.append(outputs.JSON(**args))
+        OutputPlugins.append(outputs.load_plugin('JSON')(**args))
 
     # Screenshot: 戦績画面のスクリーンショットを保存します。
     if 'Screenshot' in output_plugins:
         args = _replace_vars(output_args['Screenshot'], vars)
-        OutputPlugins.append(outputs.Screenshot(**args))
+        OutputPlugins.append(outputs.load_plugin('Screenshot')(**args))
 
     # Slack: Slack 連携
     if 'Slack' in output_plugins:
         args = _replace_vars(output_args['Slack'], vars)
-        OutputPlugins.append(outputs.Slack(**args))
+        OutputPlugins.append(outputs.load_plugin('Slack')(**args))
 
     # StatInk: stat.ink (スプラトゥーンプレイ実績投稿サイト)
     if 'StatInk' in output_plugins:
@@ -180,21 +192,22 @@ def _init_outputs(opts):
             output_args['StatInk']['payload_file'] = opts['statink_payload']
 
         args = _replace_vars(output_args['StatInk'], vars)
-        OutputPlugins.append(outputs.StatInk(**args))
+        OutputPlugins.append(outputs.load_plugin('StatInk')(**args))
 
     # Twitter: Twitter 連携
     if 'Twitter' in output_plugins:
         args = _replace_vars(output_args['Twitter'], vars)
-        OutputPlugins.append(outputs.Twitter(**args))
+        OutputPlugins.append(outputs.load_plugin('Twitter')(**args))
 
     # WebSocket サーバ
     if 'WebSocketServer' in output_plugins:
         args = _replace_vars(output_args['WebSocketServer'], vars)
-        OutputPlugins.append(outputs.WebSocketServer(**args))
+        OutputPlugins.append(outputs.load_plugin('WebSocketServer')(**args))
 
     # REST API Server
     if 'RESTAPIServer' in output_plugins:
-        OutputPlugins.append(outputs.RESTAPIServer(**output_args['RESTAPIServer']))
+        OutputPlugins.append(outputs.load_plugin('RESTAPIServer')(
+            **output_args['RESTAPIServer']))
 
     # Video description for YouTube. It is expected to be used with
     # input.CVFile. Multiple matches in a video is not tested.
@@ -208,35 +221,35 @@ def _init_outputs(opts):
             output_args['Description']['output_filepath'] = (
                 opts['output_description'])
         args = _replace_vars(output_args['Description'], vars)
-        OutputPlugins.append(outputs.Description(**args))
+        OutputPlugins.append(outputs.load_plugin('Description')(**args))
 
     # VideoRecorder (class "OBS", for Windows)
     if 'VideoRecorder' in output_plugins:
         args = _replace_vars(output_args['VideoRecorder'], vars)
-        OutputPlugins.append(outputs.OBS(**args))
+        OutputPlugins.append(outputs.load_plugin('OBS')(**args))
 
     # 不具合調査向け。
     # イベントトリガをコンソールに出力。イベントトリガ時のスクリーンショット保存
     if (('DebugLog' in output_plugins) or opts.get('debug')):
         args = _replace_vars(output_args['DebugLog'], vars)
-        OutputPlugins.append(outputs.DebugLog(**args))
+        OutputPlugins.append(outputs.load_plugin('DebugLog')(**args))
 
     # PreviewDetected: 認識した画像をプレビュー上でマークする
     if 'PreviewDetected' in output_plugins:
         args = _replace_vars(output_args['PreviewDetected'], vars)
-        OutputPlugins.append(outputs.PreviewDetected(**args))
+        OutputPlugins.append(outputs.load_plugin('PreviewDetected')(**args))
 
     if 'Switcher' in output_plugins:
         args = _replace_vars(output_args['Switcher'], vars)
-        OutputPlugins.append(outputs.Switcher(**args))
+        OutputPlugins.append(outputs.load_plugin('Switcher')(**args))
 
     if 'Boyomi' in output_plugins:
         args = _replace_vars(output_args['Boyomi'], vars)
-        OutputPlugins.append(outputs.Boyomi(**args))
+        OutputPlugins.append(outputs.load_plugin('Boyomi')(**args))
 
     if 'MikuMikuMouth' in output_plugins:
         args = _replace_vars(output_args['MikuMikuMouth'], vars)
-        OutputPlugins.append(outputs.MikuMikuMouth(**args))
+        OutputPlugins.append(outputs.load_plugin('MikuMikuMouth')(**args))
 
     return OutputPlugins
 
@@ -264,6 +277,17 @@ def config(opts):
     if 'frame_rate' in source_args:
         source.set_frame_rate(source_args['frame_rate'])
 
+    # デコードを別スレッドで先読みする場合はキューのフレーム数を指定
+    input_args = (IkaConfig.INPUT_ARGS.get(_get_input_type(opts)) or {})
+    if input_args.get('decode_ahead'):
+        source.set_decode_ahead(input_args['decode_ahead'])
+
+    # スクリーンショット等の画像エンコーダ (プラグインより先に設定)
+    # IMAGE_ENCODER_ARGS is missing in old IkaConfig.py.
+    image_encoder_args = getattr(IkaConfig, 'IMAGE_ENCODER_ARGS', None)
+    if image_encoder_args:
+        configure_image_encoder(**image_encoder_args)
+
     # 使いたいプラグインを適宜設定
     OutputPlugins = _init_outputs(opts)
 
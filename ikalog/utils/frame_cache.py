@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import weakref
+
+import cv2
+
+# id(frame) -> FrameCache, to let IkaMatcher2 find the cache of the frame
+# it was given.
+_frame_caches = weakref.WeakValueDictionary()
+
+
+class FrameCache(object):
+    """
+    Per-frame cache of color-space conversions.
+
+    Most scenes and image filters convert their own crop of the same
+    frame to grayscale or HSV. FrameCache converts each requested area
+    once per frame, and returns the same image to every caller. Once the
+    areas requested for a color space cover a large part of the frame,
+    the whole frame is converted and later requests become views.
+
+    The returned images are shared. Callers must not modify them; make
+    a copy first if needed.
+    """
+
+    # cv2.cvtColor() code for each color space.
+    conversions = {
+        'gray': cv2.COLOR_BGR2GRAY,
+        'hsv': cv2.COLOR_BGR2HSV,
+    }
+
+    def set_frame(self, frame):
+        """
+        Discard cached images and start caching for the new frame.
+        """
+        if self.frame is not None:
+            _frame_caches.pop(id(self.frame), None)
+
+        self.frame = frame
+        # Identifies the frame, as id(frame) may be reused by a new frame.
+        self.serial += 1
+        self._full = {}
+        self._rois = {}
+        self._converted_pixels = {}
+
+        if frame is not None:
+            _frame_caches[id(frame)] = self
+
+    def _normalize_roi(self, x1, y1, x2, y2):
+        h, w = self.frame.shape[0:2]
+        x1 = 0 if x1 is None else x1
+        y1 = 0 if y1 is None else y1
+        x2 = w if x2 is None else x2
+        y2 = h if y2 is None else y2
+        return (max(0, x1), max(0, y1), min(w, x2), min(h, y2))
+
+    def get(self, color_space, x1=None, y1=None, x2=None, y2=None):
+        """
+        Return the frame (or the area of the frame) in the color space.
+
+        Args:
+            color_space: 'gray' or 'hsv'.
+            x1, y1, x2, y2: The area, in the same manner as
+                frame[y1:y2, x1:x2]. None means the edge of the frame.
+        Returns:
+            The converted image, or None if no frame is set.
+        """
+        if self.frame is None:
+            return None
+
+        full = self._full.get(color_space)
+        roi = self._normalize_roi(x1, y1, x2, y2)
+        x1, y1, x2, y2 = roi
+
+        if full is not None:
+            return full[y1:y2, x1:x2]
+
+        key = (color_space, roi)
+        img = self._rois.get(key)
+        if img is not None:
+            return img
+
+        h, w = self.frame.shape[0:2]
+        pixels = self._converted_pixels.get(color_space, 0) + \
+            (x2 - x1) * (y2 - y1)
+        self._converted_pixels[color_space] = pixels
+
+        if pixels >= w * h * self.full_frame_ratio:
+            full = cv2.cvtColor(self.frame, self.conversions[color_space])
+            self._full[color_space] = full
+            return full[y1:y2, x1:x2]
+
+        img = cv2.cvtColor(
+            self.frame[y1:y2, x1:x2], self.conversions[color_space])
+        self._rois[key] = img
+        return img
+
+    def gray(self, x1=None, y1=None, x2=None, y2=None):
+        return self.get('gray', x1, y1, x2, y2)
+
+    def hsv(self, x1=None, y1=None, x2=None, y2=None):
+        return self.get('hsv', x1, y1, x2, y2)
+
+    def __init__(self, frame=None, full_frame_ratio=0.5):
+        """
+        Constructor
+
+        Args:
+            frame: The frame to cache.
+            full_frame_ratio: Convert the whole frame once the requested
+                areas exceed this ratio of the frame.
+        """
+        self.frame = None
+        self.serial = 0
+        self.full_frame_ratio = full_frame_ratio
+        self.set_frame(frame)
+
+
+def find_frame_cache(img):
+    """
+    Return the FrameCache which is caching the image, or None.
+    """
+    cache = _frame_caches.get(id(img))
+    if (cache is not None) and (cache.frame is img):
+        return cache
+    return None
+
+
+def get_frame_cache(context):
+    """
+    Return the FrameCache for the current frame in the context.
+
+    The engine prepares the cache for each frame. This also works in
+    contexts without the engine (e.g. Scene.main_func()).
+    """
+    frame = context['engine'].get('frame')
+    cache = context['engine'].get('frame_cache')
+
+    if cache is None:
+        cache = FrameCache()
+        context['engine']['frame_cache'] = cache
+
+    if cache.frame is not frame:
+        cache.set_frame(frame)
+
+    return cache
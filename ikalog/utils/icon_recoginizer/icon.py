@@ -25,20 +25,25 @@ import pickle
 import cv2
 import numpy as np
 
+from ikalog.utils import model_file
+
 
 class IconRecoginizer(object):
 
     def down_sample_2d(self, src, w, h):
         sy, sx = src.shape[0:2]
 
-        out_img = np.zeros((h, w), np.uint8)
-        for x in range(w):
-            for y in range(h):
-                x1 = int((x / w) * sx)
-                y1 = int((y / h) * sy)
-                x2 = int(((x + 1) / w) * sx)
-                y2 = int(((y + 1) / h) * sy)
-                out_img[y, x] = np.amax(src[y1:y2, x1:x2])
+        # Max pooling over the w x h grid. Cells start at int(x / w * sx),
+        # so the cells may have different sizes if sx is not a multiple
+        # of w.
+        x1 = [int((x / w) * sx) for x in range(w)]
+        y1 = [int((y / h) * sy) for y in range(h)]
+
+        out_img = np.maximum.reduceat(src, y1, axis=0)
+        out_img = np.maximum.reduceat(out_img, x1, axis=1)
+        if len(out_img.shape) > 2:
+            out_img = np.amax(out_img.reshape((h, w, -1)), axis=2)
+        out_img = out_img.astype(np.uint8)
 
         max_value = np.amax(out_img)
         if max_value > 0:
@@ -156,6 +161,44 @@ class IconRecoginizer(object):
         name = self.id2name(id)
         return name, dists[0][0]
 
+    def extract_features_batch(self, imgs):
+        """
+        Returns:
+            The features of the images, a row per image.
+        """
+        return np.vstack([
+            np.array(self.extract_features(img), dtype=np.float32).reshape((1, -1))
+            for img in imgs])
+
+    def predict_features(self, features):
+        """
+        Predict the features (a row per sample) at once.
+
+        Returns:
+            List of (name, distance) for each sample.
+        """
+        if not self.trained:
+            return [(None, None)] * len(features)
+        if len(features) == 0:
+            return []
+
+        retval, results, neigh_resp, dists = \
+            self.model.findNearest(features, self._k)
+
+        return [(self.id2name(int(id)), dist[0])
+                for id, dist in zip(results.ravel(), dists)]
+
+    def predict_batch(self, imgs):
+        """
+        Predict the images at once.
+
+        Returns:
+            List of (name, distance) for each image.
+        """
+        if (not self.trained) or len(imgs) == 0:
+            return [(None, None)] * len(imgs)
+        return self.predict_features(self.extract_features_batch(imgs))
+
     def add_sample1(self, name, features):
         id = self.name2id(name)
 
@@ -164,6 +207,9 @@ class IconRecoginizer(object):
             dims = features.reshape((-1)).shape[0]
             self.samples = np.empty((0, dims))
             self.responses = []
+        elif not isinstance(self.responses, list):
+            # Loaded from the model file.
+            self.responses = self.responses.ravel().tolist()
 
         self.samples = np.append(self.samples, features.reshape((1, -1)), 0)
         self.responses.append(id)
@@ -177,8 +223,9 @@ class IconRecoginizer(object):
 
     def knn_train(self):
         # 終わったら
-        samples = np.array(self.samples, np.float32)
-        responses = np.array(self.responses, np.float32)
+        # No copies if loaded from the model file.
+        samples = np.asarray(self.samples, np.float32)
+        responses = np.asarray(self.responses, np.float32)
         responses = responses.reshape((responses.size, 1))
 
         self.model.train(samples, cv2.ml.ROW_SAMPLE, responses)
@@ -255,17 +302,29 @@ class IconRecoginizer(object):
                 print('<p>(%d samples hidden)</p>' % hidden)
 
     def save_model_to_file(self, file):
-        f = open(file, 'wb')
-        pickle.dump([self.samples, self.responses, self.icon_names], f)
-        f.close()
+        # Save the samples in the format knn_train() uses, so that the
+        # model can be used as is.
+        samples = np.array(self.samples, np.float32)
+        responses = np.array(self.responses, np.float32)
+        responses = responses.reshape((responses.size, 1))
+        model_file.save_model(
+            file, {'samples': samples, 'responses': responses},
+            meta={'icon_names': self.icon_names})
 
     def load_model_from_file(self, file):
-        f = open(file, 'rb')
-        l = pickle.load(f)
-        f.close()
-        self.samples = l[0]
-        self.responses = l[1]
-        self.icon_names = l[2]
+        if not model_file.is_model_file(file):
+            f = open(file, 'rb')
+            l = pickle.load(f)
+            f.close()
+            self.samples = l[0]
+            self.responses = l[1]
+            self.icon_names = l[2]
+            return
+
+        arrays, meta = model_file.load_model(file)
+        self.samples = arrays['samples']
+        self.responses = arrays['responses']
+        self.icon_names = meta['icon_names']
 
     def __init__(self, k=3):
         self.icon_names = []
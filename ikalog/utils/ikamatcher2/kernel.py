@@ -132,3 +132,12 @@ class Kernel(object):
         img_mask[img_mask > 0] = 255
 
         self._img_mask = self.encode(img_mask)
+
+    def load_encoded_mask(self, img_mask):
+        """
+        load_encoded_mask receives the mask already encoded by this kernel.
+
+        Args:
+            img_mask: mask image in the kernel-preferred format
+        """
+        self._img_mask = img_mask
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  Mask bundle: the masks of IkaMatcher2, encoded in a kernel's format.
+#
+#  Loading a mask image (imread, cvtColor, crop and Kernel.load_mask())
+#  takes most of the startup time of IkaEngine. A mask bundle keeps the
+#  encoded masks in a memory-mapped file, so IkaMatcher2 gets each mask
+#  as a view of the file instead.
+#
+#  A bundle is a pair of files:
+#    <kernel>.npy   The encoded masks, concatenated in a uint8 array.
+#    <kernel>.json  The index: offset, dtype and shape of each mask, and
+#                   the size and mtime of its mask image.
+#
+#  Bundles are built by tools/compile_masks.py. Masks which are not in
+#  the bundle, or whose images were modified after the build, are loaded
+#  from the images as usual.
+
+import json
+import os
+
+import numpy as np
+
+from ikalog.utils.ikautils import IkaUtils
+
+# Set False to ignore bundles.
+enabled = True
+
+# Each mask starts at this alignment in the bundle, for SIMD kernels.
+_align = 16
+
+# kernel name -> MaskBundle, or None if the bundle is not available.
+_bundles = {}
+
+# MaskBundleWriter which records the masks being loaded.
+_writer = None
+
+
+def get_bundle_dir():
+    return IkaUtils.get_path('masks', 'compiled')
+
+
+def get_bundle_filename(kernel_class, bundle_dir=None):
+    """
+    Return the filename (without the extension) of the bundle for the
+    kernel.
+    """
+    return os.path.join(bundle_dir or get_bundle_dir(), kernel_class.__name__)
+
+
+def _mask_key(img_file, left, top, width, height):
+    # The path is relative to the IkaLog directory, so the bundle can be
+    # moved with it.
+    img_file = os.path.relpath(img_file, IkaUtils.get_path())
+    return '%s:%d,%d,%d,%d' % (
+        img_file.replace(os.sep, '/'), left, top, width, height)
+
+
+def _stat(img_file):
+    st = os.stat(img_file)
+    return [st.st_size, st.st_mtime_ns]
+
+
+class MaskBundle(object):
+    """
+    Encoded masks in a memory-mapped bundle.
+    """
+
+    def get(self, img_file, left, top, width, height):
+        """
+        Return the encoded mask.
+
+        Args:
+            img_file: The path of the mask image.
+            left, top, width, height: The area of the mask.
+        Returns:
+            The encoded mask (read-only), or None if the mask is not in
+            the bundle or its image was modified.
+        """
+        entry = self._index.get(_mask_key(img_file, left, top, width, height))
+        if entry is None:
+            return None
+
+        try:
+            if _stat(img_file) != entry['stat']:
+                return None
+        except OSError:
+            return None
+
+        offset = entry['offset']
+        img = self._data[offset: offset + entry['nbytes']]
+        return img.view(entry['dtype']).reshape(entry['shape'])
+
+    def __len__(self):
+        return len(self._index)
+
+    def __init__(self, filename):
+        """
+        Constructor
+
+        Args:
+            filename: The filename of the bundle, without the extension.
+        """
+        with open(filename + '.json', 'r') as f:
+            self._index = json.load(f)['masks']
+        self._data = np.load(filename + '.npy', mmap_mode='r')
+
+
+class MaskBundleWriter(object):
+    """
+    Collects the encoded masks and writes them as a bundle.
+    """
+
+    def add(self, img_file, left, top, width, height, img_mask):
+        key = _mask_key(img_file, left, top, width, height)
+        if key in self._masks:
+            return
+
+        self._masks[key] = (_stat(img_file), np.ascontiguousarray(img_mask))
+
+    def save(self, filename):
+        """
+        Write the bundle.
+
+        Args:
+            filename: The filename of the bundle, without the extension.
+        """
+        index = {}
+        chunks = []
+        offset = 0
+        for key in sorted(self._masks.keys()):
+            stat, img_mask = self._masks[key]
+            data = img_mask.view(np.uint8).reshape(-1)
+            padding = (-len(data)) % _align
+
+            index[key] = {
+                'offset': offset,
+                'nbytes': len(data),
+                'dtype': img_mask.dtype.str,
+                'shape': list(img_mask.shape),
+                'stat': stat,
+            }
+            chunks.append(data)
+            chunks.append(np.zeros(padding, dtype=np.uint8))
+            offset += len(data) + padding
+
+        data = np.concatenate(chunks) if chunks else \
+            np.zeros(0, dtype=np.uint8)
+
+        dirname = os.path.dirname(filename)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+
+        # Replace the index after the data, so that readers see either
+        # bundle as a whole.
+        with open(filename + '.npy.tmp', 'wb') as f:
+            np.save(f, data)
+        os.replace(filename + '.npy.tmp', filename + '.npy')
+        with open(filename + '.json.tmp', 'w') as f:
+            json.dump({'masks': index}, f, indent=1, sort_keys=True)
+        os.replace(filename + '.json.tmp', filename + '.json')
+
+    def __len__(self):
+        return len(self._masks)
+
+    def __init__(self):
+        self._masks = {}
+
+
+def get_bundle(kernel_class):
+    """
+    Return the MaskBundle for the kernel, or None if not available.
+    """
+    name = kernel_class.__name__
+    if name not in _bundles:
+        bundle = None
+        filename = get_bundle_filename(kernel_class)
+        if os.path.exists(filename + '.json'):
+            try:
+                bundle = MaskBundle(filename)
+                IkaUtils.dprint('mask_bundle: loaded %d masks from %s' %
+                                (len(bundle), filename))
+            except:
+                IkaUtils.dprint('mask_bundle: failed to load %s' % filename)
+        _bundles[name] = bundle
+
+    return _bundles[name]
+
+
+def find_mask(kernel_class, img_file, left, top, width, height):
+    """
+    Return the encoded mask from the bundle, or None.
+    """
+    if (not enabled) or (_writer is not None):
+        return None
+
+    bundle = get_bundle(kernel_class)
+    if bundle is None:
+        return None
+
+    return bundle.get(img_file, left, top, width, height)
+
+
+def record_mask(img_file, left, top, width, height, img_mask):
+    """
+    Add the encoded mask to the MaskBundleWriter, if recording.
+    """
+    if _writer is not None:
+        _writer.add(img_file, left, top, width, height, img_mask)
+
+
+def start_recording():
+    """
+    Start collecting the masks IkaMatcher2 loads.
+
+    Returns:
+        MaskBundleWriter
+    """
+    global _writer
+    _writer = MaskBundleWriter()
+    return _writer
+
+
+def stop_recording():
+    global _writer
+    writer, _writer = _writer, None
+    _bundles.clear()
+    return writer
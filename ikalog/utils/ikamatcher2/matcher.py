@@ -18,13 +18,19 @@
 #  limitations under the License.
 #
 
+import collections
 import cv2
+import json
+import os
 import platform
 import numpy as np
+import time
 import traceback
 
 from ikalog.utils.find_image_file import find_image_file
+from ikalog.utils.frame_cache import find_frame_cache
 from ikalog.utils.ikautils import IkaUtils
+from ikalog.utils.ikamatcher2 import mask_bundle
 from ikalog.utils.image_filters.filters import *
 
 default_kernel = None # Overrided by load_kernel()
@@ -43,34 +49,83 @@ class IkaMatcher2(object):
             (img.shape[1] == self._width)
         return cropped
 
+    def _get_cached_image(self, img_obj, color_space):
+        cache = img_obj['cache']
+        if cache is None:
+            return None
+
+        return cache.get(color_space, self._left, self._top,
+                         self._left + self._width, self._top + self._height)
+
     def generate_grayscale_image(self, img_obj):
         if img_obj['gray'] is not None:
             return
 
-        img_obj['gray'] = cv2.cvtColor(img_obj['bgr'], cv2.COLOR_BGR2GRAY)
+        img_obj['gray'] = self._get_cached_image(img_obj, 'gray')
+        if img_obj['gray'] is None:
+            img_obj['gray'] = cv2.cvtColor(img_obj['bgr'], cv2.COLOR_BGR2GRAY)
+
+    def generate_hsv_image(self, img_obj):
+        if img_obj['hsv'] is not None:
+            return
+
+        img_obj['hsv'] = self._get_cached_image(img_obj, 'hsv')
+        if img_obj['hsv'] is None:
+            img_obj['hsv'] = cv2.cvtColor(img_obj['bgr'], cv2.COLOR_BGR2HSV)
+
+    def _run_filter(self, method, img_obj):
+        # Color filters prefer HSV when the image is colored.
+        if method.want_hsv_image and (img_obj['bgr'] is not None):
+            self.generate_hsv_image(img_obj)
+
+        elif method.want_grayscale_image and (img_obj['gray'] is None):
+            self.generate_grayscale_image(img_obj)
+
+        return method(img_bgr=img_obj['bgr'], img_gray=img_obj['gray'],
+                      img_hsv=img_obj['hsv'])
 
     def get_img_object(self, img):
+        # If the image is a frame cached by the engine, color conversions
+        # are shared with other matchers and scenes.
+        cache = None
         if not self._is_cropped(img):
+            cache = find_frame_cache(img)
             img = img[self._top: self._top + self._height,
                       self._left: self._left + self._width]
 
         if len(img.shape) == 2:
             img_gray = img
             img_bgr = None
+            cache = None
         else:
             img_gray = None
             img_bgr = img
 
-        return { 'bgr': img_bgr, 'gray': img_gray, 'bg': None, 'fg': None }
+        return {
+            'bgr': img_bgr, 'gray': img_gray, 'hsv': None,
+            'bg': None, 'fg': None, 'cache': cache,
+        }
 
     def match(self, img, debug=None):
         matched, fg_score, bg_score = self.match_score(img, debug)
         return matched
 
     def match_score(self, img, debug=None):
+        # Masks registered to a MultiClassIkaMatcher2 are evaluated
+        # together with the other masks in the frame.
+        if (self._multi_class_matcher is not None) and \
+                (not self._is_cropped(img)):
+            return self._multi_class_matcher.match_score_of(
+                self, img, debug=debug)
+
         img_obj = self.get_img_object(img)
         return self.match_score_internal(img_obj, debug=debug)
 
+    def _print_result(self, fg_matched, fg_ratio, bg_ratio):
+        print("%s: result=%s raito BG %s FG %s (threshold BG %1.3f FG %1.3f) label:%s" %
+              (self.__class__.__name__, fg_matched, bg_ratio, fg_ratio,
+               self._orig_threshold, self._threshold, self._label))
+
     def match_score_internal(self, img_obj, debug=None):
         debug = debug or self._debug
 
@@ -85,11 +140,7 @@ class IkaMatcher2(object):
         # Phase 2: Background check
         try:
             if img_obj['bg'] is None:
-                if self._bg_method.want_grayscale_image and (img_obj['gray'] is None):
-                    self.generate_grayscale_image(img_obj)
-
-                img_bg = 255 - \
-                    self._bg_method(img_bgr=img_obj['bgr'], img_gray=img_obj['gray'])
+                img_bg = 255 - self._run_filter(self._bg_method, img_obj)
                 img_obj['bg'] = self._kernel.encode(img_bg)
             bg_pixels = self._kernel.logical_and_popcnt(img_obj['bg'])
 
@@ -104,10 +155,7 @@ class IkaMatcher2(object):
         # Phase 3: Foreground check
         if bg_matched:
             if img_obj['fg'] is None:
-                if self._fg_method.want_grayscale_image and (img_obj['gray'] is None):
-                    self.generate_grayscale_image(img_obj)
-
-                img_fg = self._fg_method(img_bgr=img_obj['bgr'], img_gray=img_obj['gray'])
+                img_fg = self._run_filter(self._fg_method, img_obj)
                 img_obj['fg'] = self._kernel.encode(img_fg)
             fg_pixels = self._kernel.logical_or_popcnt(img_obj['fg'])
 
@@ -116,10 +164,7 @@ class IkaMatcher2(object):
             fg_matched = (fg_ratio > self._threshold)
 
         if debug:
-            label = self._label
-            print("%s: result=%s raito BG %s FG %s (threshold BG %1.3f FG %1.3f) label:%s" %
-                  (self.__class__.__name__, fg_matched, bg_ratio, fg_ratio,
-                   self._orig_threshold, self._threshold, label))
+            self._print_result(fg_matched, fg_ratio, bg_ratio)
         # ToDo: imshow
 
         # ToDo: on_mark_rect_in_preview
@@ -153,17 +198,32 @@ class IkaMatcher2(object):
         self._debug = debug
         self._label = label
         self._call_plugins = call_plugins
+        self._multi_class_matcher = None
 
         self._fg_method = fg_method or MM_WHITE()
         self._bg_method = bg_method or MM_NOT_WHITE()
+
+        kernel_class = kernel_class or default_kernel
+        self._kernel = kernel_class(self._width, self._height)
+
+        img_file2 = None
         if not img_file is None:
             img_file2 = find_image_file(img_file)
+
+            # Use the precompiled mask if available.
+            img_mask = mask_bundle.find_mask(
+                kernel_class, img_file2, left, top, width, height)
+            if img_mask is not None:
+                self._kernel.load_encoded_mask(img_mask)
+                return
+
             img = cv2.imread(img_file2)  # FIXME: use own imread
 
             if img is None:
                 IkaUtils.dprint(
                     '%s is not available. Retrying with %s' % (img_file2, img_file))
                 img = cv2.imread(img_file)  # FIXME
+                img_file2 = None
 
         if img is None:
             raise Exception('Could not load mask image %s (%s)' %
@@ -176,14 +236,153 @@ class IkaMatcher2(object):
             img = img[top: top + height, left: left + width]
 
         # Initialize kernel
-        kernel_class = kernel_class or default_kernel
-        self._kernel = kernel_class(self._width, self._height)
         self._kernel.load_mask(img)
 
+        if img_file2 is not None:
+            mask_bundle.record_mask(
+                img_file2, left, top, width, height, self._kernel._img_mask)
+
+
+def _filter_key(method):
+    # Filters with the same class and parameters give the same result.
+    return (method.__class__, repr(sorted(vars(method).items())))
+
+
+class _FusedMasks(IkaMatcher2):
+    """
+    Masks which share the bg_method, and cover the same or overlapping
+    areas. The bg/fg filters run once on the bounding box of the masks,
+    and the pixels of all the masks are counted by a matrix product.
+    """
+
+    def _add_rows(self, masks, rows, first_row):
+        for i, mask in enumerate(masks):
+            y = mask._top - self._top
+            x = mask._left - self._left
+            img_mask = mask._kernel.decode(mask._kernel._img_mask)
+            rows[first_row + i, y: y + mask._height, x: x + mask._width] = \
+                (img_mask > 170)
+
+    def _count(self, weights, img):
+        # Same as popcnt() of the reference kernel: values over 170.
+        img_bits = (img > 170).astype(np.float32).reshape((-1))
+        return np.dot(weights, img_bits)
+
+    def match_scores(self, img, debug=None):
+        """
+        Returns the list of (fg_matched, fg_ratio, bg_ratio) of the masks.
+        """
+        n = len(self.masks)
+        img_obj = self.get_img_object(img)
+
+        # Phase 2: Background check
+        counts = self._count(
+            self._weights, 255 - self._run_filter(self._bg_method, img_obj))
+        bg_pixels = counts[:n]
+
+        bg_ratios = bg_pixels / self._areas
+        bg_matched = bg_ratios <= self._orig_thresholds
+
+        # Phase 3: Foreground check
+        fg_ratios = np.zeros(n, dtype=np.float32)
+        for fg_method, indices in self._fg_methods:
+            if not np.any(bg_matched[indices]):
+                continue
+
+            img_fg = self._run_filter(fg_method, img_obj)
+            counts = self._count(self._weights, img_fg)
+            and_pixels = counts[:n][indices]
+            if self._roi_weights:
+                fg_roi_pixels = counts[n:][indices]
+            else:
+                fg_roi_pixels = np.sum(img_fg > 170)
+
+            # popcnt(mask | img) = popcnt(mask) + popcnt(img) - popcnt(mask & img)
+            fg_pixels = self._mask_pixels[indices] + fg_roi_pixels - and_pixels
+            fg_ratios[indices] = fg_pixels / self._areas[indices]
+
+        fg_ratios[~bg_matched] = 0.0
+        fg_matched = bg_matched & (fg_ratios > self._thresholds)
+
+        results = []
+        for i, mask in enumerate(self.masks):
+            result = (bool(fg_matched[i]), float(fg_ratios[i]),
+                      float(bg_ratios[i]))
+            if debug or mask._debug:
+                mask._print_result(*result)
+            results.append(result)
+        return results
+
+    def __init__(self, masks):
+        self.masks = masks
+
+        self._left = min([m._left for m in masks])
+        self._top = min([m._top for m in masks])
+        self._width = max([m._left + m._width for m in masks]) - self._left
+        self._height = max([m._top + m._height for m in masks]) - self._top
+        self._bg_method = masks[0]._bg_method
+
+        # Count pixels in the area of each mask, unless all the masks
+        # cover the same area.
+        n = len(masks)
+        self._roi_weights = any(
+            [(m._left, m._top, m._width, m._height) !=
+             (self._left, self._top, self._width, self._height) for m in masks])
+
+        rows = np.zeros(
+            ((n * 2) if self._roi_weights else n, self._height, self._width),
+            dtype=np.float32)
+        self._add_rows(masks, rows, 0)
+        self._mask_pixels = np.sum(rows[:n].reshape((n, -1)), axis=1)
+        if self._roi_weights:
+            for i, mask in enumerate(masks):
+                y = mask._top - self._top
+                x = mask._left - self._left
+                rows[n + i, y: y + mask._height, x: x + mask._width] = 1
+        self._weights = rows.reshape((rows.shape[0], -1))
+
+        # The ratios are compared in float32, as the kernels do.
+        self._areas = np.array(
+            [m._width * m._height for m in masks], dtype=np.float32)
+        self._thresholds = np.array(
+            [m._threshold for m in masks], dtype=np.float32)
+        self._orig_thresholds = np.array(
+            [m._orig_threshold for m in masks], dtype=np.float32)
+
+        fg_methods = {}
+        for i, mask in enumerate(masks):
+            key = _filter_key(mask._fg_method)
+            if not key in fg_methods:
+                fg_methods[key] = (mask._fg_method, [])
+            fg_methods[key][1].append(i)
+        self._fg_methods = [(method, np.array(indices))
+                            for method, indices in fg_methods.values()]
+
 
 class MultiClassIkaMatcher2(object):
+    """
+    Batch matcher of IkaMatcher2 masks.
+
+    Masks which share the same bg_method and the same (or overlapping)
+    area are compiled into a group. The filters run once per group, and
+    the scores of all the masks in the group come out of one vectorized
+    pass.
+
+    Scenes can also register() their masks at _init_scene(). Then
+    mask.match(frame) is served from the result of its group, which is
+    evaluated once per frame.
+    """
+
+    # Groups are merged if the bounding box of them is not larger than
+    # this ratio of the total area of their bounding boxes.
+    max_bounding_box_ratio = 1.5
+
     def __init__(self):
         self._masks = []
+        self._groups = None
+        self._group_of_mask = {}
+        self._cached_frame = (None, None)
+        self._cached_results = {}
 
     def add_mask(self, mask):
         if len(self._masks) > 0:
@@ -191,18 +390,118 @@ class MultiClassIkaMatcher2(object):
             # ToDo: compatibility check
 
         self._masks.append(mask)
+        self._groups = None
+
+    def register(self, mask):
+        """
+        Add the mask, and let mask.match() use this matcher.
+        """
+        self.add_mask(mask)
+        mask._multi_class_matcher = self
+
+    def _bounding_box_area(self, masks):
+        left = min([m._left for m in masks])
+        top = min([m._top for m in masks])
+        right = max([m._left + m._width for m in masks])
+        bottom = max([m._top + m._height for m in masks])
+        return (right - left) * (bottom - top)
+
+    def _can_merge(self, masks1, masks2):
+        if _filter_key(masks1[0]._bg_method) != \
+                _filter_key(masks2[0]._bg_method):
+            return False
+
+        area = self._bounding_box_area(masks1) + \
+            self._bounding_box_area(masks2)
+        return self._bounding_box_area(masks1 + masks2) <= \
+            area * self.max_bounding_box_ratio
+
+    def compile(self):
+        """
+        Build the groups of the masks. Called automatically.
+        """
+        groups = [[mask] for mask in self._masks]
+
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(groups)):
+                for j in range(i + 1, len(groups)):
+                    if self._can_merge(groups[i], groups[j]):
+                        groups[i] = groups[i] + groups.pop(j)
+                        merged = True
+                        break
+                if merged:
+                    break
+
+        self._groups = [_FusedMasks(masks) for masks in groups]
+        self._group_of_mask = {}
+        for group in self._groups:
+            for i, mask in enumerate(group.masks):
+                self._group_of_mask[id(mask)] = (group, i)
+        self._cached_results = {}
+
+    def _match_group(self, group, img, debug=None):
+        # Results are cached while the frame is the same.
+        cache = find_frame_cache(img)
+        frame_key = (cache, cache.serial) if cache else (None, None)
+        if cache is None or frame_key != self._cached_frame:
+            self._cached_frame = frame_key
+            self._cached_results = {}
+
+        results = self._cached_results.get(id(group))
+        if results is not None:
+            return results
+
+        try:
+            results = group.match_scores(img, debug=debug)
+        except:
+            IkaUtils.dprint('%s: failed to evaluate masks together.' % self)
+            IkaUtils.dprint(traceback.format_exc())
+            results = [mask.match_score_internal(
+                mask.get_img_object(img), debug) for mask in group.masks]
+
+        if cache is not None:
+            self._cached_results[id(group)] = results
+        return results
+
+    def match_score_of(self, mask, img, debug=None):
+        """
+        Returns (fg_matched, fg_ratio, bg_ratio) of the mask.
+        """
+        if self._groups is None:
+            self.compile()
+
+        group, index = self._group_of_mask[id(mask)]
+        return self._match_group(group, img, debug=debug)[index]
+
+    def match_scores(self, img, debug=None):
+        """
+        Returns the list of (fg_matched, fg_ratio, bg_ratio) of the masks,
+        in the order they were added.
+        """
+        return [self.match_score_of(mask, img, debug=debug)
+                for mask in self._masks]
 
     def match_best(self, img, debug=None):
         if len(self._masks) == 0:
             return 0.0, None
 
-        img_obj = self._masks[0].get_img_object(img)
-
         results = []
-        for mask in self._masks:
-            fg_matched, fg_ratio, bg_ratio = mask.match_score_internal(img_obj, debug)
-            if fg_matched:
-                results.append([fg_ratio, mask])
+        if self._is_cropped(img):
+            # The image is already cropped for the masks.
+            img_obj = self._masks[0].get_img_object(img)
+            for mask in self._masks:
+                fg_matched, fg_ratio, bg_ratio = \
+                    mask.match_score_internal(img_obj, debug)
+                if fg_matched:
+                    results.append([fg_ratio, mask])
+        else:
+            scores = self.match_scores(img, debug=debug)
+            for mask, (fg_matched, fg_ratio, bg_ratio) in \
+                    zip(self._masks, scores):
+                if fg_matched:
+                    results.append([fg_ratio, mask])
 
         if len(results) == 0:
             return 0.0, None
@@ -210,22 +509,168 @@ class MultiClassIkaMatcher2(object):
         best = sorted(results, key=lambda x:-x[0])[0]
         return best
 
+    def _is_cropped(self, img):
+        return self._masks[0]._is_cropped(img)
 
-def load_kernel():
-    global default_kernel
+
+# Cache of the kernel chosen by the benchmark in load_kernel().
+kernel_cache_file = os.path.join(
+    os.path.expanduser('~'), '.cache', 'ikalog', 'ikamatcher2_kernel.json')
+
+
+def get_kernel_candidates():
+    """
+    Return the kernels available on this machine.
+
+    Returns:
+        OrderedDict of the kernel name and the kernel class, in the order
+        of preference when the benchmark is not available.
+    """
+    from ikalog.utils.ikamatcher2.reference import \
+        Numpy_uint8_fast, Numpy_1bit
+
+    candidates = collections.OrderedDict()
 
     if platform.machine().startswith('armv7'):
         try:
             from lib.ikamatcher2_kernel_hal import HAL
-            default_kernel = HAL
+            candidates['HAL'] = HAL
         except:
+            pass
+        try:
             from ikalog.utils.ikamatcher2.arm_neon import NEON
-            default_kernel = NEON
+            candidates['NEON'] = NEON
+        except:
+            pass
+
+    candidates['Numpy_uint8_fast'] = Numpy_uint8_fast
+    candidates['Numpy_1bit'] = Numpy_1bit
+    return candidates
+
+
+def benchmark_kernel(kernel_class, width=256, height=128, loops=50):
+    """
+    Measure the kernel, in the same way as test/bench_1024mat.py.
+
+    Args:
+        kernel_class: The kernel to measure.
+        width, height: The size of the mask.
+        loops: Number of iterations.
+    Returns:
+        (seconds per iteration, (and_popcnt, or_popcnt) of the last
+        iteration)
+    """
+    rand = np.random.RandomState(0)
+    img_mask = (rand.randint(2, size=(height, width)) * 255).astype(np.uint8)
+    img_test = (rand.randint(2, size=(height, width)) * 255).astype(np.uint8)
+
+    kernel = kernel_class(width, height)
+    kernel.load_mask(img_mask)
+
+    t1 = time.time()
+    for i in range(loops):
+        img_test_encoded = kernel.encode(img_test)
+        r_and = kernel.logical_and_popcnt(img_test_encoded)
+        r_or = kernel.logical_or_popcnt(img_test_encoded)
+    t2 = time.time()
+
+    # Some kernels return the count in an array.
+    return ((t2 - t1) / loops, (int(np.sum(r_and)), int(np.sum(r_or))))
+
+
+def _read_kernel_cache(key):
+    try:
+        with open(kernel_cache_file, 'r') as f:
+            cache = json.load(f)
+        if cache.get('key') == key:
+            return cache.get('kernel')
+    except:
+        pass
+    return None
+
+
+def _write_kernel_cache(key, kernel_name):
+    try:
+        os.makedirs(os.path.dirname(kernel_cache_file), exist_ok=True)
+        tmp_file = '%s.%d.tmp' % (kernel_cache_file, os.getpid())
+        with open(tmp_file, 'w') as f:
+            json.dump({'key': key, 'kernel': kernel_name}, f)
+        os.replace(tmp_file, kernel_cache_file)
+    except:
+        IkaUtils.dprint('%s: failed to write %s' % (
+            IkaMatcher2, kernel_cache_file))
+
+
+def select_kernel(candidates):
+    """
+    Choose the fastest kernel among the candidates.
+
+    The result of the benchmark is cached in kernel_cache_file, and
+    reused while the machine, numpy and the candidates are the same.
+
+    Returns:
+        The name of the kernel.
+    """
+    key = '%s/%s/numpy-%s/%s' % (
+        platform.machine(), platform.python_implementation(),
+        np.__version__, ','.join(candidates.keys()))
+
+    kernel_name = _read_kernel_cache(key)
+    if kernel_name in candidates:
+        return kernel_name
+
+    expected = None
+    results = []
+    for name, kernel_class in candidates.items():
+        try:
+            duration, r = benchmark_kernel(kernel_class)
+        except:
+            IkaUtils.dprint('%s: kernel %s caused a exception.' % (
+                IkaMatcher2, name))
+            continue
+
+        # The first candidate that works is the reference.
+        expected = expected or r
+        if r != expected:
+            IkaUtils.dprint('%s: kernel %s returned wrong result.' % (
+                IkaMatcher2, name))
+            continue
+
+        IkaUtils.dprint('%s: kernel %s %0.1fus' % (
+            IkaMatcher2, name, duration * 1000000))
+        results.append((duration, name))
+
+    if not results:
+        return list(candidates.keys())[0]
+
+    kernel_name = min(results)[1]
+    _write_kernel_cache(key, kernel_name)
+    return kernel_name
+
+
+def load_kernel(kernel_name=None):
+    """
+    Set default_kernel.
+
+    Args:
+        kernel_name: The name of the kernel to use. If None,
+            IKALOG_MATCHER_KERNEL environment variable is used. If not
+            set either, the fastest kernel on this machine is used.
+    """
+    global default_kernel
+
+    candidates = get_kernel_candidates()
+    kernel_name = kernel_name or os.environ.get('IKALOG_MATCHER_KERNEL')
+
+    if kernel_name and (kernel_name not in candidates):
+        IkaUtils.dprint('%s: kernel %s is not available' % (
+            IkaMatcher2, kernel_name))
+        kernel_name = None
 
-    else:
-        from ikalog.utils.ikamatcher2.reference import Numpy_uint8_fast
-        default_kernel = Numpy_uint8_fast
+    if not kernel_name:
+        kernel_name = select_kernel(candidates)
 
+    default_kernel = candidates[kernel_name]
     IkaUtils.dprint('%s: using kernel %s' % (IkaMatcher2, default_kernel.__name__))
 
 
@@ -90,15 +90,17 @@ class Numpy_1bit(Kernel):
         Bits per pixel:               1bit (uint8)
         Alignment per lines:         0
         Alignment of returned image: self._align bytes
+
+        Pixels over 170 are set, as popcnt() of Numpy_uint8 counts them.
         """
 
         assert img.shape[0] == self._h
         assert img.shape[1] == self._w
 
         img_8b_1d = np.reshape(img, (-1))
-        img_1b_1d = np.packbits(img_8b_1d)
+        img_1b_1d = np.packbits(img_8b_1d > 170)
 
-        padding_len = self._align - (len(img_1b_1d) % self._align)
+        padding_len = (-len(img_1b_1d)) % self._align
         if padding_len:
             img_1b_1d_p = np.append(img_1b_1d, self.zeros128[0: padding_len])
         else:
@@ -108,7 +110,6 @@ class Numpy_1bit(Kernel):
         assert img_1b_1d_p.shape[0] >= (self._h * self._w / 8)
         assert img_1b_1d_p.shape[0] % self._align == 0
 
-#        print('encode: %s %s' % (img_1b_1d.shape, img_1b_1d_p.shape))
         return img_1b_1d_p
 
     def decode(self, img):
@@ -125,9 +126,6 @@ class Numpy_1bit(Kernel):
 
         return img_8b_2d
 
-#    def convert(self, img):
-#        return np.packbits(img)
-
     def logical_or(self, img):
         r = self._img_mask | img
         return r
@@ -135,3 +133,11 @@ class Numpy_1bit(Kernel):
     def logical_and(self, img):
         r = self._img_mask & img
         return r
+
+    if hasattr(np, 'bitwise_count'):
+        def popcnt(self, img):
+            return int(np.sum(np.bitwise_count(img), dtype=np.int64))
+    else:
+        def popcnt(self, img):
+            # unpackbits() is faster than a lookup table in numpy.
+            return np.count_nonzero(np.unpackbits(img))
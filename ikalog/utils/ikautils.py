@@ -283,4 +283,5 @@ class IkaUtils(object):
         # these values are replaced with None before deepcopy.
         context2['engine']['engine'] = None  # IkaEngine
         context2['engine']['service'] = {}  # functions of IkaEngine
+        context2['engine']['frame_cache'] = None  # FrameCache
         return copy.deepcopy(context2)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  Image encoder: encodes screenshots (PNG etc.) on worker threads.
+#
+#  Encoding a 1280x720 PNG takes tens of milliseconds, which drops
+#  frames if done on the engine thread. ImageEncoder encodes the images
+#  on a thread pool (cv2.imencode() releases the GIL), and returns the
+#  encoded bytes as a concurrent.futures.Future.
+#
+#  The recent results are cached by the contents of the image, so the
+#  plugins encoding the same screenshot (e.g. StatInk, Twitter and
+#  Screenshot all encode the scoreboard) share one encoding.
+
+import collections
+import concurrent.futures
+import hashlib
+import threading
+
+import cv2
+import numpy as np
+
+# hashlib.blake2b() is available on Python 3.6+.
+if hasattr(hashlib, 'blake2b'):
+    def _hash(data):
+        return hashlib.blake2b(data, digest_size=16)
+else:
+    _hash = hashlib.sha1
+
+
+class ImageEncoder(object):
+    """
+    Encodes the images on worker threads.
+
+    Usage:
+        future = get_image_encoder().encode_png(img)
+        ...
+        img_png = future.result()  # bytes, or None on failure
+
+    The image must not be modified until the encoding is done.
+    """
+
+    def _get_params(self, ext, compression):
+        if compression is None:
+            compression = self.compression
+        if compression is None:
+            return []
+        if ext == '.png':
+            return [cv2.IMWRITE_PNG_COMPRESSION, int(compression)]
+        if ext in ('.jpg', '.jpeg'):
+            return [cv2.IMWRITE_JPEG_QUALITY, int(compression)]
+        return []
+
+    @staticmethod
+    def _get_key(img, ext, params):
+        img = np.ascontiguousarray(img)
+        digest = _hash(memoryview(img).cast('B')).digest()
+        return (digest, img.shape, img.dtype.str, ext, tuple(params))
+
+    def _encode(self, img, ext, params):
+        # This function runs on the worker thread.
+        result, img_encoded = cv2.imencode(ext, img, params)
+        if not result:
+            return None
+        return img_encoded.tobytes()
+
+    def encode(self, img, ext='.png', compression=None):
+        """
+        Encode the image on the worker thread.
+
+        Args:
+            img: The image (BGR or grayscale).
+            ext: The format, e.g. '.png' or '.jpg'.
+            compression: PNG compression level (0-9), or JPEG quality
+                (0-100). None to use the level of the encoder.
+        Returns:
+            Future of the encoded bytes, or None if failed.
+        """
+        params = self._get_params(ext, compression)
+        key = self._get_key(img, ext, params)
+
+        with self._lock:
+            future = self._cache.get(key)
+            if future is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return future
+
+            future = self._executor.submit(self._encode, img, ext, params)
+            self._cache[key] = future
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self.misses += 1
+        return future
+
+    def encode_png(self, img, compression=None):
+        return self.encode(img, '.png', compression)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'cached': len(self._cache),
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def __init__(self, max_workers=2, compression=None, cache_size=8):
+        """
+        Constructor
+
+        Args:
+            max_workers: Number of the worker threads.
+            compression: The default PNG compression level (0-9). None
+                to use the default of OpenCV.
+            cache_size: Number of the recent results to keep.
+        """
+        self.compression = compression
+        self.cache_size = cache_size
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._cache = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+
+_image_encoder = None
+_image_encoder_lock = threading.Lock()
+
+
+def get_image_encoder():
+    """
+    Return the ImageEncoder shared by the plugins.
+    """
+    global _image_encoder
+    with _image_encoder_lock:
+        if _image_encoder is None:
+            _image_encoder = ImageEncoder()
+        return _image_encoder
+
+
+def configure_image_encoder(max_workers=None, compression=None,
+                            cache_size=None):
+    """
+    Replace the ImageEncoder shared by the plugins. The arguments are
+    the same as ImageEncoder's, and None keeps its default.
+
+    The encodings already requested are finished by the previous
+    encoder.
+    """
+    global _image_encoder
+    args = {}
+    if max_workers is not None:
+        args['max_workers'] = max_workers
+    if compression is not None:
+        args['compression'] = compression
+    if cache_size is not None:
+        args['cache_size'] = cache_size
+
+    with _image_encoder_lock:
+        old_encoder = _image_encoder
+        _image_encoder = ImageEncoder(**args)
+    if old_encoder is not None:
+        old_encoder.shutdown(wait=False)
+    return _image_encoder
@@ -26,11 +26,12 @@ from ikalog.utils import IkaUtils
 class ImageFilter(object):
 
     want_grayscale_image = True
-    
+    want_hsv_image = False
+
     # For backward compatibility
     _warned_evaluate_is_deprecated = False
 
-    def evaluate(self, img_bgr=None, img_gray=None):
+    def evaluate(self, img_bgr=None, img_gray=None, img_hsv=None):
         # if not hasattr(self, '_warned_evaluate_is_deprecated'):
 
         if not self._warned_evaluate_is_deprecated:
@@ -38,17 +39,26 @@ class ImageFilter(object):
             IkaUtils.dprint('%s: evaluate() is depricated.' % self)
             self._warned_evaluate_is_deprecated = True
 
-        return self(img_bgr=img_bgr, img_gray=img_gray)
+        return self(img_bgr=img_bgr, img_gray=img_gray, img_hsv=img_hsv)
 
-    def _run_filter(self, img_bgr=None, img_gray=None):
+    def _run_filter(self, img_bgr=None, img_gray=None, img_hsv=None):
         raise Exception('Need to be overrided')
 
-    def __call__(self, img_bgr=None, img_gray=None):
-        return self._run_filter(img_bgr=img_bgr, img_gray=img_gray)
+    def __call__(self, img_bgr=None, img_gray=None, img_hsv=None):
+        """
+        Run the filter.
+
+        img_gray and img_hsv are optional. If given, they must be
+        conversions of img_bgr; filters use them instead of converting
+        img_bgr by themselves.
+        """
+        return self._run_filter(img_bgr=img_bgr, img_gray=img_gray, img_hsv=img_hsv)
 
 
 class MM_WHITE(ImageFilter):
 
+    want_hsv_image = True
+
     def _run_filter_gray_image(self, img_gray):
         assert(len(img_gray.shape) == 2)
 
@@ -60,14 +70,16 @@ class MM_WHITE(ImageFilter):
         img_match_v = cv2.inRange(img_gray, vis_min, vis_max)
         return img_match_v
 
-    def _run_filter(self, img_bgr=None, img_gray=None):
-        if (img_bgr is None):
+    def _run_filter(self, img_bgr=None, img_gray=None, img_hsv=None):
+        if (img_bgr is None) and (img_hsv is None):
             return self._run_filter_gray_image(img_gray)
 
         # カラー画像から白い部分だけ抜き出した白黒画像を作る
 
-        assert(len(img_bgr.shape) == 3)
-        assert(img_bgr.shape[2] == 3)
+        if img_hsv is None:
+            assert(len(img_bgr.shape) == 3)
+            assert(img_bgr.shape[2] == 3)
+            img_hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
 
         sat_min = min(self.sat_range)
         sat_max = max(self.sat_range)
@@ -77,7 +89,6 @@ class MM_WHITE(ImageFilter):
         assert(sat_min >= 0 and sat_max <= 256)
         assert(vis_min >= 0 and vis_max <= 256)
 
-        img_hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
         img_match_s = cv2.inRange(img_hsv[:, :, 1], sat_min, sat_max)
         img_match_v = cv2.inRange(img_hsv[:, :, 2], vis_min, vis_max)
         img_match = img_match_s & img_match_v
@@ -90,15 +101,15 @@ class MM_WHITE(ImageFilter):
 
 class MM_NOT_WHITE(MM_WHITE):
 
-    def _run_filter(self, img_bgr=None, img_gray=None):
+    def _run_filter(self, img_bgr=None, img_gray=None, img_hsv=None):
         img_result = super(MM_NOT_WHITE, self)._run_filter(
-            img_bgr=img_bgr, img_gray=img_gray)
+            img_bgr=img_bgr, img_gray=img_gray, img_hsv=img_hsv)
         return 255 - img_result
 
 
 class MM_BLACK(ImageFilter):
 
-    def _run_filter(self, img_bgr=None, img_gray=None):
+    def _run_filter(self, img_bgr=None, img_gray=None, img_hsv=None):
         assert((img_bgr is not None) or (img_gray is not None))
 
         if (img_gray is None):
@@ -125,27 +136,29 @@ class MM_DARK(MM_BLACK):
 
 class MM_NOT_BLACK(MM_BLACK):
 
-    def _run_filter(self, img_bgr=None, img_gray=None):
+    def _run_filter(self, img_bgr=None, img_gray=None, img_hsv=None):
         img_result = super(MM_NOT_BLACK, self)._run_filter(
-            img_bgr=img_bgr, img_gray=img_gray)
+            img_bgr=img_bgr, img_gray=img_gray, img_hsv=img_hsv)
         return 255 - img_result
 
 
 class MM_COLOR_BY_HUE(ImageFilter):
 
     want_grayscale_image = False
+    want_hsv_image = True
 
     def _hue_range_to_list(self, r):
         # FIXME: 0, 180をまたぐ場合にふたつに分ける
         return [r]
 
-    def _run_filter(self, img_bgr=None, img_gray=None):
-        assert(img_bgr is not None)
-        assert(len(img_bgr.shape) >= 3)
-        assert(img_bgr.shape[2] == 3)
+    def _run_filter(self, img_bgr=None, img_gray=None, img_hsv=None):
         assert(len(self._hue_range_to_list(self.hue_range)) == 1)  # FIXME
 
-        img_hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
+        if img_hsv is None:
+            assert(img_bgr is not None)
+            assert(len(img_bgr.shape) >= 3)
+            assert(img_bgr.shape[2] == 3)
+            img_hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
 
         vis_min = min(self.visibility_range)
         vis_max = max(self.visibility_range)
@@ -174,9 +187,10 @@ class MM_COLOR_BY_HUE(ImageFilter):
 class MM_NOT_COLOR_BY_HUE(MM_COLOR_BY_HUE):
 
     want_grayscale_image = False
+    want_hsv_image = True
 
-    def _run_filter(self, img_bgr=None, img_gray=None):
+    def _run_filter(self, img_bgr=None, img_gray=None, img_hsv=None):
         img_result = super(MM_NOT_COLOR_BY_HUE, self)._run_filter(
-            img_bgr=img_bgr, img_gray=img_gray)
+            img_bgr=img_bgr, img_gray=img_gray, img_hsv=img_hsv)
         return 255 - img_result
 
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  Model file: arrays of a recognizer model in a memory-mappable format.
+#
+#  The models used to be pickled lists of arrays, which are read into
+#  each process. A model file is memory-mapped instead, so the arrays
+#  are views of the file and the pages are shared among processes.
+#
+#  Format:
+#    8 bytes   magic (b'IKAMODEL')
+#    uint32    format version
+#    uint32    length of the header
+#    header    JSON: {'meta': {...},
+#                     'arrays': {name: {'offset', 'dtype', 'shape'}}}
+#    arrays    raw data, each aligned to 64 bytes. Offsets are relative
+#              to the end of the header (aligned to 64 bytes as well).
+
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'IKAMODEL'
+VERSION = 1
+
+_align = 64
+_preamble = struct.Struct('<8sII')
+
+
+def _aligned(n):
+    return n + ((-n) % _align)
+
+
+def is_model_file(filename):
+    """
+    Check if the file is a model file (not a legacy pickle).
+    """
+    try:
+        with open(filename, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except IOError:
+        return False
+
+
+def save_model(filename, arrays, meta=None):
+    """
+    Write the model file.
+
+    Args:
+        filename: The filename.
+        arrays: dict of the name and the array.
+        meta: JSON-serializable metadata of the model.
+    """
+    arrays = dict((name, np.ascontiguousarray(array))
+                  for name, array in arrays.items())
+
+    index = {}
+    offset = 0
+    for name in sorted(arrays.keys()):
+        array = arrays[name]
+        index[name] = {
+            'offset': offset,
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+        }
+        offset = _aligned(offset + array.nbytes)
+
+    header = json.dumps({'meta': meta or {}, 'arrays': index}).encode('utf-8')
+    data_start = _aligned(_preamble.size + len(header))
+
+    tmp_filename = '%s.tmp' % filename
+    with open(tmp_filename, 'wb') as f:
+        f.write(_preamble.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        for name in sorted(arrays.keys()):
+            f.seek(data_start + index[name]['offset'])
+            f.write(arrays[name].tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_filename, filename)
+
+
+def load_model(filename):
+    """
+    Memory-map the model file.
+
+    Returns:
+        (arrays, meta). The arrays are read-only views of the file.
+    """
+    data = np.memmap(filename, dtype=np.uint8, mode='r')
+    magic, version, header_len = _preamble.unpack(
+        data[:_preamble.size].tobytes())
+
+    if magic != MAGIC:
+        raise Exception('%s is not a model file' % filename)
+    if version != VERSION:
+        raise Exception('%s: unsupported model file version %d' %
+                        (filename, version))
+
+    header = json.loads(
+        data[_preamble.size: _preamble.size + header_len].tobytes()
+        .decode('utf-8'))
+    data_start = _aligned(_preamble.size + header_len)
+
+    arrays = {}
+    for name, entry in header['arrays'].items():
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        offset = data_start + entry['offset']
+        array = data[offset: offset + count * dtype.itemsize]
+        arrays[name] = np.ndarray(
+            shape=entry['shape'], dtype=dtype, buffer=array)
+
+    return arrays, header['meta']
@@ -24,7 +24,80 @@ def relu(x):
     return np.maximum(x, np.zeros(x.shape, dtype=x.dtype))
 
 
+def quantize_layers(layers, precision):
+    """
+    Quantize the weights of the layers.
+
+    Args:
+        layers: The layers for forward_mlp().
+        precision: 'float32', 'float16' or 'int8'. int8 weights are
+            quantized symmetrically with a scale per output unit.
+    Returns:
+        New list of the layers. Biases and activations are shared with
+        the original layers.
+    """
+    assert precision in ('float32', 'float16', 'int8')
+
+    quantized = []
+    for layer in layers:
+        layer = dict(layer)
+        w = np.asarray(layer['weight'], dtype=np.float32)
+
+        if precision == 'int8':
+            scale = np.max(np.abs(w), axis=1) / 127
+            scale[scale == 0] = 1
+            layer['weight'] = np.round(w / scale[:, np.newaxis]).astype(np.int8)
+            layer['scale'] = scale.astype(np.float32)
+        else:
+            layer['weight'] = w.astype(precision)
+            layer.pop('scale', None)
+
+        quantized.append(layer)
+    return quantized
+
+
+def dequantize_layers(layers):
+    """
+    Convert the quantized weights back to float32.
+
+    numpy has no fast matmul for float16/int8, so the quantized layers
+    are converted once for forward_mlp(). The values keep the precision
+    of the quantized weights.
+
+    Args:
+        layers: The layers from quantize_layers().
+    Returns:
+        New list of the layers with float32 weights.
+    """
+    dequantized = []
+    for layer in layers:
+        layer = dict(layer)
+        w = layer['weight'].astype(np.float32)
+        scale = layer.pop('scale', None)
+        if scale is not None:
+            w *= scale[:, np.newaxis]
+        layer['weight'] = w
+        dequantized.append(layer)
+    return dequantized
+
+
+def weight_bytes(layers):
+    """
+    Returns the total size of the weights (and their scales) in bytes.
+    """
+    total = 0
+    for layer in layers:
+        for key in ('weight', 'scale'):
+            if layer.get(key) is not None:
+                total += np.asarray(layer[key]).nbytes
+    return total
+
+
 def forward_mlp(x, layers):
+    """
+    Forward the samples (a row per sample) through the layers. The
+    weights should have the dtype of x (see dequantize_layers()).
+    """
     for layer in layers:
         w = layer['weight']
         b = layer.get('bias', None)
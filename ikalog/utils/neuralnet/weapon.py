@@ -19,13 +19,15 @@
 
 import pickle
 import os
+import time
 
 import cv2
 import numpy as np
-import time
 
+import ikalog.utils.model_file
 from ikalog.utils import IkaUtils
-from ikalog.utils.neuralnet.functions import relu, forward_mlp
+from ikalog.utils.neuralnet.functions import relu, forward_mlp, \
+    quantize_layers, dequantize_layers, weight_bytes
 
 
 class WeaponClassifier(object):
@@ -68,27 +70,68 @@ class WeaponClassifier(object):
                 print('<p>(%d samples hidden)</p>' % hidden)
 
     def __init__(self, model_file=None):
-        pass
+        self.precision = 'float32'
+        self._layers_predict = None
 
     def model_filename(self):
         return 'data/weapons.nn.data'
 
-    def load_model_from_file(self, model_file=None):
-        _model_filename = model_file or self.model_filename()
-
-        f = open(_model_filename, 'rb')
+    def _load_legacy_model_from_file(self, filename):
+        f = open(filename, 'rb')
         l = pickle.load(f)
         f.close()
         self._weapons_keys = l['weapons_keys']
         self._layers = l['layers']
 
+    def load_model_from_file(self, model_file=None):
+        _model_filename = model_file or self.model_filename()
+
+        if not ikalog.utils.model_file.is_model_file(_model_filename):
+            self._load_legacy_model_from_file(_model_filename)
+        else:
+            arrays, meta = ikalog.utils.model_file.load_model(_model_filename)
+            self._weapons_keys = meta['weapons_keys']
+            self._layers = []
+            for i, layer_meta in enumerate(meta['layers']):
+                layer = dict(layer_meta)
+                for key in ('weight', 'bias'):
+                    array_name = 'layers/%d/%s' % (i, key)
+                    if array_name in arrays:
+                        layer[key] = arrays[array_name]
+                self._layers.append(layer)
+
         for layer in self._layers:
             activation_func = {'relu': relu}.get(layer.get('activation'))
             if activation_func:
                 layer['activation'] = activation_func
+
+        # Quantize the new weights again.
+        self.set_precision(self.precision)
         # print(self._weapons_keys)
         # print(self._layers)
 
+    def save_model_to_file(self, model_file=None):
+        _model_filename = model_file or self.model_filename()
+
+        activation_names = {relu: 'relu'}
+        arrays = {}
+        layers_meta = []
+        for i, layer in enumerate(self._layers):
+            layer_meta = {}
+            for key, value in layer.items():
+                if key in ('weight', 'bias'):
+                    if value is not None:
+                        arrays['layers/%d/%s' % (i, key)] = value
+                elif key == 'activation':
+                    layer_meta[key] = activation_names.get(value, value)
+                else:
+                    layer_meta[key] = value
+            layers_meta.append(layer_meta)
+
+        ikalog.utils.model_file.save_model(
+            _model_filename, arrays,
+            meta={'weapons_keys': self._weapons_keys, 'layers': layers_meta})
+
     def image_to_feature(self, img_weapon):
         img_weapon_hsv = cv2.cvtColor(img_weapon, cv2.COLOR_BGR2HSV)
         img_weapon_hsv_f32 = np.asarray(img_weapon_hsv, dtype=np.float32)
@@ -97,29 +140,111 @@ class WeaponClassifier(object):
         img_weapon_hsv_f32[:, :, 2] /= 128
         return np.reshape(img_weapon_hsv_f32, (1, -1))
 
-    def predict(self, img_weapon):
-        t1 = time.time()
-        feat_weapon = self.image_to_feature(img_weapon)
-        # print(feat_weapon.shape)
-
-        y = forward_mlp(feat_weapon, self._layers)
+    def images_to_features(self, img_weapons):
+        return np.vstack([self.image_to_feature(img) for img in img_weapons])
+
+    def set_precision(self, precision='float32'):
+        """
+        Set the precision of the weights used in prediction.
+
+        The weights are quantized and converted back to float32 here,
+        once. Only the float32 copy is kept, so prediction runs as fast
+        as the float32 model, with the accuracy of the quantized one.
+
+        Args:
+            precision: 'float32' (the model as is), 'float16' or 'int8'.
+        """
+        if precision == 'float32':
+            self._layers_predict = None
+        else:
+            self._layers_predict = self._quantize(precision)
+        self.precision = precision
+
+    def _quantize(self, precision):
+        return dequantize_layers(quantize_layers(self._layers, precision))
+
+    def _forward(self, features, layers=None):
+        if layers is None:
+            layers = self._layers_predict or self._layers
+        return forward_mlp(features, layers)
+
+    def predict_batch(self, img_weapons):
+        """
+        Predict the weapons in the images at once.
+
+        Args:
+            img_weapons: List of the weapon images.
+        Returns:
+            List of (weapon_key, distance) for each image.
+        """
+        if len(img_weapons) == 0:
+            return []
+        return self.predict_features(self.images_to_features(img_weapons))
+
+    def predict_features(self, features):
+        """
+        Predict the features (a row per image, see images_to_features()).
+
+        Returns:
+            List of (weapon_key, distance) for each row.
+        """
+        y = self._forward(features)
         y_id = np.argmax(y, axis=1)
+        return [(self._weapons_keys[i], 0) for i in y_id]
 
-        # print(y)
-        # print(y_id)
-        # print(self._weapons_keys[y_id[0]])
-        # print(self._weapons_keys.index('sshooter'))
+    def predict(self, img_weapon):
+        return self.predict_batch([img_weapon])[0]
+
+    def compare_precision(self, img_weapons, precision):
+        """
+        Compare the predictions with quantized weights against the
+        float32 model.
+
+        Args:
+            img_weapons: List of the weapon images.
+            precision: 'float16' or 'int8'.
+        Returns:
+            dict of the number of samples, the agreement ratio of the
+            predictions, the max difference of the outputs, the samples
+            predicted differently, the size of the weights (float32 and
+            quantized) and the time of the predictions in msec (float32
+            and quantized).
+        """
+        features = self.images_to_features(img_weapons)
+        layers_quantized = quantize_layers(self._layers, precision)
+        layers = dequantize_layers(layers_quantized)
 
+        t1 = time.time()
+        y_ref = self._forward(features, self._layers)
         t2 = time.time()
-
-        IkaUtils.dprint('%s: predict %s took %s seconds' % (self, self._weapons_keys[y_id[0]], t2-t1))
-
-        return self._weapons_keys[y_id[0]], 0
+        y = self._forward(features, layers)
+        t3 = time.time()
+
+        id_ref = np.argmax(y_ref, axis=1)
+        id_quantized = np.argmax(y, axis=1)
+        mismatches = [
+            (i, self._weapons_keys[id_ref[i]],
+             self._weapons_keys[id_quantized[i]])
+            for i in np.nonzero(id_ref != id_quantized)[0]
+        ]
+
+        return {
+            'precision': precision,
+            'samples': len(img_weapons),
+            'agreement': 1.0 - len(mismatches) / max(1, len(img_weapons)),
+            'max_output_diff': float(np.max(np.abs(y - y_ref))),
+            'mismatches': mismatches,
+            'weight_bytes': weight_bytes(self._layers),
+            'quantized_weight_bytes': weight_bytes(layers_quantized),
+            'msec': (t2 - t1) * 1000,
+            'quantized_msec': (t3 - t2) * 1000,
+        }
 
 if __name__ == '__main__':
     import sys
     obj = WeaponClassifier()
     obj.load_model_from_file()
 
-    img = cv2.imread(sys.argv[1], 1)
-    print(obj.predict(img)[0])
+    imgs = [cv2.imread(filename, 1) for filename in sys.argv[1:]]
+    for result in obj.predict_batch(imgs):
+        print(result[0])
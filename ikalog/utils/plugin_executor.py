@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+#  Plugin executor: runs the event handlers of an output plugin on its
+#  own worker thread, so that slow plugins (network, file I/O) don't
+#  stall the frame loop.
+#
+#  A plugin opts in with the class attributes:
+#
+#    run_in_executor = True
+#    executor_queue_size = 64         # optional
+#    executor_policy = 'drop_oldest'  # optional; see PluginExecutor
+#
+#  Only the game events (see PluginExecutor.is_async_event()) are run on
+#  the worker thread, in the order they were called. The other events
+#  (configuration, GUI, per-frame preview and key events) are called
+#  synchronously as before, since their callers expect them to be done
+#  on return.
+
+import collections
+import copy
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from .ikautils import IkaUtils
+from .profiler import TimingHistogram
+
+
+# Types copied as they are.
+_immutable_types = (str, bytes, int, float, bool, type(None))
+
+
+def _copy_sharing_arrays(obj, memo):
+    """
+    Deep copy, except that numpy arrays are shared. The engine and the
+    scenes replace the images in the context (engine.frame,
+    game.image_*) with new arrays rather than modifying them in place,
+    so copying them is a waste.
+    """
+    if isinstance(obj, _immutable_types) or isinstance(obj, np.ndarray):
+        return obj
+
+    t = type(obj)
+    if t is dict:
+        return {k: _copy_sharing_arrays(v, memo) for k, v in obj.items()}
+    if t is list:
+        return [_copy_sharing_arrays(v, memo) for v in obj]
+    if t is tuple:
+        return tuple(_copy_sharing_arrays(v, memo) for v in obj)
+    return copy.deepcopy(obj, memo)
+
+
+def snapshot_event(context, params=None):
+    """
+    Copy the context and the parameters of the event, since the engine
+    keeps modifying them after the event is queued. The numpy arrays
+    (images) are shared with the engine; the handlers must not modify
+    them.
+
+    Returns:
+        (context, params)
+    """
+    memo = {}
+    if context is not None:
+        engine = context['engine'].copy()  # shallow copy
+        # Python objects which cannot be copied (see
+        # IkaUtils.copy_context()). The references to the engine are
+        # kept, so the plugins can still call it (e.g. call_plugins_later).
+        engine['frame_cache'] = None
+        if engine.get('preview') is not None:
+            # The preview buffer is reused and drawn on by the plugins.
+            engine['preview'] = engine['preview'].copy()
+        engine_ref = engine.pop('engine', None)
+        service = engine.pop('service', {})
+
+        snapshot = context.copy()  # shallow copy
+        snapshot['engine'] = engine
+        snapshot = _copy_sharing_arrays(snapshot, memo)
+        snapshot['engine']['engine'] = engine_ref
+        snapshot['engine']['service'] = service
+        context = snapshot
+
+    if params is not None:
+        try:
+            params = _copy_sharing_arrays(params, memo)
+        except Exception:
+            pass
+
+    return context, params
+
+
+class PluginExecutor(object):
+    """
+    Delivers the events of a plugin on a worker thread.
+
+    The context and the parameters of each event are snapshotted when the
+    event is queued, since the engine keeps modifying them. The snapshots
+    may be shared with the other plugins, so the handlers must not modify
+    them.
+
+    Policies when the queue is full:
+        'block'        Wait for the worker (backpressure on the caller).
+        'drop_oldest'  Discard the oldest queued event.
+        'drop_newest'  Discard the new event.
+    """
+
+    policies = ('block', 'drop_oldest', 'drop_newest')
+
+    async_event_prefixes = ('on_game_', 'on_result_', 'on_lobby_')
+
+    @classmethod
+    def is_async_event(cls, event_name):
+        return event_name.startswith(cls.async_event_prefixes)
+
+    @staticmethod
+    def is_enabled_for(plugin):
+        return bool(getattr(plugin, 'run_in_executor', False))
+
+    def wrap(self, event_name, method, uncaught=False, snapshot=None):
+        """
+        Return a function which queues the call of the method, with the
+        same arguments as the method.
+
+        Args:
+            event_name: The name of the event.
+            method: The event handler of the plugin.
+            uncaught: True if the method is on_uncaught_event().
+            snapshot: Function to copy the context and the parameters.
+                Default: snapshot_event(). The engine passes the one
+                which shares the copies among the plugins.
+        """
+        snapshot = snapshot or snapshot_event
+
+        if uncaught:
+            def queue_uncaught_event(event_name_, context, params=None):
+                context, params = snapshot(context, None)
+                self.put(event_name, method, (event_name_, context))
+            return queue_uncaught_event
+
+        def queue_event(context, params=None):
+            context, params = snapshot(context, params)
+            if params is None:
+                args = (context,)
+            else:
+                args = (context, params)
+            self.put(event_name, method, args)
+        return queue_event
+
+    def put(self, event_name, method, args):
+        with self._cond:
+            if self._stop:
+                return False
+
+            if len(self._queue) >= self.max_queue_size:
+                if self.policy == 'drop_newest':
+                    self.dropped += 1
+                    return False
+                elif self.policy == 'drop_oldest':
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    while (len(self._queue) >= self.max_queue_size) and \
+                            (not self._stop):
+                        self._cond.wait()
+
+            self._queue.append((event_name, method, args, time.time()))
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._cond.notify_all()
+        return True
+
+    def _worker_func(self):
+        while True:
+            with self._cond:
+                while (not self._queue) and (not self._stop):
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                event_name, method, args, time_queued = self._queue.popleft()
+                self._running = True
+                self._cond.notify_all()
+
+            time_start = time.time()
+            try:
+                method(*args)
+            except:
+                IkaUtils.dprint('%s.%s() raised a exception >>>>' %
+                                (self.name, event_name))
+                IkaUtils.dprint(traceback.format_exc())
+                IkaUtils.dprint('<<<<<')
+            time_end = time.time()
+
+            with self._cond:
+                self._running = False
+                self.delivered += 1
+                self._latency.add(time_start - time_queued)
+                self._handler_time.add(time_end - time_start)
+                self._cond.notify_all()
+
+            # The time to queue the event is recorded in the 'plugin'
+            # category by the engine.
+            profiler = self._get_profiler()
+            if profiler is not None:
+                profiler.record(
+                    'executor', '%s.%s' % (self.name, event_name),
+                    time_end - time_start)
+                profiler.record(
+                    'executor', '%s.queue_latency' % self.name,
+                    time_start - time_queued)
+
+    def get_depth(self):
+        return len(self._queue)
+
+    def flush(self, timeout=None):
+        """
+        Wait until the queued events are delivered.
+
+        Returns:
+            True if all the events were delivered.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._queue or self._running:
+                if self._thread is None or not self._thread.is_alive():
+                    return False
+                remaining = None if deadline is None else \
+                    deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=None):
+        """
+        Deliver the queued events and stop the worker thread.
+        """
+        self.flush(timeout)
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def get_stats(self):
+        with self._cond:
+            return {
+                'depth': len(self._queue),
+                'max_depth': self.max_depth,
+                'delivered': self.delivered,
+                'dropped': self.dropped,
+                'latency': self._latency.get_stats(),
+                'handler_time': self._handler_time.get_stats(),
+            }
+
+    def __init__(self, plugin, get_profiler=None, max_queue_size=None,
+                 policy=None):
+        """
+        Constructor
+
+        Args:
+            plugin: The plugin.
+            get_profiler: Function which returns the Profiler (or None) to
+                record the handler time.
+            max_queue_size: Max number of queued events. Default:
+                plugin.executor_queue_size, or 256.
+            policy: The policy when the queue is full. Default:
+                plugin.executor_policy, or 'block'.
+        """
+        self.plugin = plugin
+        self.name = plugin.__class__.__name__
+        self.max_queue_size = max_queue_size or \
+            getattr(plugin, 'executor_queue_size', 256)
+        self.policy = policy or getattr(plugin, 'executor_policy', 'block')
+        assert self.policy in self.policies
+
+        self._get_profiler = get_profiler or (lambda: None)
+        self._cond = threading.Condition()
+        self._queue = collections.deque()
+        self._running = False
+        self._stop = False
+
+        self.max_depth = 0
+        self.delivered = 0
+        self.dropped = 0
+        self._latency = TimingHistogram()
+        self._handler_time = TimingHistogram()
+
+        self._thread = threading.Thread(
+            target=self._worker_func, name='PluginExecutor-%s' % self.name)
+        self._thread.daemon = True
+        self._thread.start()
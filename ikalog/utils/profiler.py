@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import collections
+import csv
+import threading
+import time
+
+import numpy as np
+
+
+class TimingHistogram(object):
+    """
+    Durations of an operation. Percentiles are computed from the recent
+    samples, and the count and total from all of them.
+    """
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self._samples.append(duration)
+
+    def percentile(self, q):
+        if len(self._samples) == 0:
+            return None
+        return float(np.percentile(self._samples, q))
+
+    def get_stats(self):
+        """
+        Returns the stats in msec.
+        """
+        def msec(sec):
+            return None if sec is None else sec * 1000
+
+        return {
+            'count': self.count,
+            'total': msec(self.total),
+            'mean': msec(self.total / self.count) if self.count else None,
+            'p50': msec(self.percentile(50)),
+            'p95': msec(self.percentile(95)),
+            'p99': msec(self.percentile(99)),
+            'max': msec(self.max),
+        }
+
+    def __init__(self, window=1000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples = collections.deque(maxlen=window)
+
+
+class Profiler(object):
+    """
+    Instrumentation of IkaEngine.
+
+    Collects timings of scenes, plugin hooks and frames, frames per
+    second, dropped frames and queue depths. get_stats() returns them as
+    a JSON-serializable dict, and dump_csv() writes the timings.
+    """
+
+    categories = ['engine', 'scene', 'plugin', 'executor']
+
+    def _get_histogram(self, category, name):
+        histograms = self._histograms[category]
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = TimingHistogram(window=self._window)
+            histograms[name] = histogram
+        return histogram
+
+    def record(self, category, name, duration):
+        """
+        Records the duration (in sec) of the operation.
+
+        Args:
+            category: 'engine', 'scene', 'plugin' or 'executor'.
+            name: The name of the operation, e.g. 'GameDead' or
+                'JSON.on_game_killed'.
+            duration: Time took in sec.
+        """
+        with self._lock:
+            self._get_histogram(category, name).add(duration)
+
+    # Plugin hooks
+
+    def plugin_enter(self):
+        self._plugin_depth += 1
+        return time.time()
+
+    def plugin_exit(self, plugin_name, event_name, time_enter):
+        duration = time.time() - time_enter
+        self._plugin_depth -= 1
+
+        # Count only the outermost calls, since nested calls are a part
+        # of them.
+        if self._plugin_depth == 0:
+            self.plugin_time += duration
+
+        self.record('plugin', '%s.%s' % (plugin_name, event_name), duration)
+
+    # Dispatch of events
+
+    def dispatch_enter(self):
+        return (time.time(), self.plugin_time)
+
+    def dispatch_exit(self, event_name, state):
+        """
+        Records the overhead of IkaEngine.call_plugins(): the time not
+        spent in the plugins.
+        """
+        # Nested calls are a part of the plugin which made them.
+        if self._plugin_depth > 0:
+            return
+
+        time_enter, plugin_time = state
+        overhead = (time.time() - time_enter) - \
+            (self.plugin_time - plugin_time)
+        self.dispatch_time += overhead
+        self.record('engine', 'dispatch.%s' % event_name, overhead)
+
+    # Frames
+
+    def frame_done(self, duration):
+        now = time.time()
+        with self._lock:
+            self.frames += 1
+            self._frame_times.append(now)
+            self._get_histogram('engine', 'frame').add(duration)
+
+    def add_dropped_frames(self, frames=1):
+        self.dropped_frames += frames
+
+    def get_fps(self):
+        """
+        Returns frames per second over the recent frames.
+        """
+        frame_times = list(self._frame_times)
+        if len(frame_times) < 2:
+            return None
+
+        duration = frame_times[-1] - frame_times[0]
+        if duration <= 0:
+            return None
+        return (len(frame_times) - 1) / duration
+
+    # Queues
+
+    def set_queue_depth(self, name, depth):
+        queue = self._queues.get(name)
+        if queue is None:
+            queue = {'depth': 0, 'max': 0}
+            self._queues[name] = queue
+        queue['depth'] = depth
+        queue['max'] = max(queue['max'], depth)
+
+    # Output
+
+    def get_stats(self):
+        with self._lock:
+            stats = {
+                'uptime': time.time() - self._time_start,
+                'frames': self.frames,
+                'fps': self.get_fps(),
+                'dropped_frames': self.dropped_frames,
+                'dispatch_time': self.dispatch_time,
+                'queues': dict(
+                    (k, v.copy()) for k, v in self._queues.items()),
+            }
+            for category in self.categories:
+                stats[category] = dict(
+                    (name, histogram.get_stats())
+                    for name, histogram in self._histograms[category].items())
+        return stats
+
+    def _rows(self):
+        stats = self.get_stats()
+        rows = []
+        for category in self.categories:
+            for name in sorted(stats[category].keys()):
+                s = stats[category][name]
+                rows.append([category, name, s['count'], s['total'],
+                             s['mean'], s['p50'], s['p95'], s['p99'],
+                             s['max']])
+        return rows
+
+    def dump_csv(self, filename):
+        """
+        Writes the timings (in msec) to the CSV file.
+        """
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['category', 'name', 'count', 'total', 'mean',
+                             'p50', 'p95', 'p99', 'max'])
+            for row in self._rows():
+                writer.writerow(
+                    [('%.3f' % v) if isinstance(v, float) else v
+                     for v in row])
+
+    def dump(self):
+        """
+        Prints the summary.
+        """
+        def fmt(v):
+            return '-' if v is None else '%.2f' % v
+
+        stats = self.get_stats()
+        print('%d frames, %s fps, %d frames dropped' % (
+            stats['frames'], fmt(stats['fps']), stats['dropped_frames']))
+        print('event dispatch overhead: %.2f ms' % (
+            stats['dispatch_time'] * 1000))
+        for name, queue in sorted(stats['queues'].items()):
+            print('queue %s: depth %d (max %d)' % (
+                name, queue['depth'], queue['max']))
+
+        print('%-8s %-48s %8s %8s %8s %8s %8s' % (
+            'category', 'name', 'count', 'p50', 'p95', 'p99', 'max'))
+        for row in self._rows():
+            category, name, count, total, mean, p50, p95, p99, max_ = row
+            print('%-8s %-48s %8d %8s %8s %8s %8s' % (
+                category, name, count, fmt(p50), fmt(p95), fmt(p99),
+                fmt(max_)))
+
+    def __init__(self, window=1000):
+        """
+        Constructor
+
+        Args:
+            window: Number of the recent samples to compute percentiles
+                and frames per second.
+        """
+        self._window = window
+        self._lock = threading.Lock()
+        self._histograms = dict((c, {}) for c in self.categories)
+        self._queues = {}
+        self._frame_times = collections.deque(maxlen=window)
+        self._time_start = time.time()
+        self._plugin_depth = 0
+
+        self.frames = 0
+        self.dropped_frames = 0
+        # Total time spent in the outermost plugin calls.
+        self.plugin_time = 0.0
+        # Total overhead of dispatching the events to the plugins.
+        self.dispatch_time = 0.0
@@ -17,36 +17,147 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+#  stat.ink uploader.
+#
+#  StatInkUploader posts the battles from a few long-lived worker
+#  threads, over a pooled HTTPS connection. Each battle is kept in the
+#  spool directory as the msgpack body to post, until it is accepted by
+#  stat.ink, so the pending battles survive restarts. Failed posts are
+#  retried with exponential backoff. The spooled body has no API key;
+#  the current key is added at each post.
+#
+#  Spool directory:
+#    <spool_dir>/*.msgpack          Pending battles, posted in the order
+#                                   of the filenames.
+#    <spool_dir>/inflight/<owner>/  Battles claimed by an uploader.
+#    <spool_dir>/failed/*.msgpack   Battles which stat.ink refused (e.g.
+#                                   validation errors). Not retried.
+#
+#  The spool may be shared by processes (e.g. batch mode with --jobs).
+#  An uploader claims a pending battle by moving it into its own
+#  inflight directory (os.replace() is atomic, so only one uploader
+#  wins), and moves the battles it didn't post back on stop(). The
+#  claims left by the processes which have exited are taken over on
+#  start. The other claims are taken over once they get older than
+#  stale_claim_sec; the owner touches its claims at each attempt.
 
+import ctypes
+import heapq
+import itertools
 import json
 import os
-import sys
+import threading
 import time
+import traceback
+import uuid
+
 import umsgpack
 import urllib3
 
 from ikalog.utils import *
 
 
-def UploadToStatInk(payload, api_key, url=None, video_id=None,
-                    show_response=False, dry_run=False):
-    name = 'UploadToStatInk'
-    if not url:
-        url = 'https://stat.ink/api/v1/battle'
+def _create_pool(max_connections=1, timeout=120.0):
+    return urllib3.PoolManager(
+        maxsize=max_connections,
+        block=True,
+        cert_reqs='CERT_REQUIRED',  # Force certificate check
+        ca_certs=Certifi.where(),   # Path to the Certifi bundle.
+        timeout=timeout,            # Timeout (in sec)
+        # Retries are done by StatInkUploader, with backoff.
+        retries=False,
+    )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _create_pool()
+        return _pool
+
 
+def create_body(payload, api_key, video_id=None, dry_run=False):
+    """
+    Returns:
+        The msgpack body (bytes) to post the payload. If api_key is None,
+        the body has no key (see set_api_key()).
+    """
     # Payload data will be modified, so we copy it.
     # It is not deep copy, so only dict object is duplicated.
     payload = payload.copy()
-    payload['apikey'] = api_key
+    if api_key is not None:
+        payload['apikey'] = api_key
     if dry_run:
         payload['test'] = 'dry_run'
 
     if isinstance(video_id, str) and (video_id != ''):
         payload['link_url'] = 'https://www.youtube.com/watch?v=%s' % video_id
 
-    mp_payload_bytes = umsgpack.packb(payload)
-    mp_payload = ''.join(map(chr, mp_payload_bytes))
+    return umsgpack.packb(payload)
+
+
+def set_api_key(body, api_key):
+    """
+    Returns:
+        The msgpack body with the API key.
+    """
+    payload = umsgpack.unpackb(body)
+    payload['apikey'] = api_key
+    return umsgpack.packb(payload)
+
 
+def _is_process_alive(pid):
+    """
+    Returns:
+        False if the process has exited, True if it is running or
+        unknown.
+    """
+    if pid == os.getpid():
+        return True
+
+    if os.name == 'nt':
+        # os.kill() terminates the process on Windows.
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        ERROR_INVALID_PARAMETER = 87
+        STILL_ACTIVE = 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(
+            PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return kernel32.GetLastError() != ERROR_INVALID_PARAMETER
+        try:
+            exit_code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(
+                    handle, ctypes.byref(exit_code)):
+                return True
+            return exit_code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # e.g. PermissionError: running as the other user.
+        pass
+    return True
+
+
+def post_body(pool, url, body, show_response=False):
+    """
+    Post the msgpack body to stat.ink.
+
+    Returns:
+        (error, retry, statink_response). retry is True if the error may
+        be temporary (e.g. network errors, server errors).
+    """
+    name = 'UploadToStatInk'
     http_headers = {
         'Content-Type': 'application/x-msgpack',
     }
@@ -54,34 +165,33 @@ def UploadToStatInk(payload, api_key, url=None, video_id=None,
     IkaUtils.dprint('%s: POST %s' % (name, url))
     time_post_start = time.time()
 
-    pool = urllib3.PoolManager(
-        cert_reqs='CERT_REQUIRED',  # Force certificate check
-        ca_certs=Certifi.where(),   # Path to the Certifi bundle.
-        timeout=120.0,              # Timeout (in sec)
-    )
-
     # Post the payload
 
     try:
-        req = pool.urlopen('POST', url,
-                           headers=http_headers,
-                           body=mp_payload,
-                           )
+        req = pool.urlopen('POST', url, headers=http_headers, body=body)
     except urllib3.exceptions.SSLError as e:
         # Handle incorrect certificate error.
-        IkaUtils.dprint('%s: SSLError, value: %s' % (name, e.value))
+        IkaUtils.dprint('%s: SSLError, value: %s' % (name, e))
+        return True, True, {'error': 'SSLError: %s' % e}
+    except urllib3.exceptions.HTTPError as e:
+        IkaUtils.dprint('%s: HTTP Error: %s' % (name, e))
+        return True, True, {'error': 'HTTP Error: %s' % e}
 
     # Error detection
 
     error = False
+    retry = (req.status >= 500) or (req.status == 429)
     try:
         statink_response = json.loads(req.data.decode('utf-8'))
-        error = 'error' in statink_response
+        error = ('error' in statink_response) or (req.status >= 400)
         if error:
-            IkaUtils.dprint('%s: API Error occured')
+            IkaUtils.dprint('%s: API Error occured (status %d)' %
+                            (name, req.status))
     except:
         error = True
-        IkaUtils.dprint('%s: Stat.ink return non-JSON response')
+        # Not from stat.ink (e.g. a proxy)
+        retry = True
+        IkaUtils.dprint('%s: Stat.ink return non-JSON response' % name)
         statink_response = {
             'error': 'Not a JSON response',
         }
@@ -90,16 +200,458 @@ def UploadToStatInk(payload, api_key, url=None, video_id=None,
 
     if show_response or error:
         IkaUtils.dprint('%s: == Response begin ==' % name)
-        print(req.data.decode('utf-8'))
+        print(req.data.decode('utf-8', 'replace'))
         IkaUtils.dprint('%s: == Response end ===' % name)
 
     IkaUtils.dprint(
         '%s: POST Done. %d bytes in %f second(s).' % (
             name,
-            len(mp_payload),
+            len(body),
             int((time.time() - time_post_start) * 10) / 10,
         )
     )
-    IkaUtils.dprint(statink_response.get('url'))
+    if isinstance(statink_response, dict):
+        IkaUtils.dprint(statink_response.get('url'))
+    else:
+        statink_response = {'response': statink_response}
 
+    return error, retry, statink_response
+
+
+def UploadToStatInk(payload, api_key, url=None, video_id=None,
+                    show_response=False, dry_run=False):
+    if not url:
+        url = 'https://stat.ink/api/v1/battle'
+
+    body = create_body(payload, api_key, video_id, dry_run)
+    error, retry, statink_response = post_body(
+        _get_pool(), url, body, show_response)
     return [error, statink_response]
+
+
+class StatInkUploader(object):
+    """
+    Posts the battles to stat.ink on worker threads.
+
+    Usage:
+        uploader = StatInkUploader(spool_dir='spool/statink',
+                                   api_key=api_key)
+        uploader.submit(payload, callback=func)
+        ...
+        uploader.stop()
+
+    callback(error, statink_response) is called on the worker thread,
+    when the battle is accepted or refused, or when the uploader gives
+    up after max_retries. The battles loaded from the spool directory
+    have no callback.
+    """
+
+    def _get_claim_dir(self):
+        claim_dir = os.path.join(self.spool_dir, 'inflight', self._owner)
+        os.makedirs(claim_dir, exist_ok=True)
+        return claim_dir
+
+    def _write_spool(self, body):
+        if self.spool_dir is None:
+            return None
+
+        basename = '%016d-%s.msgpack' % (
+            int(time.time() * 1000000), uuid.uuid4().hex[:8])
+        # The battle is claimed by this uploader from the beginning.
+        filename = os.path.join(self._get_claim_dir(), basename)
+        # Write to the temporary file first, so the spool has only
+        # complete files.
+        with open(filename + '.tmp', 'wb') as f:
+            f.write(body)
+        os.replace(filename + '.tmp', filename)
+        return filename
+
+    def _claim(self, filename):
+        """
+        Move the battle into the inflight directory of this uploader.
+
+        Returns:
+            (filename, body), or None if the other uploader took it.
+        """
+        claimed = os.path.join(
+            self._get_claim_dir(), os.path.basename(filename))
+        try:
+            os.replace(filename, claimed)
+            os.utime(claimed)
+            with open(claimed, 'rb') as f:
+                return claimed, f.read()
+        except OSError:
+            return None
+
+    def _release(self, job):
+        """
+        Move the battle back to the spool, to be posted by the other
+        uploader or on the next start.
+        """
+        if job['filename'] is None:
+            return
+        try:
+            os.replace(job['filename'], os.path.join(
+                self.spool_dir, os.path.basename(job['filename'])))
+        except OSError:
+            IkaUtils.dprint('%s: Failed to release %s' %
+                            (self, job['filename']))
+
+    def _remove_spool(self, job):
+        if job['filename'] is None:
+            return
+        try:
+            os.remove(job['filename'])
+        except OSError:
+            IkaUtils.dprint('%s: Failed to remove %s' %
+                            (self, job['filename']))
+
+    def _move_spool_to_failed(self, job):
+        if job['filename'] is None:
+            return
+        failed_dir = os.path.join(self.spool_dir, 'failed')
+        try:
+            os.makedirs(failed_dir, exist_ok=True)
+            os.replace(job['filename'], os.path.join(
+                failed_dir, os.path.basename(job['filename'])))
+        except OSError:
+            IkaUtils.dprint('%s: Failed to move %s' %
+                            (self, job['filename']))
+
+    def _load_spool(self):
+        """
+        Queue the battles left in the spool directory.
+        """
+        if self.spool_dir is None:
+            return 0
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+        filenames = [os.path.join(self.spool_dir, basename)
+                     for basename in os.listdir(self.spool_dir)
+                     if basename.endswith('.msgpack')]
+
+        # Claims of the uploaders which have gone.
+        dead_owner_dirs = []
+        inflight_dir = os.path.join(self.spool_dir, 'inflight')
+        if os.path.isdir(inflight_dir):
+            for owner in os.listdir(inflight_dir):
+                if owner == self._owner:
+                    continue
+                owner_dir = os.path.join(inflight_dir, owner)
+                try:
+                    basenames = os.listdir(owner_dir)
+                except OSError:
+                    continue
+                # The owner is '<pid>-<id>'.
+                pid = owner.split('-')[0]
+                dead = pid.isdigit() and not _is_process_alive(int(pid))
+                if dead:
+                    dead_owner_dirs.append(owner_dir)
+                for basename in basenames:
+                    if not basename.endswith('.msgpack'):
+                        continue
+                    filename = os.path.join(owner_dir, basename)
+                    try:
+                        age = time.time() - os.path.getmtime(filename)
+                    except OSError:
+                        continue
+                    if dead or (age > self.stale_claim_sec):
+                        filenames.append(filename)
+
+        count = 0
+        for filename in sorted(filenames, key=os.path.basename):
+            claimed = self._claim(filename)
+            if claimed is None:
+                continue
+            self._put({'filename': claimed[0], 'body': claimed[1],
+                       'api_key': None, 'callback': None, 'attempts': 0})
+            count += 1
+
+        for owner_dir in dead_owner_dirs:
+            try:
+                for basename in os.listdir(owner_dir):
+                    # Incomplete spool files.
+                    os.remove(os.path.join(owner_dir, basename))
+                os.rmdir(owner_dir)
+            except OSError:
+                pass
+
+        if count:
+            IkaUtils.dprint('%s: %d battle(s) left in %s' %
+                            (self, count, self.spool_dir))
+        return count
+
+    def _put(self, job, delay=0.0):
+        with self._cond:
+            heapq.heappush(
+                self._jobs, (time.time() + delay, next(self._seq), job))
+            # flush() and wait_in_flight() wait on the same condition.
+            self._cond.notify_all()
+
+    def submit(self, payload, api_key=None, video_id=None, callback=None):
+        """
+        Queue the battle. The payload is written in the spool directory
+        before this returns, without the API key.
+
+        api_key is kept only in memory. If None, the api_key of the
+        uploader at the time of the post is used.
+        """
+        body = create_body(payload, None, video_id, self.dry_run)
+        filename = self._write_spool(body)
+        self._put({'filename': filename, 'body': body, 'api_key': api_key,
+                   'callback': callback, 'attempts': 0})
+        with self._cond:
+            self.submitted += 1
+
+    def get_backoff(self, attempts):
+        """
+        Returns:
+            Seconds to wait before the retry after the attempts.
+        """
+        return min(self.backoff_max,
+                   self.backoff_base * (2 ** (attempts - 1)))
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                if self._stop:
+                    return None
+                if self._jobs:
+                    due = self._jobs[0][0]
+                    now = time.time()
+                    if due <= now:
+                        job = heapq.heappop(self._jobs)[2]
+                        self._in_flight += 1
+                        return job
+                    self._cond.wait(due - now)
+                else:
+                    self._cond.wait()
+
+    def _finish_job(self, job, error, statink_response):
+        callback = job['callback']
+        if callback is None:
+            return
+        try:
+            callback(error, statink_response)
+        except:
+            IkaUtils.dprint('%s: Exception in the callback' % self)
+            IkaUtils.dprint(traceback.format_exc())
+
+    def _process_job(self, job):
+        job['attempts'] += 1
+        if job['filename'] is not None:
+            # Keep the claim fresh, so the other uploaders won't take it.
+            try:
+                os.utime(job['filename'])
+            except OSError:
+                pass
+
+        api_key = job['api_key'] or self.api_key
+        if not api_key:
+            # Keep the battle in the spool to post once the key is set.
+            IkaUtils.dprint('%s: No API key to post %s' %
+                            (self, job['filename']))
+            self._release(job)
+            with self._cond:
+                self.gave_up += 1
+            self._finish_job(job, True, {'error': 'No API key'})
+            return
+
+        try:
+            body = set_api_key(job['body'], api_key)
+            error, retry, statink_response = post_body(
+                self._pool, self.url, body, self.show_response)
+        except:
+            IkaUtils.dprint(traceback.format_exc())
+            error, retry, statink_response = \
+                True, True, {'error': 'Exception'}
+
+        if not error:
+            self._remove_spool(job)
+            with self._cond:
+                self.uploaded += 1
+            self._finish_job(job, error, statink_response)
+            return
+
+        if not retry:
+            # stat.ink refused the battle. Retrying won't help.
+            self._move_spool_to_failed(job)
+            with self._cond:
+                self.failed += 1
+            self._finish_job(job, error, statink_response)
+            return
+
+        if (self.max_retries is not None) and \
+                (job['attempts'] > self.max_retries):
+            # Keep the battle in the spool to retry on the next start.
+            IkaUtils.dprint('%s: Gave up posting %s' % (self, job['filename']))
+            self._release(job)
+            with self._cond:
+                self.gave_up += 1
+            self._finish_job(job, error, statink_response)
+            return
+
+        delay = self.get_backoff(job['attempts'])
+        IkaUtils.dprint('%s: Retrying in %.1f second(s)' % (self, delay))
+        with self._cond:
+            self.retries += 1
+        self._put(job, delay)
+
+    def _worker_func(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+
+            try:
+                self._process_job(job)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop = False
+        self._load_spool()
+        for i in range(self.max_workers):
+            thread = threading.Thread(
+                target=self._worker_func,
+                name='StatInkUploader-%d' % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """
+        Stop the workers. The battles not posted yet are left in the
+        spool directory.
+        """
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        with self._cond:
+            jobs = [entry[2] for entry in self._jobs]
+            self._jobs = []
+        for job in jobs:
+            self._release(job)
+        if self.spool_dir is not None:
+            try:
+                os.rmdir(os.path.join(self.spool_dir, 'inflight', self._owner))
+            except OSError:
+                # Not created, or the posts still in flight.
+                pass
+
+    def wait_in_flight(self, timeout=None):
+        """
+        Wait until the posts in flight (and the new battles already due)
+        finish. Unlike flush(), this doesn't wait for the retries.
+
+        Returns:
+            True if no posts are in flight.
+        """
+        def busy():
+            if self._in_flight:
+                return True
+            return any(entry[2]['attempts'] == 0 for entry in self._jobs)
+
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while busy():
+                remaining = None if deadline is None else \
+                    deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def flush(self, timeout=None):
+        """
+        Wait until the queued battles are posted (or given up).
+
+        Returns:
+            True if no battles are pending.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._jobs or self._in_flight:
+                remaining = None if deadline is None else \
+                    deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def get_stats(self):
+        with self._cond:
+            return {
+                'pending': len(self._jobs),
+                'in_flight': self._in_flight,
+                'submitted': self.submitted,
+                'uploaded': self.uploaded,
+                'failed': self.failed,
+                'retries': self.retries,
+                'gave_up': self.gave_up,
+            }
+
+    def __init__(self, url=None, spool_dir=None, api_key=None,
+                 max_workers=1, max_retries=8, backoff_base=5.0,
+                 backoff_max=600.0, timeout=120.0, show_response=False,
+                 dry_run=False, stale_claim_sec=3600.0, start=True):
+        """
+        Constructor
+
+        Args:
+            url: The endpoint. Default: https://stat.ink/api/v1/battle
+            api_key: The API key for the battles submitted without a key,
+                and for the battles loaded from the spool directory. May
+                be changed later.
+            spool_dir: The spool directory. None to keep the battles
+                only in memory.
+            max_workers: Number of concurrent posts.
+            max_retries: Number of retries before giving up, or None to
+                retry forever.
+            backoff_base: Seconds to wait before the first retry. The
+                wait is doubled for each retry, up to backoff_max.
+            timeout: Timeout of each post (in sec).
+            show_response: Print the responses.
+            dry_run: Ask stat.ink not to save the battles.
+            stale_claim_sec: Take over the battles claimed by the other
+                running uploaders if not touched for this period (in sec).
+            start: Start the workers.
+        """
+        self.url = url or 'https://stat.ink/api/v1/battle'
+        self.spool_dir = spool_dir
+        self.api_key = api_key
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.show_response = show_response
+        self.dry_run = dry_run
+        self.stale_claim_sec = stale_claim_sec
+
+        self._pool = _create_pool(max_workers, timeout)
+        self._cond = threading.Condition()
+        # (due time, sequence, job). The sequence keeps the order of
+        # battles due at the same time.
+        self._jobs = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._threads = []
+        self._stop = False
+        # Name of the inflight directory of this uploader.
+        self._owner = '%d-%s' % (os.getpid(), uuid.uuid4().hex[:8])
+
+        self.submitted = 0
+        self.uploaded = 0
+        self.failed = 0
+        self.retries = 0
+        self.gave_up = 0
+
+        if start:
+            self.start()
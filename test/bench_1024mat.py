@@ -1,14 +1,12 @@
 import sys
 sys.path.append('lib')
 
-from ikalog.utils.ikamatcher2.reference import Numpy_uint8, Numpy_uint8_fast
-from ikalog.utils.ikamatcher2.arm_neon import NEON
-from lib.ikamatcher2_kernel_hal import HAL
+from ikalog.utils.ikamatcher2.reference import Numpy_uint8, Numpy_uint8_fast, Numpy_1bit
 import numpy as np
 import time
 
 def generate_img():
-    img1 = np.random.randint(2, size=(1024, 1024))
+    img1 = np.random.randint(2, size=(1024, 1024)) * 255
     img2 = np.array(img1, dtype=np.uint8)
     return img2
 
@@ -32,5 +30,16 @@ def test(kernel):
 
 test(Numpy_uint8)
 test(Numpy_uint8_fast)
-test(NEON)
-test(HAL)
+test(Numpy_1bit)
+
+try:
+    from ikalog.utils.ikamatcher2.arm_neon import NEON
+    test(NEON)
+except:
+    print('NEON kernel is not available')
+
+try:
+    from lib.ikamatcher2_kernel_hal import HAL
+    test(HAL)
+except:
+    print('HAL kernel is not available')
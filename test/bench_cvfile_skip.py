@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Benchmark of frame skipping in CVFile.
+#  Usage:
+#    python ./test/bench_cvfile_skip.py [video files...]
+#
+#  Without arguments, 720p60 and 1080p60 videos are generated in a
+#  temporary directory.
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from ikalog.inputs import CVFile, VideoInput
+
+
+def generate_video(filename, width, height, fps=60, seconds=10):
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    writer = cv2.VideoWriter(filename, fourcc, fps, (width, height))
+    img = np.random.randint(256, size=(height, width, 3)).astype(np.uint8)
+    for i in range(fps * seconds):
+        writer.write(np.roll(img, i * 8, axis=1))
+    writer.release()
+
+
+class DecodingCVFile(CVFile):
+    # The previous implementation: decode every skipped frame.
+
+    def _skip_frames_func(self, msec):
+        VideoInput._skip_frames_func(self, msec)
+
+
+def bench(klass, filename, fps):
+    source = klass()
+    source.select_source(name=filename)
+    source.set_frame_rate(fps)
+
+    frames = 0
+    t1 = time.time()
+    while True:
+        try:
+            if source.read_frame() is None:
+                break
+        except EOFError:
+            break
+        frames += 1
+    t2 = time.time()
+
+    print('%-16s %-24s fps=%-4s %4d frames %6.2fs %7.1f frames/sec' % (
+        klass.__name__, os.path.basename(filename), fps, frames, t2 - t1,
+        frames / (t2 - t1)))
+
+if __name__ == '__main__':
+    files = sys.argv[1:]
+    tmp_dir = None
+
+    if not files:
+        tmp_dir = tempfile.mkdtemp()
+        for width, height in [(1280, 720), (1920, 1080)]:
+            filename = os.path.join(tmp_dir, '%dp60.mp4' % height)
+            generate_video(filename, width, height)
+            files.append(filename)
+
+    try:
+        for filename in files:
+            for fps in [10, 5]:
+                bench(DecodingCVFile, filename, fps)
+                bench(CVFile, filename, fps)
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir)
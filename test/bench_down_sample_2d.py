@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Micro-benchmark of IconRecoginizer.down_sample_2d().
+#  Usage:
+#    python ./test/bench_down_sample_2d.py
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
+from ikalog.utils.icon_recoginizer import IconRecoginizer
+from test_icon_recoginizer import down_sample_2d_reference
+
+
+def bench(name, func, src, n=1000):
+    t1 = time.time()
+    for i in range(n):
+        func(src, 12, 12)
+    t2 = time.time()
+    print('%-12s %dx%d %0.3fms/call' % (
+        name, src.shape[1], src.shape[0], (t2 - t1) * 1000 / n))
+
+if __name__ == '__main__':
+    recoginizer = IconRecoginizer()
+    for size in [37, 45, 60]:
+        src = np.random.randint(2, size=(size, size)).astype(np.uint8) * 255
+        bench('reference', down_sample_2d_reference, src)
+        bench('vectorized', recoginizer.down_sample_2d, src)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Benchmark of DeinterlaceFilter and WhiteBalanceFilter.
+#  Usage:
+#    python ./test/bench_input_filters.py
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from ikalog.inputs.filters import DeinterlaceFilter, WhiteBalanceFilter
+
+# The budget for a frame at 60fps.
+budget_msec = 1000.0 / 60
+
+
+def deinterlace_reference(img):
+    # The original implementation.
+    for y in range(img.shape[0])[1::2]:
+        img[y, :] = img[y - 1, :]
+    return img
+
+
+def white_balance_reference(img, coffs):
+    # The original implementation.
+    img_work = np.array(img, np.float32)
+    for n in range(len(coffs)):
+        img_work[:, :, n] = img_work[:, :, n] * coffs[n]
+        img_work[img_work > 255] = 255
+    return np.array(img_work, np.uint8)
+
+
+def bench(name, func, img, n=50):
+    frames = [img.copy() for i in range(n)]
+    t1 = time.time()
+    for frame in frames:
+        func(frame)
+    t2 = time.time()
+
+    msec = (t2 - t1) * 1000 / n
+    print('%-24s %4dx%-4d %7.3fms/frame (%3.0f%% of 60fps budget)' % (
+        name, img.shape[1], img.shape[0], msec, msec / budget_msec * 100))
+
+if __name__ == '__main__':
+    coffs = (1.1, 0.95, 1.2)
+
+    deinterlace = DeinterlaceFilter(None)
+    deinterlace.enable()
+
+    white_balance = WhiteBalanceFilter(None)
+    white_balance.coffs = coffs
+
+    for w, h in [(1280, 720), (1920, 1080)]:
+        img = np.random.randint(256, size=(h, w, 3)).astype(np.uint8)
+
+        assert np.array_equal(deinterlace_reference(img.copy()),
+                              deinterlace.execute(img.copy()))
+        assert np.array_equal(white_balance_reference(img, coffs),
+                              white_balance.execute(img.copy()))
+
+        bench('Deinterlace(reference)', deinterlace_reference, img)
+        bench('DeinterlaceFilter', deinterlace.execute, img)
+        bench('WhiteBalance(reference)',
+              lambda frame: white_balance_reference(frame, coffs), img)
+        bench('WhiteBalanceFilter', white_balance.execute, img)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Benchmark of loading recognizer models: legacy pickles vs model files.
+#  Reports the load (and train) time of each model, and the memory of
+#  worker processes which load all the models.
+#  Usage:
+#    python ./test/bench_model_load.py [--workers 4]
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'tools'))
+from ikalog.utils import IkaUtils
+from convert_models import convert_models, models
+
+
+def load_model(filename, recoginizer_class):
+    recoginizer = recoginizer_class()
+    recoginizer.load_model_from_file(filename)
+    if hasattr(recoginizer, 'knn_train'):
+        recoginizer.knn_train()
+    elif hasattr(recoginizer, 'train'):
+        recoginizer.train()
+    return recoginizer
+
+
+def get_memory():
+    # Rss and Pss (shared pages divided by the number of the processes
+    # sharing them) in KiB. Linux only.
+    memory = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, value = line.split(':', 1)
+                if key in ('Rss', 'Pss'):
+                    memory[key] = int(value.split()[0])
+    except IOError:
+        pass
+    return memory
+
+
+def worker(model_dir, barrier, queue):
+    memory1 = get_memory()
+    recoginizers = []
+    for filename, recoginizer_class in models:
+        filename = os.path.join(model_dir, filename)
+        if os.path.exists(filename):
+            recoginizers.append(load_model(filename, recoginizer_class))
+
+    # Measure while all the workers hold the models.
+    barrier.wait()
+    memory2 = get_memory()
+    barrier.wait()
+    queue.put(dict((k, memory2[k] - memory1[k]) for k in memory2))
+
+
+def bench_workers(name, model_dir, workers):
+    ctx = multiprocessing.get_context('fork')
+    barrier = ctx.Barrier(workers)
+    queue = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(model_dir, barrier, queue))
+                 for i in range(workers)]
+    for p in processes:
+        p.start()
+    results = [queue.get() for p in processes]
+    for p in processes:
+        p.join()
+
+    if results and results[0]:
+        print('%-8s %d workers: Rss +%d KiB, Pss +%d KiB per worker' % (
+            name, workers,
+            sum(r['Rss'] for r in results) / workers,
+            sum(r['Pss'] for r in results) / workers))
+
+
+def bench_load(name, model_dir, n=20):
+    total = 0
+    for filename, recoginizer_class in models:
+        filename = os.path.join(model_dir, filename)
+        if not os.path.exists(filename):
+            continue
+        t1 = time.time()
+        for i in range(n):
+            load_model(filename, recoginizer_class)
+        t2 = time.time()
+        total += (t2 - t1) / n
+        print('%-8s %-28s %0.3fms' % (
+            name, os.path.basename(filename), (t2 - t1) * 1000 / n))
+    print('%-8s %-28s %0.3fms' % (name, 'total', total * 1000))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    legacy_dir = IkaUtils.get_path('data')
+    with tempfile.TemporaryDirectory() as model_dir:
+        convert_models(model_dir)
+
+        bench_load('pickle', legacy_dir)
+        bench_load('mmap', model_dir)
+
+        bench_workers('pickle', legacy_dir, args.workers)
+        bench_workers('mmap', model_dir, args.workers)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Benchmark of packing the deadly weapon samples: the previous per-sample
+#  loops vs samples_codec.
+#  Usage:
+#    python ./test/bench_samples_codec.py
+
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from ikalog.api import samples_codec
+
+
+def pack_legacy(samples):
+    # APIClient.pack_deadly_weapons_image() before samples_codec.
+    h, w = samples[0].shape[0:2]
+    out_image = np.zeros((h * len(samples), w), dtype=np.uint8)
+    last_image = None
+    y = 0
+    for image in samples:
+        if last_image is None:
+            last_image = image
+            diff_image = image
+        else:
+            diff_image = abs(last_image - image)
+        out_image[y: y + h, :] = diff_image
+        y = y + h
+    return out_image
+
+
+def unpack_legacy(img_bytes, h):
+    # APIServer._decode_deadly_weapons_image() and
+    # _unpack_deadly_weapons_image() before samples_codec.
+    samples1 = cv2.imdecode(np.frombuffer(img_bytes, dtype='uint8'), 1)
+    num_samples = int(samples1.shape[0] / h)
+    last_image = None
+    y = 0
+    for i in range(num_samples):
+        image = samples1[y: y + h, :]
+        if last_image is None:
+            last_image = np.array(image, dtype=np.uint8)
+        else:
+            samples1[y:y + h, :] = abs(last_image - image)
+        y = y + h
+    return [samples1[i * h: (i + 1) * h, :] for i in range(num_samples)]
+
+
+def create_samples(rng, n, h=51, w=410):
+    # Binary crops of a death screen; mostly the same as the previous one.
+    samples = []
+    img = (rng.rand(h, w) > 0.9).astype(np.uint8) * 255
+    for i in range(n):
+        if rng.rand() < 0.1:
+            img = (rng.rand(h, w) > 0.9).astype(np.uint8) * 255
+        samples.append(img)
+    return samples
+
+
+def bench(name, func, n=100):
+    func()
+    t1 = time.time()
+    for i in range(n):
+        result = func()
+    t2 = time.time()
+    print('%-36s %0.3fms' % (name, (t2 - t1) * 1000 / n))
+    return result
+
+if __name__ == '__main__':
+    rng = np.random.RandomState(0)
+    for n in (10, 50):
+        samples = create_samples(rng, n)
+        h = samples[0].shape[0]
+
+        data_legacy = bench(
+            'legacy encode (%d samples)' % n,
+            lambda: cv2.imencode('.png', pack_legacy(samples))[1].tobytes())
+        bench('legacy decode (%d samples)' % n,
+              lambda: unpack_legacy(data_legacy, h))
+
+        data = bench('codec encode (%d samples)' % n,
+                     lambda: samples_codec.encode_samples(samples))
+        bench('codec decode (%d samples)' % n,
+              lambda: samples_codec.decode_samples(data, h))
+
+        print('payload: legacy %d bytes, codec %d bytes' % (
+            len(data_legacy), len(data)))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Benchmark of WeaponClassifier: predict() per player vs predict_batch(),
+#  with float32/float16/int8 weights.
+#  Uses data/weapons.nn.data, or a random model of the same input size if
+#  the model is not available.
+#  Usage:
+#    python ./test/bench_weapon_classifier.py [--hidden 256]
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from ikalog.utils import IkaUtils
+from ikalog.utils.neuralnet.functions import relu
+from ikalog.utils.neuralnet.weapon import WeaponClassifier
+
+# Size of the weapon image in ResultDetail.
+width, height = 47, 45
+
+
+def create_classifier(hidden, classes=100):
+    classifier = WeaponClassifier()
+    filename = IkaUtils.get_path('data', 'weapons.nn.data')
+    if os.path.exists(filename):
+        classifier.load_model_from_file(filename)
+        return classifier
+
+    print('%s not found; using a random model' % filename)
+    rng = np.random.RandomState(0)
+    classifier._weapons_keys = ['weapon%d' % i for i in range(classes)]
+    classifier._layers = [
+        {'weight': rng.randn(hidden, width * height * 3).astype(np.float32),
+         'bias': rng.randn(hidden).astype(np.float32), 'activation': relu},
+        {'weight': rng.randn(classes, hidden).astype(np.float32)},
+    ]
+    return classifier
+
+
+def bench(name, func, n=200):
+    func()
+    t1 = time.time()
+    for i in range(n):
+        func()
+    t2 = time.time()
+    print('%-24s %0.3fms' % (name, (t2 - t1) * 1000 / n))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hidden', type=int, default=256)
+    parser.add_argument('--players', type=int, default=8)
+    args = parser.parse_args()
+
+    classifier = create_classifier(args.hidden)
+    rng = np.random.RandomState(1)
+    images = [rng.randint(0, 256, (height, width, 3)).astype(np.uint8)
+              for i in range(args.players)]
+
+    for precision in ('float32', 'float16', 'int8'):
+        classifier.set_precision(precision)
+        bench('%s predict' % precision,
+              lambda: [classifier.predict(img) for img in images])
+        bench('%s predict_batch' % precision,
+              lambda: classifier.predict_batch(images))
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for decode-ahead of VideoInput.
+#  Usage:
+#    python ./test_decode_ahead.py
+#  or
+#    py.test ./test_decode_ahead.py
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import cv2
+import numpy as np
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from ikalog.inputs import CVFile, VideoInput
+
+_frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+
+
+class FakeInput(VideoInput):
+    """
+    Returns the items of the script in order; 'frame', None or an
+    exception. The timestamp is 100 msec per read.
+    """
+
+    def _initialize_driver_func(self):
+        pass
+
+    def _cleanup_driver_func(self):
+        pass
+
+    def _is_active_func(self):
+        return True
+
+    def _read_frame_func(self):
+        with self.reads_lock:
+            self.reads += 1
+            item = self.script[self.reads - 1] if self.script else 'frame'
+        if self.read_delay:
+            time.sleep(self.read_delay)
+        if isinstance(item, Exception):
+            raise item
+        return _frame if item == 'frame' else None
+
+    def _get_current_timestamp_func(self):
+        return self.reads * 100
+
+    def __init__(self, script=None, recorded=True, read_delay=0.0):
+        self.script = script
+        self.cap_recorded_video = recorded
+        self.read_delay = read_delay
+        self.reads = 0
+        self.reads_lock = threading.Lock()
+        super(FakeInput, self).__init__()
+
+
+class TestDecodeAhead(unittest.TestCase):
+
+    def _read(self, source):
+        # Returns (frame or None, msec).
+        img = source.read_frame()
+        return img, source.get_current_timestamp()
+
+    def _wait_for(self, condition, timeout=2.0):
+        deadline = time.time() + timeout
+        while not condition():
+            if time.time() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def test_order(self):
+        # Frames queued before EOF are returned first.
+        source = FakeInput(['frame', 'frame', EOFError(), 'frame'])
+        source.set_decode_ahead(4)
+
+        self.assertIs(self._read(source)[0], _frame)
+        self.assertEqual(source.get_current_timestamp(), 100)
+        self.assertEqual(self._read(source)[1], 200)
+        with self.assertRaises(EOFError):
+            source.read_frame()
+        # The producer waited for the consumer to handle EOF.
+        self.assertEqual(source.reads, 3)
+        thread = source._decode_ahead_thread
+
+        self.assertEqual(self._read(source)[1], 400)
+        self.assertIs(source._decode_ahead_thread, thread)
+        source.set_decode_ahead(0)
+
+    def test_none_frame(self):
+        # The producer keeps running over failed reads.
+        source = FakeInput(['frame', None, 'frame', 'frame'])
+        source.set_decode_ahead(4)
+
+        self.assertIs(self._read(source)[0], _frame)
+        thread = source._decode_ahead_thread
+        self.assertEqual(self._read(source), (None, 200))
+        time.sleep(0.2)
+        # Paused until the next read_frame().
+        self.assertEqual(source.reads, 2)
+
+        self.assertEqual(self._read(source)[1], 300)
+        self.assertEqual(self._read(source)[1], 400)
+        self.assertIs(source._decode_ahead_thread, thread)
+        self.assertTrue(thread.is_alive())
+        source.set_decode_ahead(0)
+        self.assertFalse(thread.is_alive())
+
+    def test_bounded_depth(self):
+        # Recorded videos: the producer waits while the queue is full.
+        source = FakeInput()
+        source.set_decode_ahead(3)
+
+        self.assertEqual(self._read(source)[1], 100)
+        self.assertTrue(
+            self._wait_for(lambda: source.get_decode_ahead_depth() == 3))
+        time.sleep(0.2)
+        self.assertEqual(source.get_decode_ahead_depth(), 3)
+        # Three frames in the queue, and one waiting to be queued.
+        self.assertEqual(source.reads, 5)
+        self.assertEqual(source.dropped_frames, 0)
+
+        # No frames are lost.
+        msecs = [self._read(source)[1] for i in range(5)]
+        self.assertEqual(msecs, [200, 300, 400, 500, 600])
+        source.set_decode_ahead(0)
+
+    def test_drop_oldest(self):
+        # Live sources: the oldest frames are dropped.
+        source = FakeInput(recorded=False, read_delay=0.005)
+        source.set_decode_ahead(3)
+
+        self.assertEqual(self._read(source)[1], 100)
+        self.assertTrue(self._wait_for(lambda: source.dropped_frames > 5))
+        self.assertLessEqual(source.get_decode_ahead_depth(), 3)
+
+        msec = self._read(source)[1]
+        self.assertGreater(msec, 500)
+        source.set_decode_ahead(0)
+
+
+class TestCVFileDecodeAhead(unittest.TestCase):
+
+    fps = 10
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'test.avi')
+        fourcc = cv2.VideoWriter_fourcc(*'MJPG')
+        writer = cv2.VideoWriter(self.filename, fourcc, self.fps, (1280, 720))
+        for i in range(30):
+            img = np.zeros((720, 1280, 3), dtype=np.uint8)
+            img[:, :] = i * 8
+            writer.write(img)
+        writer.release()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _create_source(self):
+        source = CVFile()
+        source.select_source(name=self.filename)
+        if not source.is_active():
+            self.skipTest('OpenCV cannot read the video')
+        source.set_decode_ahead(4)
+        return source
+
+    def _read_msec(self, source):
+        img = source.read_frame()
+        self.assertIsNotNone(img)
+        return source.get_current_timestamp()
+
+    def test_set_pos_msec(self):
+        source = self._create_source()
+        self._read_msec(source)
+        self._read_msec(source)
+        self.assertIsNotNone(source._decode_ahead_thread)
+
+        # The frames decoded ahead are discarded.
+        source.set_pos_msec(2000)
+        self.assertIsNone(source._decode_ahead_thread)
+        self.assertGreaterEqual(self._read_msec(source), 2000)
+        source.set_decode_ahead(0)
+
+    def test_set_end_pos_msec(self):
+        source = self._create_source()
+        self._read_msec(source)
+
+        source.set_end_pos_msec(1000)
+        self.assertIsNone(source._decode_ahead_thread)
+        msecs = []
+        with self.assertRaises(EOFError):
+            for i in range(30):
+                msecs.append(self._read_msec(source))
+        self.assertTrue(msecs)
+        self.assertLessEqual(max(msecs), 1000)
+        source.set_decode_ahead(0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for CVFile.
+#  Usage:
+#    python ./test_opencv_file.py
+#  or
+#    py.test ./test_opencv_file.py
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from ikalog.inputs import CVFile
+
+
+class TestCVFile(unittest.TestCase):
+
+    def setUp(self):
+        # 5 seconds at 10 fps.
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'test.avi')
+        fourcc = cv2.VideoWriter_fourcc(*'MJPG')
+        writer = cv2.VideoWriter(self.filename, fourcc, 10, (1280, 720))
+        for i in range(50):
+            img = np.zeros((720, 1280, 3), dtype=np.uint8)
+            img[:, :] = i * 4
+            writer.write(img)
+        writer.release()
+
+        self.source = CVFile()
+        self.source.select_source(name=self.filename)
+        if not self.source.is_active():
+            self.skipTest('OpenCV cannot read the video')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_skip_frames_by_grab(self):
+        self.source.set_end_pos_msec(1500)
+        self.source._skip_frames_func(1000)
+        with self.assertRaises(EOFError):
+            self.source._skip_frames_func(2000)
+
+    def test_skip_frames_by_seek(self):
+        # The seek lands past the end position.
+        self.source.seek_threshold_msec = 1000
+        self.source.set_end_pos_msec(1500)
+        with self.assertRaises(EOFError):
+            self.source._skip_frames_func(3000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for the MJPEG preview of RESTAPIServer.
+#  Usage:
+#    python ./test_webserver_preview.py
+#  or
+#    py.test ./test_webserver_preview.py
+
+import os
+import socket
+import sys
+import threading
+import unittest
+
+import cv2
+import numpy as np
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from ikalog.outputs.webserver.preview import PreviewBroadcaster
+from ikalog.outputs.webserver.server import (
+    HTTPRequestHandler, RESTAPIServer, ThreadedHTTPServer)
+
+
+def create_frame(value):
+    frame = np.zeros((72, 128, 3), dtype=np.uint8)
+    frame[:, :, 1] = value
+    return frame
+
+
+def decode_part(part):
+    header, jpeg = part.split(b'\r\n\r\n', 1)
+    return header, cv2.imdecode(np.frombuffer(jpeg, np.uint8), 1)
+
+
+class TestPreviewBroadcaster(unittest.TestCase):
+
+    def test_shared_encoding(self):
+        broadcaster = PreviewBroadcaster()
+        broadcaster.publish(create_frame(100))
+
+        parts = [broadcaster.get_part() for i in range(3)]
+        self.assertEqual(broadcaster.get_stats()['encodes'], 1)
+        self.assertIs(parts[1][1], parts[0][1])
+        self.assertIs(parts[2][1], parts[0][1])
+
+        header, img = decode_part(parts[0][1])
+        self.assertIn(b'Content-type: image/jpeg', header)
+        self.assertEqual(img.shape, (72, 128, 3))
+
+        # Each setting is encoded separately.
+        serial, part = broadcaster.get_part(width=64, quality=50)
+        header, img = decode_part(part)
+        self.assertEqual(img.shape, (36, 64, 3))
+        self.assertEqual(broadcaster.get_stats()['encodes'], 2)
+
+        # The new frame is encoded again.
+        broadcaster.publish(create_frame(200))
+        serial2, part = broadcaster.get_part()
+        self.assertEqual(serial2, serial + 1)
+        self.assertEqual(broadcaster.get_stats()['encodes'], 3)
+
+    def test_width(self):
+        broadcaster = PreviewBroadcaster()
+        broadcaster.publish(create_frame(100))
+
+        # Not upscaled, and shares the encoding with the full size.
+        broadcaster.get_part()
+        serial, part = broadcaster.get_part(width=100000)
+        self.assertEqual(decode_part(part)[1].shape, (72, 128, 3))
+        self.assertEqual(broadcaster.get_stats()['encodes'], 1)
+
+        serial, part = broadcaster.get_part(width=1)
+        self.assertEqual(decode_part(part)[1].shape, (1, 1, 3))
+
+    def test_max_parts(self):
+        broadcaster = PreviewBroadcaster(max_parts=2)
+        broadcaster.publish(create_frame(100))
+        for quality in range(10):
+            broadcaster.get_part(quality=quality)
+        self.assertEqual(list(broadcaster._parts.keys()),
+                         [(None, 8), (None, 9)])
+
+    def test_wait_frame(self):
+        broadcaster = PreviewBroadcaster()
+        results = []
+
+        def client(serial=0):
+            results.append(broadcaster.wait_frame(serial, timeout=10))
+
+        threads = [threading.Thread(target=client) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        broadcaster.publish(create_frame(100))
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(results, [1, 1, 1])
+
+        # Timed out.
+        self.assertIsNone(broadcaster.wait_frame(1, timeout=0.01))
+
+        # stop() wakes up the clients.
+        thread = threading.Thread(target=client, args=(1,))
+        thread.start()
+        broadcaster.stop()
+        thread.join(10)
+        self.assertIsNone(results[-1])
+
+
+class TestPreviewStream(unittest.TestCase):
+
+    def setUp(self):
+        self.plugin = RESTAPIServer(preview_max_fps=None)
+        self.httpd = ThreadedHTTPServer(('localhost', 0), HTTPRequestHandler)
+        self.httpd.ikalog_context = {}
+        self.httpd.parent = self.plugin
+        thread = threading.Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.plugin.on_stop({})
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def read_part(self, f):
+        while True:
+            line = f.readline()
+            if line.startswith(b'Content-length'):
+                length = int(line.split(b':')[1])
+            elif line == b'\r\n':
+                return f.read(length)
+
+    def test_stream(self):
+        sockets = []
+        for i in range(3):
+            sock = socket.create_connection(self.httpd.server_address)
+            sock.sendall(b'GET /api/v1/engine/preview?width=64 HTTP/1.0\r\n'
+                         b'\r\n')
+            f = sock.makefile('rb')
+            self.assertIn(b'200', f.readline())
+            # Skip the response header.
+            while f.readline() != b'\r\n':
+                pass
+            sockets.append((sock, f))
+
+        while self.plugin._preview.clients < 3:
+            threading.Event().wait(0.01)
+
+        context = {'engine': {'frame': create_frame(100)}}
+        self.plugin.on_show_preview(context)
+
+        for sock, f in sockets:
+            jpeg = self.read_part(f)
+            img = cv2.imdecode(np.frombuffer(jpeg, np.uint8), 1)
+            self.assertEqual(img.shape, (36, 64, 3))
+
+        # One encoding for all the clients.
+        self.assertEqual(self.plugin._preview.get_stats()['encodes'], 1)
+
+        for sock, f in sockets:
+            f.close()
+            sock.close()
+
+    def test_stream_params(self):
+        # Out of range parameters are clamped.
+        sock = socket.create_connection(self.httpd.server_address)
+        sock.sendall(b'GET /api/v1/engine/preview?width=-5&quality=1000 '
+                     b'HTTP/1.0\r\n\r\n')
+        f = sock.makefile('rb')
+        self.assertIn(b'200', f.readline())
+        while f.readline() != b'\r\n':
+            pass
+
+        while self.plugin._preview.clients < 1:
+            threading.Event().wait(0.01)
+        context = {'engine': {'frame': create_frame(100)}}
+        self.plugin.on_show_preview(context)
+
+        jpeg = self.read_part(f)
+        img = cv2.imdecode(np.frombuffer(jpeg, np.uint8), 1)
+        self.assertEqual(img.shape, (1, 1, 3))
+        self.assertEqual(list(self.plugin._preview._parts.keys()),
+                         [(1, 100)])
+        f.close()
+        sock.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for the recognizer API client.
+#  Usage:
+#    python ./test_api_client.py
+#  or
+#    py.test ./test_api_client.py
+
+import os
+import socket
+import sys
+import threading
+import unittest
+
+import cv2
+import numpy as np
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+base_dir = os.path.join(os.path.dirname(__file__), '..')
+sys.path.append(base_dir)
+from ikalog.api import APIClient, samples_codec
+from ikalog.api.server import create_server
+
+
+@unittest.skipUnless(
+    os.path.exists(os.path.join(base_dir, 'data', 'gearpowers.knn.data')),
+    'gearpowers.knn.data is not available')
+class TestAPIClient(unittest.TestCase):
+
+    def setUp(self):
+        self.httpd = create_server(port=0, verbose=False)
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base_uri = 'http://localhost:%d' % self.httpd.server_address[1]
+
+        rng = np.random.RandomState(0)
+        self.imgs = [cv2.GaussianBlur(
+            rng.randint(256, size=(37, 37, 3)).astype(np.uint8), (5, 5), 0)
+            for i in range(6)]
+        self.expected = APIClient(local_mode=True).recoginize_abilities(
+            self.imgs)
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.httpd.api_server.stop()
+
+    def test_image_formats(self):
+        for image_format in ('png', 'raw'):
+            client = APIClient(base_uri=self.base_uri, fallback=False,
+                               image_format=image_format)
+            try:
+                assert client.recoginize_abilities(self.imgs) == \
+                    self.expected
+            finally:
+                client.close()
+
+        # Grayscale images are recognized as BGR images.
+        imgs_gray = [cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                     for img in self.imgs]
+        imgs_bgr = [cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+                    for img in imgs_gray]
+        client = APIClient(base_uri=self.base_uri, fallback=False,
+                           image_format='raw')
+        try:
+            assert client.recoginize_abilities(imgs_gray) == \
+                APIClient(local_mode=True).recoginize_abilities(imgs_bgr)
+        finally:
+            client.close()
+
+    def test_keep_alive(self):
+        client = APIClient(base_uri=self.base_uri, fallback=False)
+        try:
+            for i in range(3):
+                client.recoginize_abilities(self.imgs)
+            pool = client._pool.connection_from_url(self.base_uri)
+            assert pool.num_connections == 1
+        finally:
+            client.close()
+
+    def test_async(self):
+        client = APIClient(base_uri=self.base_uri, fallback=False)
+        try:
+            futures = [client.recoginize_abilities_async(self.imgs)
+                       for i in range(4)]
+            for future in futures:
+                assert future.result() == self.expected
+        finally:
+            client.close()
+
+    def test_fallback(self):
+        # A port nobody listens on.
+        s = socket.socket()
+        s.bind(('localhost', 0))
+        base_uri = 'http://localhost:%d' % s.getsockname()[1]
+        s.close()
+
+        client = APIClient(base_uri=base_uri, retries=0)
+        assert client.recoginize_abilities(self.imgs) == self.expected
+
+        client = APIClient(base_uri=base_uri, fallback=False, retries=0)
+        self.assertRaises(Exception, client.recoginize_abilities, self.imgs)
+
+class TestDeadlyWeaponsEncoding(unittest.TestCase):
+
+    def _create_client(self, v2):
+        # Stands for a server with or without the XOR codec.
+        client = APIClient(local_mode=True)
+        self.requests = []
+
+        def request_func(path, payload):
+            self.requests.append(path)
+            if path == '/api/v2/recoginizer/deadly_weapon':
+                if not v2:
+                    return {'status': 'error',
+                            'description': 'Invalid API Path %s' % path}
+                samples = samples_codec.decode_samples(
+                    payload['samples'], payload['sample_height'])
+            else:
+                samples = samples_codec.decode_samples_legacy(
+                    payload['samples'], payload['sample_height'])
+            assert np.array_equal(samples, np.stack(self.samples))
+            return {'status': 'ok'}
+
+        client._request_func = request_func
+        return client
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.samples = [(rng.rand(5, 8) > 0.5).astype(np.uint8) * 255
+                        for i in range(4)]
+
+    def test_xor(self):
+        client = self._create_client(v2=True)
+        for i in range(2):
+            assert client.recoginize_deadly_weapons(self.samples)['status'] \
+                == 'ok'
+        assert self.requests == ['/api/v2/recoginizer/deadly_weapon'] * 2
+
+    def test_legacy_server(self):
+        # Old servers reject the path, and never decode the XOR codec as
+        # the legacy format.
+        client = self._create_client(v2=False)
+        for i in range(2):
+            assert client.recoginize_deadly_weapons(self.samples)['status'] \
+                == 'ok'
+        assert self.requests == [
+            '/api/v2/recoginizer/deadly_weapon',
+            '/api/v1/recoginizer/deadly_weapon',
+            '/api/v1/recoginizer/deadly_weapon',
+        ]
+
+if __name__ == '__main__':
+    unittest.main()
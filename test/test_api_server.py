@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for the recognizer API server.
+#  Usage:
+#    python ./test_api_server.py
+#  or
+#    py.test ./test_api_server.py
+
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+
+import cv2
+import numpy as np
+import umsgpack
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+base_dir = os.path.join(os.path.dirname(__file__), '..')
+sys.path.append(base_dir)
+from ikalog.api.server import MicroBatcher, create_server, \
+    get_gearpower_recoginizer
+
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def _predict_concurrently(self, batcher, requests):
+        results = [None] * len(requests)
+
+        def worker(i):
+            results[i] = batcher.predict(requests[i])
+
+        threads = [threading.Thread(target=worker, args=(i,))
+                   for i in range(len(requests))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_batching(self):
+        batch_sizes = []
+
+        def batch_func(items):
+            batch_sizes.append(len(items))
+            time.sleep(0.01)
+            return [item * 10 for item in items]
+
+        batcher = MicroBatcher('test', batch_func, max_batch_size=8,
+                               max_wait=0.05)
+        try:
+            requests = [[i * 2, i * 2 + 1] for i in range(8)]
+            results = self._predict_concurrently(batcher, requests)
+        finally:
+            batcher.stop()
+
+        for request, result in zip(requests, results):
+            assert result == [item * 10 for item in request]
+
+        # The requests are coalesced, and never exceed max_batch_size.
+        assert sum(batch_sizes) == 16
+        assert len(batch_sizes) < 8
+        assert max(batch_sizes) <= 8
+
+        stats = batcher.get_stats()
+        assert stats['requests'] == 8
+        assert stats['items'] == 16
+        assert stats['batches'] == len(batch_sizes)
+        assert stats['queue_depth'] == 0
+
+    def test_exception(self):
+        def batch_func(items):
+            raise ValueError('test')
+
+        batcher = MicroBatcher('test', batch_func, max_wait=0)
+        try:
+            self.assertRaises(ValueError, batcher.predict, [1])
+            assert batcher.predict([]) == []
+        finally:
+            batcher.stop()
+
+    def test_stop(self):
+        batcher = MicroBatcher('test', lambda items: items)
+        batcher.stop()
+        self.assertRaises(RuntimeError, batcher.predict, [1])
+
+    def test_stop_pending(self):
+        # Requests queued without the worker fail on stop().
+        batcher = MicroBatcher('test', lambda items: items)
+        batcher.stop()
+        batcher._stop = False
+        errors = []
+
+        def worker():
+            try:
+                batcher.predict([1])
+            except RuntimeError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        while batcher.get_stats()['queue_depth'] == 0:
+            time.sleep(0.01)
+        batcher.stop()
+        thread.join(10)
+        assert not thread.is_alive()
+        assert len(errors) == 1
+
+
+class TestAPIServer(unittest.TestCase):
+
+    def setUp(self):
+        self.httpd = create_server(port=0, verbose=False)
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.conn = http.client.HTTPConnection(
+            'localhost', self.httpd.server_address[1], timeout=10)
+
+    def tearDown(self):
+        self.conn.close()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.httpd.api_server.stop()
+
+    def _request(self, method, path, payload=None):
+        body = None if payload is None else umsgpack.packb(payload)
+        self.conn.request(method, path, body=body)
+        response = self.conn.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+
+    def test_keep_alive(self):
+        status, response = self._request(
+            'POST', '/api/v1/recoginizer/invalid', [])
+        assert response['status'] == 'error'
+        sock = self.conn.sock
+
+        status, metrics = self._request('GET', '/metrics')
+        assert status == 200
+        assert self.conn.sock is sock
+        assert 'weapon' in metrics['batchers']
+        assert metrics['batchers']['weapon']['queue_depth'] == 0
+
+        status, response = self._request('GET', '/')
+        assert status == 404
+
+    @unittest.skipUnless(
+        os.path.exists(os.path.join(base_dir, 'data', 'gearpowers.knn.data')),
+        'gearpowers.knn.data is not available')
+    def test_abilities(self):
+        rng = np.random.RandomState(0)
+        imgs = [cv2.GaussianBlur(
+            rng.randint(256, size=(37, 37, 3)).astype(np.uint8), (5, 5), 0)
+            for i in range(4)]
+        payload = [cv2.imencode('.png', img)[1].tostring() for img in imgs]
+
+        status, response = self._request(
+            'POST', '/api/v1/recoginizer/ability', payload)
+        assert response['status'] == 'ok', response
+
+        abilities = get_gearpower_recoginizer()
+        expected = [abilities.predict(img)[0] for img in imgs]
+        assert [e['ability'] for e in response['abilities']] == expected
+
+        status, metrics = self._request('GET', '/metrics')
+        assert metrics['batchers']['ability']['items'] == 4
+        assert metrics['requests']['/api/v1/recoginizer/ability']['count'] == 1
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for batch analysis.
+#  Usage:
+#    python ./test_batch.py
+#  or
+#    py.test ./test_batch.py
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from ikalog.batch import BatchAnalyzer, find_games, find_segments
+
+
+def _samples(timeline):
+    # timeline: string of 'g' (in game), 'l' (lobby) and '.' per second.
+    return [{'msec': i * 1000, 'in_game': c == 'g', 'lobby': c == 'l'}
+            for i, c in enumerate(timeline)]
+
+
+class _Config(object):
+    # Stands for IkaConfig.
+
+    def __init__(self, output_plugins, output_args):
+        self.OUTPUT_PLUGINS = output_plugins
+        self.OUTPUT_ARGS = output_args
+
+
+class _BatchAnalyzer(BatchAnalyzer):
+
+    def _get_config(self):
+        return self.config
+
+    def __init__(self, opts, config=None):
+        super(_BatchAnalyzer, self).__init__(opts, jobs=2)
+        self.config = config
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_find_games(self):
+        samples = _samples('..ggg.gg' + '.' * 30 + 'gg..')
+        assert find_games(samples) == [(2000, 7000), (38000, 39000)]
+
+    def test_find_segments_at_lobby(self):
+        samples = _samples('.ggg' + '.' * 20 + 'l.l' + '.' * 20 + 'ggg..')
+        assert find_segments(samples) == [(0, 26000), (26000, None)]
+
+    def test_find_segments_with_margin(self):
+        samples = _samples('.ggg' + '.' * 40 + 'ggg..')
+        assert find_segments(samples, pre_margin_msec=10000) == \
+            [(0, 34000), (34000, None)]
+
+        # The split point never goes back into the previous game.
+        samples = _samples('.ggg' + '.' * 16 + 'ggg..')
+        assert find_segments(samples, pre_margin_msec=60000) == \
+            [(0, 3000), (3000, None)]
+
+    def test_find_segments_short_gap(self):
+        # Back-to-back games: the pre-roll of the next game (its start
+        # screen) wins over the result screens of the previous game.
+        samples = _samples('.ggg' + '.' * 30 + 'ggg..')
+        assert find_segments(samples) == [(0, 14000), (14000, None)]
+
+    def test_find_segments_no_games(self):
+        assert find_segments(_samples('....')) == [(0, None)]
+
+
+class TestBatchAnalyzer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _path(self, *names):
+        return os.path.join(self.tmp_dir, *names)
+
+    def _write(self, filename, data):
+        with open(filename, 'w') as f:
+            f.write(data)
+
+    def _read(self, filename):
+        with open(filename) as f:
+            return f.read()
+
+    def test_merge_appended_file(self):
+        self._write(self._path('log.txt'), 'old\n')
+        self._write(self._path('0.txt'), 'a\n')
+        self._write(self._path('2.txt'), 'c\n')
+
+        _BatchAnalyzer({})._merge_appended_file(
+            self._path('log.txt'),
+            [self._path('%d.txt' % i) for i in range(3)])
+        assert self._read(self._path('log.txt')) == 'old\na\nc\n'
+
+    def test_merge_numbered_files(self):
+        # Task 0 had two games, task 1 none, and task 2 one.
+        self._write(self._path('t0.json'), 'a')
+        self._write(self._path('t0-1.json'), 'b')
+        self._write(self._path('t2.json'), 'c')
+
+        _BatchAnalyzer({})._merge_numbered_files(
+            self._path('out.json'),
+            [self._path('t%d.json' % i) for i in range(3)])
+        assert self._read(self._path('out.json')) == 'a'
+        assert self._read(self._path('out-1.json')) == 'b'
+        assert self._read(self._path('out-2.json')) == 'c'
+        assert not os.path.exists(self._path('out-3.json'))
+
+    def test_create_tasks(self):
+        config = _Config(['CSV', 'Screen'],
+                         {'CSV': {'csv_filename': 'ika.csv'}})
+        analyzer = _BatchAnalyzer(
+            {'output_json': 'out.json', 'statink_payload': None}, config)
+        tasks = analyzer._create_tasks(
+            [('a.mp4', None), ('b.mp4', (0, 1000)), ('b.mp4', (1000, None))],
+            self.tmp_dir)
+
+        assert [t['index'] for t in tasks] == [0, 1, 2]
+        assert [t['segment'] for t in tasks] == \
+            [None, (0, 1000), (1000, None)]
+        assert tasks[1]['outputs'] == {
+            'output_json': self._path('output_json.1.json'),
+            'output_csv': self._path('output_csv.1.csv'),
+        }
+        assert 'Screen' in tasks[0]['disabled_outputs']
+
+    def test_config_outputs(self):
+        # Logs configured in IkaConfig are merged, too.
+        config = _Config(['JSON', 'CSV'], {
+            'JSON': {'json_filename': 'ika.json', 'append_data': False},
+            'CSV': {'csv_filename': '__INPUT_FILE__.csv'},
+        })
+        analyzer = _BatchAnalyzer({}, config)
+        assert analyzer._get_output_filename('output_json') == 'ika.json'
+        assert analyzer._get_output_filename('output_csv') == \
+            '__INPUT_FILE__.csv'
+        assert analyzer._get_output_filename('statink_payload') is None
+
+        # Not configured.
+        analyzer = _BatchAnalyzer({}, _Config([], {}))
+        assert analyzer._get_output_filename('output_json') is None
+
+    def test_merge_outputs(self):
+        config = _Config(['CSV'], {
+            'CSV': {'csv_filename': self._path('ika.csv')},
+            'JSON': {'append_data': True},
+        })
+        analyzer = _BatchAnalyzer({
+            'output_json': self._path('ika.json'),
+            'statink_payload': self._path('payload.msgpack'),
+        }, config)
+        tasks = analyzer._create_tasks(
+            [('%d.mp4' % i, None) for i in range(3)], self.tmp_dir)
+
+        # Workers finish in random order.
+        for task in reversed(tasks):
+            i = task['index']
+            self._write(task['outputs']['output_json'], 'json%d\n' % i)
+            self._write(task['outputs']['output_csv'], 'csv%d\n' % i)
+            self._write(task['outputs']['statink_payload'], 'payload%d' % i)
+        analyzer._merge_outputs(tasks)
+
+        # In the order of the input files.
+        assert self._read(self._path('ika.json')) == 'json0\njson1\njson2\n'
+        assert self._read(self._path('ika.csv')) == 'csv0\ncsv1\ncsv2\n'
+        assert [self._read(f) for f in (
+            self._path('payload.msgpack'),
+            self._path('payload-1.msgpack'),
+            self._path('payload-2.msgpack'))] == \
+            ['payload0', 'payload1', 'payload2']
+
+    def test_merge_outputs_per_video(self):
+        # Segments of the videos are merged per video, in their order.
+        config = _Config(['JSON'], {
+            'JSON': {'json_filename': '__INPUT_FILE__.json',
+                     'append_data': False},
+        })
+        analyzer = _BatchAnalyzer({}, config)
+        videos = [self._path('a.mp4'), self._path('b.mp4')]
+        tasks = analyzer._create_tasks(
+            [(videos[0], (0, 1000)), (videos[0], (1000, None)),
+             (videos[1], None)], self.tmp_dir)
+
+        self._write(tasks[0]['outputs']['output_json'], 'a0')
+        self._write(tasks[1]['outputs']['output_json'], 'a1')
+        root, ext = os.path.splitext(tasks[1]['outputs']['output_json'])
+        self._write('%s-1%s' % (root, ext), 'a2')
+        self._write(tasks[2]['outputs']['output_json'], 'b0')
+        analyzer._merge_outputs(tasks)
+
+        assert [self._read(f) for f in (
+            videos[0] + '.json', videos[0] + '-1.json',
+            videos[0] + '-2.json', videos[1] + '.json')] == \
+            ['a0', 'a1', 'a2', 'b0']
+        assert not os.path.exists(videos[1] + '-1.json')
+
+    def test_run_error(self):
+        # Errors are raised as they are, after the workers are stopped.
+        class FailingBatchAnalyzer(_BatchAnalyzer):
+            def _create_tasks(self, file_segments, tmp_dir):
+                raise ValueError('test')
+
+        analyzer = FailingBatchAnalyzer({}, _Config([], {}))
+        with self.assertRaisesRegex(ValueError, 'test'):
+            analyzer.run([])
+
+if __name__ == '__main__':
+    unittest.main()
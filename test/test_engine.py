@@ -28,8 +28,11 @@
 import unittest
 import os.path
 import sys
+import threading
 import time
 
+import numpy as np
+
 # Append the Ikalog root dir to sys.path to import IkaUtils.
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import ikalog.engine
@@ -82,6 +85,172 @@ class TestEngine(unittest.TestCase):
         self.assertNotEqual(context['game']['kills'],
                             engine.context['game']['kills'])
 
+    def test_get_preview(self):
+        engine = ikalog.engine.IkaEngine()
+        engine.reset()
+        context = engine.context
+
+        self.assertIsNone(engine.get_preview(context))
+
+        frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+        context['engine']['frame'] = frame
+        self.assertFalse('preview' in context['engine'])
+
+        # The preview is a copy; drawing on it doesn't touch the frame.
+        preview = engine.get_preview(context)
+        self.assertIsNot(preview, frame)
+        preview[:, :, :] = 255
+        self.assertEqual(np.max(frame), 0)
+        self.assertIs(engine.get_preview(context), preview)
+
+        # The buffer is reused for the next frame.
+        del context['engine']['preview']
+        context['engine']['frame'] = np.ones((720, 1280, 3), dtype=np.uint8)
+        preview2 = engine.get_preview(context)
+        self.assertIs(preview2, preview)
+        self.assertEqual(np.max(preview2), 1)
+
+    def test_scene_scheduler(self):
+        engine = ikalog.engine.IkaEngine()
+        engine.reset()
+        context = engine.context
+        context['engine']['frame'] = np.zeros((720, 1280, 3), dtype=np.uint8)
+        context['engine']['msec'] = 0
+
+        timer_icon = engine.find_scene_object('GameTimerIcon')
+        timer_icon.match_no_cache = lambda context: True
+        engine.process_scenes()
+
+        # In-game scenes are evaluated, and the others are skipped.
+        self.assertEqual(engine.get_game_phase(context), 'in_game')
+        self.assertEqual(engine.find_scene_object('Lobby')._matched, False)
+        self.assertEqual(
+            engine.find_scene_object('Lobby')._prof_skipped_frames, 1)
+        self.assertEqual(
+            engine.find_scene_object('GameDead')._prof_skipped_frames, 0)
+
+        stats = engine.get_scheduler_stats()
+        self.assertEqual(stats['frames'], 1)
+        self.assertEqual(stats['evaluated'] + stats['skipped'],
+                         len(engine.scenes))
+        self.assertEqual(context['engine']['scenes_skipped'], stats['skipped'])
+
+    def test_dispatch_table(self):
+        calls = []
+
+        class Plugin(object):
+
+            def on_frame_read(self, context):
+                calls.append(('on_frame_read', self))
+
+            def on_game_killed(self, context, params):
+                calls.append(('on_game_killed', params))
+
+        class UncaughtPlugin(object):
+
+            def on_uncaught_event(self, event_name, context):
+                calls.append(('uncaught', event_name))
+
+        engine = ikalog.engine.IkaEngine()
+        plugin = Plugin()
+        engine.set_plugins([plugin, UncaughtPlugin()])
+        calls.clear()
+
+        engine.call_plugins('on_frame_read')
+        engine.call_plugins('on_game_killed', params={'n': 1})
+        self.assertEqual(calls, [
+            ('on_frame_read', plugin),
+            ('uncaught', 'on_frame_read'),
+            ('on_game_killed', {'n': 1}),
+            ('uncaught', 'on_game_killed'),
+        ])
+
+        # set_plugins() rebuilds the tables.
+        engine.set_plugins([])
+        calls.clear()
+        engine.call_plugins('on_frame_read')
+        self.assertEqual(calls, [])
+
+    def test_plugin_executor(self):
+        main_thread = threading.current_thread()
+        calls = []
+
+        class Plugin(object):
+
+            run_in_executor = True
+
+            def on_frame_read(self, context):
+                calls.append(('on_frame_read',
+                              threading.current_thread() is main_thread))
+
+            def on_game_killed(self, context, params):
+                calls.append(('on_game_killed',
+                              threading.current_thread() is main_thread,
+                              context['game']['index'], params))
+
+        engine = ikalog.engine.IkaEngine()
+        engine.set_plugins([Plugin()])
+
+        engine.context['game']['index'] = 1
+        engine.call_plugins('on_game_killed', params={'n': 1})
+        # The handler sees the context at the time of the event.
+        engine.context['game']['index'] = 2
+        engine.flush_plugin_executors(10)
+        engine.call_plugins('on_frame_read')
+
+        self.assertEqual(calls, [
+            ('on_game_killed', False, 1, {'n': 1}),
+            ('on_frame_read', True),
+        ])
+        stats = engine.get_plugin_executor_stats()
+        self.assertEqual(stats['Plugin']['delivered'], 1)
+
+        # set_plugins() stops the executors.
+        engine.set_plugins([])
+        self.assertEqual(engine.get_plugin_executor_stats(), {})
+
+    def test_stop_plugin_executor(self):
+        calls = []
+
+        class Plugin(object):
+
+            run_in_executor = True
+
+            def on_stop(self, context):
+                calls.append('on_stop')
+
+        engine = ikalog.engine.IkaEngine()
+        engine.set_plugins([Plugin()])
+        executor = list(engine._plugin_executors.values())[0]
+        self.assertTrue(executor._thread.is_alive())
+
+        # stop() delivers on_stop, and the worker thread exits.
+        engine.stop()
+        self.assertEqual(calls, ['on_stop'])
+        self.assertFalse(executor._thread.is_alive())
+        self.assertEqual(engine.get_plugin_executor_stats(), {})
+
+    def test_event_queue(self):
+        events = []
+
+        class Plugin(object):
+
+            def on_uncaught_event(self, event_name, context):
+                events.append(event_name)
+
+        engine = ikalog.engine.IkaEngine()
+        engine.set_plugins([Plugin()])
+        engine.call_plugins_later('on_event1')
+        engine.call_plugins_later('on_event2')
+        engine.read_next_frame = lambda skip_frames=0: (
+            np.zeros((720, 1280, 3), dtype=np.uint8), 0)
+
+        engine.process_frame()
+        self.assertEqual(
+            [e for e in events if e in ('on_event1', 'on_event2')],
+            ['on_event1', 'on_event2'])
+        self.assertEqual(len(engine._event_queue), 0)
+
 
 if __name__ == '__main__':
     unittest.main()
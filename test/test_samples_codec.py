@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for the codec of the image samples sent to the API.
+#  Usage:
+#    python ./test_samples_codec.py
+#  or
+#    py.test ./test_samples_codec.py
+
+import os
+import sys
+import unittest
+
+import cv2
+import numpy as np
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+base_dir = os.path.join(os.path.dirname(__file__), '..')
+sys.path.append(base_dir)
+from ikalog.api import APIServer, samples_codec
+
+
+def create_samples(rng, n, h=51, w=410):
+    # Binary images, mostly the same as the previous sample.
+    samples = []
+    img = (rng.rand(h, w) > 0.9).astype(np.uint8) * 255
+    for i in range(n):
+        if rng.rand() < 0.3:
+            img = (rng.rand(h, w) > 0.9).astype(np.uint8) * 255
+        samples.append(img)
+    return samples
+
+
+class TestSamplesCodec(unittest.TestCase):
+
+    def test_round_trip(self):
+        rng = np.random.RandomState(0)
+        for samples in (
+                create_samples(rng, 20),
+                [rng.randint(256, size=(7, 5)).astype(np.uint8)
+                 for i in range(10)],
+                [rng.randint(256, size=(3, 4)).astype(np.uint8)]):
+            h = samples[0].shape[0]
+
+            unpacked = samples_codec.unpack_samples(
+                samples_codec.pack_samples(samples), h)
+            assert np.array_equal(unpacked, np.stack(samples))
+
+            decoded = samples_codec.decode_samples(
+                samples_codec.encode_samples(samples), h)
+            assert np.array_equal(decoded, np.stack(samples))
+
+    def test_color_samples(self):
+        rng = np.random.RandomState(1)
+        samples = [cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+                   for img in create_samples(rng, 5)]
+        decoded = samples_codec.decode_samples(
+            samples_codec.encode_samples(samples), samples[0].shape[0])
+        assert np.array_equal(decoded, np.stack([s[:, :, 0] for s in samples]))
+
+    def test_legacy_format(self):
+        rng = np.random.RandomState(2)
+        samples = [rng.randint(256, size=(6, 8)).astype(np.uint8)
+                   for i in range(10)]
+        payload = {
+            'sample_height': 6,
+            'sample_width': 8,
+            'samples': samples_codec.encode_samples_legacy(samples),
+        }
+        decoded = APIServer()._unpack_deadly_weapons_image(payload)
+        assert np.array_equal(decoded, np.stack(samples))
+        assert np.array_equal(
+            samples_codec.decode_samples_legacy(payload['samples'], 6),
+            np.stack(samples))
+
+    def test_v2_path(self):
+        # The servers with the codec accept the path, which the older
+        # ones reject.
+        response = APIServer().process_request(
+            '/api/v2/recoginizer/deadly_weapon', {})
+        assert not response.get('description', '').startswith(
+            'Invalid API Path')
+
+    @unittest.skipUnless(
+        os.path.exists(os.path.join(base_dir, 'data', 'deadly_weapons.ja.model')),
+        'deadly_weapons.ja.model is not available')
+    def test_recoginize_deadly_weapons(self):
+        rng = np.random.RandomState(3)
+        samples = create_samples(rng, 12)
+        payload = {
+            'game_language': 'ja',
+            'sample_height': samples[0].shape[0],
+            'sample_width': samples[0].shape[1],
+            'samples': samples_codec.encode_samples_legacy(samples),
+        }
+        server = APIServer()
+        response_legacy = server.recoginize_deadly_weapons(payload)
+
+        payload['encoding'] = 'xor'
+        payload['samples'] = samples_codec.encode_samples(samples)
+        response = server.recoginize_deadly_weapons(payload)
+
+        assert response == response_legacy
+        assert response['total'] == 12
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for the startup profiler and lazy imports.
+#  Usage:
+#    python ./test_startup_profile.py
+#  or
+#    py.test ./test_startup_profile.py
+
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from ikalog.startup_profile import StartupProfiler
+
+
+class TestStartupProfiler(unittest.TestCase):
+
+    def test_imports(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, '_startup_a.py'), 'w') as f:
+                f.write('import time\ntime.sleep(0.01)\nimport _startup_b\n')
+            with open(os.path.join(tmpdir, '_startup_b.py'), 'w') as f:
+                f.write('import time\ntime.sleep(0.02)\n')
+
+            profiler = StartupProfiler()
+            sys.path.insert(0, tmpdir)
+            try:
+                profiler.start()
+                with profiler.measure('phase'):
+                    import _startup_a
+                profiler.stop()
+            finally:
+                sys.path.remove(tmpdir)
+                sys.modules.pop('_startup_a', None)
+                sys.modules.pop('_startup_b', None)
+
+        assert not profiler in sys.meta_path
+
+        imports = dict((name, (t, self_t))
+                       for name, t, self_t in profiler.get_imports())
+        a, b = imports['_startup_a'], imports['_startup_b']
+        assert b[0] >= 0.02
+        assert a[0] >= a[1] + b[0] - 0.001
+        assert 0.01 <= a[1] < 0.02
+
+        assert profiler.get_phases()[0][0] == 'phase'
+
+        out = io.StringIO()
+        profiler.dump(file=out)
+        assert '_startup_a' in out.getvalue()
+
+    def test_lazy_outputs(self):
+        import ikalog.outputs
+        from ikalog.outputs import CSV
+        assert CSV.__module__ == 'ikalog.outputs.csv'
+        assert 'CSV' in dir(ikalog.outputs)
+        with self.assertRaises(AttributeError):
+            ikalog.outputs.NoSuchPlugin
+
+    def test_load_plugin(self):
+        import ikalog.outputs
+        JSON = ikalog.outputs.load_plugin('JSON')
+        assert JSON.__module__ == 'ikalog.outputs.printjson'
+        assert ikalog.outputs.load_plugin('JSON') is JSON
+        with self.assertRaises(AttributeError):
+            ikalog.outputs.load_plugin('NoSuchPlugin')
+
+if __name__ == '__main__':
+    unittest.main()
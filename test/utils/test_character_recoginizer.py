@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for CharacterRecoginizer.
+#  Usage:
+#    python ./test_character_recoginizer.py
+#  or
+#    py.test ./test_character_recoginizer.py
+
+import os
+import sys
+import unittest
+
+import cv2
+import numpy as np
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+base_dir = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.append(base_dir)
+from ikalog.utils.character_recoginizer import CharacterRecoginizer
+
+
+class TestCharacterRecoginizer(unittest.TestCase):
+
+    def _load_recoginizer(self):
+        model_file = os.path.join(base_dir, 'data', 'number.model')
+        if not os.path.exists(model_file):
+            self.skipTest('%s not found' % model_file)
+
+        recoginizer = CharacterRecoginizer()
+        recoginizer.load_model_from_file(model_file)
+        recoginizer.train()
+        return recoginizer
+
+    def _create_image(self, rng, recoginizer, num_chars):
+        # White characters from the samples of the model, on black.
+        h, w = recoginizer.sample_height, recoginizer.sample_width
+        img = np.zeros((h + 8, (w + 4) * num_chars + 8, 3), dtype=np.uint8)
+        for i in range(num_chars):
+            sample = recoginizer.samples[rng.randint(len(recoginizer.samples))]
+            glyph = np.reshape(sample, (h, w)) > 127
+            # Noise
+            glyph = glyph ^ (rng.randint(20, size=glyph.shape) == 0)
+            x = 4 + i * (w + 4)
+            img[4:4 + h, x:x + w][glyph] = 255
+        return img
+
+    def test_match_many(self):
+        recoginizer = self._load_recoginizer()
+        rng = np.random.RandomState(0)
+
+        images = [self._create_image(rng, recoginizer, rng.randint(4))
+                  for i in range(30)]
+        images.append(np.zeros((25, 43, 3), dtype=np.uint8))
+
+        expected = [recoginizer.match(img) for img in images]
+        assert recoginizer.match_many(images) == expected
+        assert any(len(s) > 1 for s in expected)
+
+        expected = [recoginizer.match_digits(img) for img in images]
+        assert recoginizer.match_digits_many(images) == expected
+        assert any(d is not None for d in expected)
+
+        expected = [recoginizer.match(img, num_digits=(2, 3))
+                    for img in images]
+        assert recoginizer.match_many(images, num_digits=(2, 3)) == expected
+
+        assert recoginizer.match_many([]) == []
+
+if __name__ == '__main__':
+    unittest.main()
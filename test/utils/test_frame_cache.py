@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for FrameCache.
+#  Usage:
+#    python ./test_frame_cache.py
+#  or
+#    py.test ./test_frame_cache.py
+
+import os
+import sys
+import unittest
+
+import cv2
+import numpy as np
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from ikalog.utils.frame_cache import *
+from ikalog.utils.image_filters import *
+
+
+class TestFrameCache(unittest.TestCase):
+
+    def _random_frame(self):
+        return np.random.randint(256, size=(72, 128, 3)).astype(np.uint8)
+
+    def test_roi(self):
+        frame = self._random_frame()
+        cache = FrameCache(frame)
+
+        img_hsv = cache.hsv(10, 20, 30, 40)
+        expected = cv2.cvtColor(frame[20:40, 10:30], cv2.COLOR_BGR2HSV)
+        assert np.array_equal(img_hsv, expected)
+
+        # The same area is converted only once.
+        assert cache.hsv(10, 20, 30, 40) is img_hsv
+
+        img_gray = cache.gray(10, 20, 30, 40)
+        expected = cv2.cvtColor(frame[20:40, 10:30], cv2.COLOR_BGR2GRAY)
+        assert np.array_equal(img_gray, expected)
+
+    def test_full_frame(self):
+        frame = self._random_frame()
+        cache = FrameCache(frame)
+
+        img_gray = cache.gray()
+        assert np.array_equal(img_gray, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+
+        # Once the whole frame is converted, areas are views of it.
+        img_roi = cache.gray(0, 0, 10, 10)
+        assert np.shares_memory(img_roi, img_gray)
+
+    def test_set_frame(self):
+        frame1 = self._random_frame()
+        frame2 = self._random_frame()
+        cache = FrameCache(frame1)
+
+        assert find_frame_cache(frame1) is cache
+        cache.hsv()
+
+        cache.set_frame(frame2)
+        assert find_frame_cache(frame1) is None
+        assert find_frame_cache(frame2) is cache
+        assert np.array_equal(
+            cache.hsv(), cv2.cvtColor(frame2, cv2.COLOR_BGR2HSV))
+
+    def test_get_frame_cache(self):
+        frame = self._random_frame()
+        context = {'engine': {'frame': frame}}
+
+        cache = get_frame_cache(context)
+        assert cache.frame is frame
+        assert get_frame_cache(context) is cache
+
+        context['engine']['frame'] = self._random_frame()
+        assert get_frame_cache(context).frame is context['engine']['frame']
+
+    def test_filters_with_hsv(self):
+        frame = self._random_frame()
+        cache = FrameCache(frame)
+
+        for f in [MM_WHITE(), MM_NOT_WHITE(),
+                  MM_COLOR_BY_HUE(hue=(0, 30), visibility=(32, 255))]:
+            img1 = f(frame)
+            img2 = f(frame, img_hsv=cache.hsv())
+            assert np.array_equal(img1, img2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for IconRecoginizer.
+#  Usage:
+#    python ./test_icon_recoginizer.py
+#  or
+#    py.test ./test_icon_recoginizer.py
+
+import os
+import sys
+import unittest
+
+import cv2
+import numpy as np
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+base_dir = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.append(base_dir)
+from ikalog.utils.icon_recoginizer import IconRecoginizer, GearPowerRecoginizer
+
+
+def down_sample_2d_reference(src, w, h):
+    # The original implementation.
+    sy, sx = src.shape[0:2]
+
+    out_img = np.zeros((h, w), np.uint8)
+    for x in range(w):
+        for y in range(h):
+            x1 = int((x / w) * sx)
+            y1 = int((y / h) * sy)
+            x2 = int(((x + 1) / w) * sx)
+            y2 = int(((y + 1) / h) * sy)
+            out_img[y, x] = np.amax(src[y1:y2, x1:x2])
+
+    max_value = np.amax(out_img)
+    if max_value > 0:
+        out_img = ((out_img * 1.0) / max_value)
+    return out_img
+
+
+class ReferenceIconRecoginizer(IconRecoginizer):
+
+    def down_sample_2d(self, src, w, h):
+        return down_sample_2d_reference(src, w, h)
+
+
+class TestIconRecoginizer(unittest.TestCase):
+
+    def _random_mask(self, w, h, channels=None):
+        shape = (h, w) if channels is None else (h, w, channels)
+        img = np.random.randint(2, size=shape).astype(np.uint8) * 255
+        # Sparse masks, like the edges of icons.
+        img[np.random.randint(4, size=shape) > 0] = 0
+        return img
+
+    def test_down_sample_2d(self):
+        recoginizer = IconRecoginizer()
+        for w, h in [(12, 12), (24, 24), (37, 37), (45, 40), (50, 13)]:
+            for channels in [None, 3]:
+                src = self._random_mask(w, h, channels)
+                expected = down_sample_2d_reference(src, 12, 12)
+                out_img = recoginizer.down_sample_2d(src, 12, 12)
+                assert out_img.shape == expected.shape
+                assert np.array_equal(out_img, expected)
+
+        src = np.zeros((37, 37), dtype=np.uint8)
+        assert np.array_equal(recoginizer.down_sample_2d(src, 12, 12),
+                              down_sample_2d_reference(src, 12, 12))
+
+    def test_extract_features(self):
+        img = np.random.randint(256, size=(37, 37, 3)).astype(np.uint8)
+        img = cv2.GaussianBlur(img, (3, 3), 0)
+        assert np.array_equal(
+            IconRecoginizer().extract_features(img),
+            ReferenceIconRecoginizer().extract_features(img))
+
+    @unittest.skipUnless(
+        os.path.exists(os.path.join(base_dir, 'data', 'gearpowers.knn.data')),
+        'gearpowers.knn.data is not available')
+    def test_gearpowers_model(self):
+        model_file = os.path.join(base_dir, 'data', 'gearpowers.knn.data')
+        recoginizer = IconRecoginizer()
+        recoginizer.load_model_from_file(model_file)
+        recoginizer.knn_train()
+
+        reference = ReferenceIconRecoginizer()
+        reference.load_model_from_file(model_file)
+        reference.knn_train()
+
+        for i in range(20):
+            img = np.random.randint(256, size=(37, 37, 3)).astype(np.uint8)
+            img = cv2.GaussianBlur(img, (5, 5), 0)
+            assert recoginizer.predict(img) == reference.predict(img)
+
+    @unittest.skipUnless(
+        os.path.exists(os.path.join(base_dir, 'data', 'gearpowers.knn.data')),
+        'gearpowers.knn.data is not available')
+    def test_predict_batch(self):
+        model_file = os.path.join(base_dir, 'data', 'gearpowers.knn.data')
+        recoginizer = IconRecoginizer()
+        recoginizer.load_model_from_file(model_file)
+        recoginizer.knn_train()
+
+        imgs = []
+        for i in range(20):
+            img = np.random.randint(256, size=(37, 37, 3)).astype(np.uint8)
+            imgs.append(cv2.GaussianBlur(img, (5, 5), 0))
+
+        results = recoginizer.predict_batch(imgs)
+        assert results == [recoginizer.predict(img) for img in imgs]
+        assert recoginizer.predict_batch([]) == []
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for IkaMatcher2 kernels.
+#  Usage:
+#    python ./test_ikamatcher2_kernel.py
+#  or
+#    py.test ./test_ikamatcher2_kernel.py
+
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from ikalog.utils.ikamatcher2 import matcher
+from ikalog.utils.ikamatcher2.reference import Numpy_uint8, Numpy_1bit
+
+
+class TestIkaMatcher2Kernel(unittest.TestCase):
+
+    def _random_img(self, rng, width, height):
+        return rng.randint(256, size=(height, width)).astype(np.uint8)
+
+    def test_1bit(self):
+        rng = np.random.RandomState(0)
+
+        # Including sizes not aligned to the kernel.
+        for width, height in [(128, 1), (13, 7), (430, 60)]:
+            img_mask = self._random_img(rng, width, height)
+            img_test = self._random_img(rng, width, height)
+
+            reference = Numpy_uint8(width, height)
+            reference.load_mask(img_mask)
+            kernel = Numpy_1bit(width, height)
+            kernel.load_mask(img_mask)
+
+            img_test_encoded = kernel.encode(img_test)
+            assert img_test_encoded.shape[0] % 16 == 0
+
+            assert kernel.popcnt(img_test_encoded) == \
+                reference.popcnt(img_test)[0]
+            assert kernel.logical_and_popcnt(img_test_encoded) == \
+                reference.logical_and_popcnt(img_test)[0]
+            assert kernel.logical_or_popcnt(img_test_encoded) == \
+                reference.logical_or_popcnt(img_test)[0]
+
+            img_decoded = kernel.decode(kernel._img_mask)
+            assert np.array_equal(
+                img_decoded, np.where(img_mask >= 170, 255, 0))
+
+    def test_select_kernel(self):
+        orig_kernel_cache_file = matcher.kernel_cache_file
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                matcher.kernel_cache_file = \
+                    os.path.join(tmpdir, 'ikamatcher2_kernel.json')
+                candidates = matcher.get_kernel_candidates()
+
+                kernel_name = matcher.select_kernel(candidates)
+                assert kernel_name in candidates
+                assert os.path.exists(matcher.kernel_cache_file)
+
+                # The cached choice is used.
+                candidates[kernel_name] = None
+                assert matcher.select_kernel(candidates) == kernel_name
+        finally:
+            matcher.kernel_cache_file = orig_kernel_cache_file
+
+if __name__ == '__main__':
+    unittest.main()
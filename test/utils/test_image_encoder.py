@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for ImageEncoder.
+#  Usage:
+#    python ./test_image_encoder.py
+#  or
+#    py.test ./test_image_encoder.py
+
+import os
+import sys
+import unittest
+
+import cv2
+import numpy as np
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from ikalog.utils.image_encoder import *
+
+
+class TestImageEncoder(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.img = cv2.GaussianBlur(
+            rng.randint(256, size=(72, 128, 3)).astype(np.uint8), (5, 5), 0)
+        self.encoder = ImageEncoder()
+
+    def tearDown(self):
+        self.encoder.shutdown()
+
+    def test_encode_png(self):
+        img_png = self.encoder.encode_png(self.img).result()
+        img = cv2.imdecode(np.frombuffer(img_png, np.uint8), 1)
+        assert np.array_equal(img, self.img)
+
+        img_png = self.encoder.encode(self.img, '.jpg', 90).result()
+        self.assertEqual(img_png[:2], b'\xff\xd8')
+
+    def test_cache(self):
+        future = self.encoder.encode_png(self.img)
+
+        # The same contents share the encoding.
+        self.assertIs(self.encoder.encode_png(self.img.copy()), future)
+        self.assertEqual(self.encoder.get_stats()['hits'], 1)
+
+        # Different contents or compression levels don't.
+        img2 = self.img.copy()
+        img2[0, 0, 0] ^= 1
+        self.assertIsNot(self.encoder.encode_png(img2), future)
+        self.assertIsNot(self.encoder.encode_png(self.img, 9), future)
+        self.assertEqual(self.encoder.get_stats()['misses'], 3)
+
+    def test_cache_size(self):
+        encoder = ImageEncoder(cache_size=2)
+        try:
+            futures = [encoder.encode_png(self.img + i) for i in range(3)]
+            self.assertEqual(encoder.get_stats()['cached'], 2)
+            # The oldest result was discarded.
+            self.assertIsNot(encoder.encode_png(self.img), futures[0])
+            self.assertIs(encoder.encode_png(self.img + 2), futures[2])
+        finally:
+            encoder.shutdown()
+
+    def test_compression(self):
+        encoder = ImageEncoder(compression=0)
+        try:
+            img_png0 = encoder.encode_png(self.img).result()
+            img_png9 = encoder.encode_png(self.img, 9).result()
+        finally:
+            encoder.shutdown()
+        self.assertGreater(len(img_png0), len(img_png9))
+
+    def test_get_image_encoder(self):
+        self.assertIs(get_image_encoder(), get_image_encoder())
+
+    def test_configure_image_encoder(self):
+        old_encoder = get_image_encoder()
+        future = old_encoder.encode_png(self.img)
+
+        encoder = configure_image_encoder(max_workers=1, compression=0)
+        try:
+            self.assertIs(get_image_encoder(), encoder)
+            self.assertEqual(encoder.compression, 0)
+            self.assertEqual(encoder._executor._max_workers, 1)
+            # The previous encoder finishes the requested encodings.
+            self.assertIsNotNone(future.result())
+        finally:
+            configure_image_encoder()
+        self.assertIsNone(get_image_encoder().compression)
+
+
+if __name__ == '__main__':
+    unittest.main()
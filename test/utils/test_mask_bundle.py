@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for the mask bundle of IkaMatcher2.
+#  Usage:
+#    python ./test_mask_bundle.py
+#  or
+#    py.test ./test_mask_bundle.py
+
+import os
+import sys
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from ikalog.utils.ikamatcher2 import mask_bundle
+from ikalog.utils.ikamatcher2.matcher import IkaMatcher2
+from ikalog.utils.ikamatcher2.reference import Numpy_uint8_fast, Numpy_1bit
+
+
+class TestMaskBundle(unittest.TestCase):
+
+    def _create_mask_file(self, dirname):
+        rng = np.random.RandomState(0)
+        img = (rng.randint(2, size=(72, 128)) * 255).astype(np.uint8)
+        img_file = os.path.join(dirname, 'mask.png')
+        cv2.imwrite(img_file, img)
+        return img_file
+
+    def _create_matchers(self, img_file, kernel_class):
+        return [
+            IkaMatcher2(10, 20, 30, 40, img_file=img_file,
+                        kernel_class=kernel_class),
+            IkaMatcher2(0, 0, 128, 72, img_file=img_file,
+                        kernel_class=kernel_class),
+        ]
+
+    def test_bundle(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            img_file = self._create_mask_file(tmpdir)
+            filename = os.path.join(tmpdir, 'bundle')
+
+            for kernel_class in [Numpy_uint8_fast, Numpy_1bit]:
+                writer = mask_bundle.start_recording()
+                try:
+                    expected = self._create_matchers(img_file, kernel_class)
+                finally:
+                    mask_bundle.stop_recording()
+                assert len(writer) == 2
+                writer.save(filename)
+
+                bundle = mask_bundle.MaskBundle(filename)
+                for m in expected:
+                    img_mask = bundle.get(
+                        img_file, m._left, m._top, m._width, m._height)
+                    assert np.array_equal(img_mask, m._kernel._img_mask)
+                    assert img_mask.dtype == m._kernel._img_mask.dtype
+
+                # Other areas of the file are not in the bundle.
+                assert bundle.get(img_file, 0, 0, 10, 10) is None
+                del bundle
+
+            # Modified masks are not used.
+            bundle = mask_bundle.MaskBundle(filename)
+            st = os.stat(img_file)
+            os.utime(img_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            assert bundle.get(img_file, 10, 20, 30, 40) is None
+            del bundle
+
+    def test_matcher(self):
+        orig_get_bundle_dir = mask_bundle.get_bundle_dir
+        with tempfile.TemporaryDirectory() as tmpdir:
+            try:
+                mask_bundle.get_bundle_dir = lambda: tmpdir
+                img_file = self._create_mask_file(tmpdir)
+
+                writer = mask_bundle.start_recording()
+                expected = self._create_matchers(img_file, Numpy_1bit)
+                mask_bundle.stop_recording()
+                writer.save(mask_bundle.get_bundle_filename(Numpy_1bit))
+
+                matchers = self._create_matchers(img_file, Numpy_1bit)
+                for m, e in zip(matchers, expected):
+                    # Loaded from the bundle.
+                    assert not m._kernel._img_mask.flags.writeable
+                    assert np.array_equal(
+                        m._kernel._img_mask, e._kernel._img_mask)
+
+                    frame = np.zeros((72, 128, 3), dtype=np.uint8)
+                    assert m.match_score(frame) == e.match_score(frame)
+                del matchers
+            finally:
+                mask_bundle.get_bundle_dir = orig_get_bundle_dir
+                mask_bundle._bundles.clear()
+
+if __name__ == '__main__':
+    unittest.main()
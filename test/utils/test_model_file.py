@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for the model file.
+#  Usage:
+#    python ./test_model_file.py
+#  or
+#    py.test ./test_model_file.py
+
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+base_dir = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.append(base_dir)
+from ikalog.utils import model_file
+from ikalog.utils.character_recoginizer import CharacterRecoginizer
+from ikalog.utils.icon_recoginizer import IconRecoginizer
+from ikalog.utils.neuralnet.functions import relu
+from ikalog.utils.neuralnet.weapon import WeaponClassifier
+
+
+class TestModelFile(unittest.TestCase):
+
+    def test_save_load(self):
+        arrays = {
+            'a': np.arange(10, dtype=np.float32).reshape((2, 5)),
+            'b': np.arange(3, dtype=np.uint8),
+            'empty': np.zeros((0, 4), dtype=np.float64),
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'test.model')
+            model_file.save_model(filename, arrays, meta={'names': ['x']})
+
+            assert model_file.is_model_file(filename)
+            loaded, meta = model_file.load_model(filename)
+            assert meta == {'names': ['x']}
+            for name, array in arrays.items():
+                assert loaded[name].dtype == array.dtype
+                assert np.array_equal(loaded[name], array)
+            assert not loaded['a'].flags.writeable
+            del loaded
+
+    def test_icon_recoginizer(self):
+        legacy_file = os.path.join(base_dir, 'data', 'gear_brands.knn.data')
+        if not os.path.exists(legacy_file):
+            self.skipTest('%s not found' % legacy_file)
+
+        expected = IconRecoginizer()
+        expected.load_model_from_file(legacy_file)
+        expected.knn_train()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'gear_brands.knn.data')
+            expected.save_model_to_file(filename)
+
+            recoginizer = IconRecoginizer()
+            recoginizer.load_model_from_file(filename)
+            recoginizer.knn_train()
+            assert recoginizer.icon_names == expected.icon_names
+
+            rng = np.random.RandomState(0)
+            features = np.array(expected.samples, np.float32)
+            features += rng.normal(
+                scale=0.1, size=features.shape).astype(np.float32)
+            assert np.array_equal(
+                recoginizer.model.findNearest(features, 3)[1],
+                expected.model.findNearest(features, 3)[1])
+            del recoginizer
+
+    def test_character_recoginizer(self):
+        rng = np.random.RandomState(0)
+        expected = CharacterRecoginizer()
+        expected.samples = rng.randint(2, size=(20, 221)) * 255.0
+        expected.responses = [ord('0') + i % 10 for i in range(20)]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'number.model')
+            expected.save_model_to_file(filename)
+
+            recoginizer = CharacterRecoginizer()
+            recoginizer.load_model_from_file(filename)
+            recoginizer.train()
+            assert np.array_equal(recoginizer.samples, expected.samples)
+            assert np.array_equal(recoginizer.responses, expected.responses)
+            del recoginizer
+
+    def test_weapon_classifier(self):
+        rng = np.random.RandomState(0)
+        expected = WeaponClassifier()
+        expected._weapons_keys = ['a', 'b', 'c']
+        expected._layers = [
+            {'weight': rng.rand(8, 12).astype(np.float32),
+             'bias': rng.rand(8).astype(np.float32), 'activation': relu},
+            {'weight': rng.rand(3, 8).astype(np.float32)},
+        ]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'weapons.nn.data')
+            expected.save_model_to_file(filename)
+
+            classifier = WeaponClassifier()
+            classifier.load_model_from_file(filename)
+            assert classifier._weapons_keys == expected._weapons_keys
+            assert classifier._layers[0]['activation'] is relu
+            assert 'activation' not in classifier._layers[1]
+            for layer, expected_layer in zip(classifier._layers,
+                                             expected._layers):
+                assert np.array_equal(
+                    layer['weight'], expected_layer['weight'])
+            assert np.array_equal(
+                classifier._layers[0]['bias'], expected._layers[0]['bias'])
+            del classifier
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for MultiClassIkaMatcher2.
+#  Usage:
+#    python ./test_multi_class_matcher.py
+#  or
+#    py.test ./test_multi_class_matcher.py
+
+import os
+import sys
+import unittest
+
+import cv2
+import numpy as np
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from ikalog.utils.frame_cache import FrameCache
+from ikalog.utils.image_filters import *
+from ikalog.utils.ikamatcher2.matcher import IkaMatcher2, MultiClassIkaMatcher2
+
+
+class TestMultiClassIkaMatcher2(unittest.TestCase):
+
+    def _create_masks(self, rng):
+        # (left, top, width, height, fg_method, bg_method)
+        areas = [
+            (100, 100, 200, 40, MM_WHITE(), MM_NOT_WHITE()),
+            (100, 100, 200, 40, MM_WHITE(), MM_NOT_WHITE()),
+            (100, 100, 200, 40,
+             MM_COLOR_BY_HUE(hue=(25, 35), visibility=(200, 255)),
+             MM_NOT_WHITE()),
+            (120, 110, 180, 30, MM_WHITE(), MM_NOT_WHITE()),
+            (100, 100, 200, 40, MM_WHITE(), MM_BLACK()),
+            (600, 500, 50, 50, MM_WHITE(), MM_NOT_WHITE()),
+        ]
+
+        masks = []
+        for left, top, width, height, fg_method, bg_method in areas:
+            img_mask = (rng.randint(4, size=(height, width)) == 0) * 255
+            masks.append(IkaMatcher2(
+                left, top, width, height, img=img_mask.astype(np.uint8),
+                threshold=0.5, orig_threshold=0.5,
+                fg_method=fg_method, bg_method=bg_method))
+        return masks
+
+    def _create_frame(self, rng, mask):
+        # A frame which matches the mask more or less.
+        frame = rng.randint(256, size=(720, 1280, 3)).astype(np.uint8)
+        img_mask = mask._kernel.decode(mask._kernel._img_mask)
+        roi = frame[mask._top: mask._top + mask._height,
+                    mask._left: mask._left + mask._width]
+        roi[img_mask == 0] = 255
+        roi[(img_mask > 0) & (rng.randint(2, size=img_mask.shape) > 0)] = 0
+        return frame
+
+    def test_match_scores(self):
+        rng = np.random.RandomState(0)
+        masks = self._create_masks(rng)
+
+        multi_class_matcher = MultiClassIkaMatcher2()
+        for mask in masks:
+            multi_class_matcher.add_mask(mask)
+
+        matched = 0
+        for i in range(20):
+            frame = self._create_frame(rng, masks[i % len(masks)])
+            # Keep the reference, or the cache is gone at once.
+            cache = FrameCache(frame)
+            scores = multi_class_matcher.match_scores(frame)
+
+            for mask, score in zip(masks, scores):
+                expected = mask.match_score(frame)
+                assert score[0] == bool(expected[0])
+                # Ratios of the fused masks are float32, while some
+                # kernels return float64 ones.
+                assert np.float32(score[1]) == \
+                    np.float32(np.asarray(expected[1]).ravel()[0])
+                assert np.float32(score[2]) == \
+                    np.float32(np.asarray(expected[2]).ravel()[0])
+                matched += score[0]
+
+        assert matched > 0
+        # The masks with the same bg_method and area are fused.
+        assert len(multi_class_matcher._groups) == 3
+
+    def test_register(self):
+        rng = np.random.RandomState(1)
+        masks = self._create_masks(rng)
+        expected_masks = self._create_masks(np.random.RandomState(1))
+
+        multi_class_matcher = MultiClassIkaMatcher2()
+        for mask in masks:
+            multi_class_matcher.register(mask)
+
+        for i in range(len(masks)):
+            frame = self._create_frame(rng, masks[i])
+            cache = FrameCache(frame)
+
+            for mask, expected_mask in zip(masks, expected_masks):
+                assert mask.match(frame) == \
+                    bool(expected_mask.match(frame))
+
+    def _count_group_calls(self, multi_class_matcher):
+        # Count the evaluations of the fused masks.
+        calls = []
+        multi_class_matcher.compile()
+        for group in multi_class_matcher._groups:
+            def match_scores(img, debug=None, group=group,
+                             orig=group.match_scores):
+                calls.append(group)
+                return orig(img, debug=debug)
+            group.match_scores = match_scores
+        return calls
+
+    def test_cache(self):
+        rng = np.random.RandomState(3)
+        masks = self._create_masks(rng)
+
+        multi_class_matcher = MultiClassIkaMatcher2()
+        for mask in masks:
+            multi_class_matcher.register(mask)
+        calls = self._count_group_calls(multi_class_matcher)
+        num_groups = len(multi_class_matcher._groups)
+
+        frame = self._create_frame(rng, masks[0])
+        cache = FrameCache(frame)
+        scores = multi_class_matcher.match_scores(frame)
+        assert len(calls) == num_groups
+
+        # The same frame is served from the cache.
+        assert multi_class_matcher.match_scores(frame) == scores
+        for mask, score in zip(masks, scores):
+            assert mask.match(frame) == bool(score[0])
+        assert len(calls) == num_groups
+
+        # A new frame invalidates the cache.
+        frame2 = self._create_frame(rng, masks[3])
+        cache.set_frame(frame2)
+        multi_class_matcher.match_scores(frame2)
+        assert len(calls) == num_groups * 2
+
+        # Frames without the cache are always evaluated.
+        frame3 = frame2.copy()
+        multi_class_matcher.match_scores(frame3)
+        num_calls = len(calls)
+        multi_class_matcher.match_scores(frame3)
+        assert len(calls) == num_calls + (num_calls - num_groups * 2)
+
+    def test_match_best(self):
+        rng = np.random.RandomState(2)
+        masks = self._create_masks(rng)[0:3]
+
+        multi_class_matcher = MultiClassIkaMatcher2()
+        for mask in masks:
+            multi_class_matcher.add_mask(mask)
+
+        frame = self._create_frame(rng, masks[1])
+        ratio, best = multi_class_matcher.match_best(frame)
+        assert best is masks[1]
+
+        # Cropped images are supported, too.
+        img = frame[100: 140, 100: 300]
+        assert multi_class_matcher.match_best(img)[1] is masks[1]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for PluginExecutor.
+#  Usage:
+#    python ./test_plugin_executor.py
+#  or
+#    py.test ./test_plugin_executor.py
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+import numpy as np
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from ikalog.utils.plugin_executor import *
+
+
+class Plugin(object):
+
+    run_in_executor = True
+
+    def on_game_killed(self, context, params):
+        self.events.append((context['game']['index'], params['n']))
+
+    def __init__(self):
+        self.events = []
+
+
+def create_context(index=0):
+    return {
+        'engine': {'engine': None, 'service': {}, 'frame': None},
+        'game': {'index': index},
+    }
+
+
+class TestPluginExecutor(unittest.TestCase):
+
+    def test_is_async_event(self):
+        self.assertTrue(PluginExecutor.is_async_event('on_game_killed'))
+        self.assertTrue(PluginExecutor.is_async_event('on_result_detail'))
+        self.assertTrue(PluginExecutor.is_async_event('on_lobby_matched'))
+        self.assertFalse(PluginExecutor.is_async_event('on_frame_read'))
+        self.assertFalse(PluginExecutor.is_async_event('on_config_apply'))
+
+    def test_order(self):
+        plugin = Plugin()
+        executor = PluginExecutor(plugin)
+        handler = executor.wrap('on_game_killed', plugin.on_game_killed)
+
+        context = create_context()
+        for n in range(100):
+            context['game']['index'] = n
+            handler(context, {'n': n})
+
+        self.assertTrue(executor.flush(10))
+        executor.shutdown()
+
+        # The snapshots keep the context at the time of the event.
+        self.assertEqual(plugin.events, [(n, n) for n in range(100)])
+
+        stats = executor.get_stats()
+        self.assertEqual(stats['delivered'], 100)
+        self.assertEqual(stats['dropped'], 0)
+        self.assertEqual(stats['depth'], 0)
+        self.assertEqual(stats['latency']['count'], 100)
+
+    def _test_policy(self, policy):
+        # Block the worker until all the events are queued.
+        gate = threading.Event()
+        events = []
+
+        def handler(context, params):
+            gate.wait(10)
+            events.append(params['n'])
+
+        executor = PluginExecutor(Plugin(), max_queue_size=2, policy=policy)
+        queue_event = executor.wrap('on_game_killed', handler)
+        queue_event(create_context(), {'n': 0})
+        # Wait for the worker to take the first event.
+        while executor.get_depth() > 0:
+            time.sleep(0.01)
+        for n in range(1, 5):
+            queue_event(create_context(), {'n': n})
+
+        gate.set()
+        executor.shutdown(10)
+        return events, executor.get_stats()
+
+    def test_drop_oldest(self):
+        events, stats = self._test_policy('drop_oldest')
+        self.assertEqual(events, [0, 3, 4])
+        self.assertEqual(stats['dropped'], 2)
+        self.assertEqual(stats['max_depth'], 2)
+
+    def test_drop_newest(self):
+        events, stats = self._test_policy('drop_newest')
+        self.assertEqual(events, [0, 1, 2])
+        self.assertEqual(stats['dropped'], 2)
+
+    def test_block(self):
+        gate = threading.Event()
+        events = []
+
+        def handler(context, params):
+            gate.wait(10)
+            events.append(params['n'])
+
+        executor = PluginExecutor(Plugin(), max_queue_size=1, policy='block')
+        queue_event = executor.wrap('on_game_killed', handler)
+
+        def producer():
+            for n in range(4):
+                queue_event(create_context(), {'n': n})
+
+        thread = threading.Thread(target=producer)
+        thread.start()
+        thread.join(0.2)
+        # The producer waits for the worker.
+        self.assertTrue(thread.is_alive())
+
+        gate.set()
+        thread.join(10)
+        executor.shutdown(10)
+        self.assertEqual(events, [0, 1, 2, 3])
+        self.assertEqual(executor.get_stats()['dropped'], 0)
+
+    def test_exception(self):
+        events = []
+
+        def handler(context, params):
+            if params['n'] == 0:
+                raise Exception('test')
+            events.append(params['n'])
+
+        executor = PluginExecutor(Plugin())
+        queue_event = executor.wrap('on_game_killed', handler)
+        queue_event(create_context(), {'n': 0})
+        queue_event(create_context(), {'n': 1})
+        executor.shutdown(10)
+        self.assertEqual(events, [1])
+
+    def test_uncaught_event(self):
+        events = []
+
+        def on_uncaught_event(event_name, context):
+            events.append((event_name, context['game']['index']))
+
+        executor = PluginExecutor(Plugin())
+        queue_event = executor.wrap(
+            'on_game_start', on_uncaught_event, uncaught=True)
+        queue_event('on_game_start', create_context(3))
+        executor.shutdown(10)
+        self.assertEqual(events, [('on_game_start', 3)])
+
+    def test_snapshot_event(self):
+        engine = object()
+        context = create_context()
+        context['engine']['engine'] = engine
+        params = {'list': [1]}
+
+        context2, params2 = snapshot_event(context, params)
+        self.assertIs(context2['engine']['engine'], engine)
+        context['game']['index'] = 1
+        params['list'].append(2)
+        self.assertEqual(context2['game']['index'], 0)
+        self.assertEqual(params2, {'list': [1]})
+
+    def test_snapshot_event_arrays(self):
+        # The images are shared, except the preview buffer.
+        context = create_context()
+        frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+        preview = frame.copy()
+        context['engine']['frame'] = frame
+        context['engine']['preview'] = preview
+        context['game']['image_scoreboard'] = frame
+        params = {'img': frame}
+
+        context2, params2 = snapshot_event(context, params)
+        self.assertIs(context2['engine']['frame'], frame)
+        self.assertIs(context2['game']['image_scoreboard'], frame)
+        self.assertIs(params2['img'], frame)
+        self.assertIsNot(context2['engine']['preview'], preview)
+        self.assertTrue(np.array_equal(context2['engine']['preview'], preview))
+
+
+if __name__ == '__main__':
+    unittest.main()
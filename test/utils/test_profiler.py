@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for Profiler.
+#  Usage:
+#    python ./test_profiler.py
+#  or
+#    py.test ./test_profiler.py
+
+import csv
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from ikalog.utils.profiler import *
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_percentiles(self):
+        profiler = Profiler()
+        for i in range(1, 101):
+            profiler.record('scene', 'GameDead', i / 1000.0)
+
+        stats = profiler.get_stats()['scene']['GameDead']
+        assert stats['count'] == 100
+        assert abs(stats['p50'] - 50.5) < 0.01
+        assert abs(stats['p95'] - 95.05) < 0.01
+        assert abs(stats['p99'] - 99.01) < 0.01
+        assert abs(stats['max'] - 100) < 0.01
+
+    def test_window(self):
+        profiler = Profiler(window=10)
+        for i in range(100):
+            profiler.record('engine', 'frame', 1.0 if i < 90 else 0.0)
+
+        stats = profiler.get_stats()['engine']['frame']
+        assert stats['count'] == 100
+        assert stats['p99'] == 0.0
+        assert stats['max'] == 1000.0
+
+    def test_nested_plugin_calls(self):
+        profiler = Profiler()
+        t1 = profiler.plugin_enter()
+        t2 = profiler.plugin_enter()
+        profiler.plugin_exit('Inner', 'on_game_killed', t2)
+        profiler.plugin_exit('Outer', 'on_frame_read', t1)
+
+        plugins = profiler.get_stats()['plugin']
+        assert plugins['Inner.on_game_killed']['count'] == 1
+        assert plugins['Outer.on_frame_read']['count'] == 1
+        # Only the outermost call is counted.
+        assert profiler.plugin_time * 1000 == \
+            plugins['Outer.on_frame_read']['total']
+
+    def test_dispatch(self):
+        profiler = Profiler()
+        dispatch = profiler.dispatch_enter()
+        t1 = profiler.plugin_enter()
+        # A nested dispatch is a part of the plugin.
+        profiler.dispatch_exit('on_game_killed', profiler.dispatch_enter())
+        profiler.plugin_exit('Plugin', 'on_frame_read', t1)
+        profiler.dispatch_exit('on_frame_read', dispatch)
+
+        engine = profiler.get_stats()['engine']
+        assert engine['dispatch.on_frame_read']['count'] == 1
+        assert not 'dispatch.on_game_killed' in engine
+        assert profiler.dispatch_time >= 0
+
+    def test_output(self):
+        profiler = Profiler()
+        profiler.record('scene', 'Lobby', 0.001)
+        profiler.frame_done(0.01)
+        profiler.frame_done(0.01)
+        profiler.add_dropped_frames(3)
+        profiler.set_queue_depth('event', 2)
+        profiler.set_queue_depth('event', 1)
+
+        stats = json.loads(json.dumps(profiler.get_stats()))
+        assert stats['frames'] == 2
+        assert stats['dropped_frames'] == 3
+        assert stats['queues']['event'] == {'depth': 1, 'max': 2}
+
+        f = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+        f.close()
+        try:
+            profiler.dump_csv(f.name)
+            with open(f.name) as csv_file:
+                rows = list(csv.reader(csv_file))
+        finally:
+            os.remove(f.name)
+
+        assert rows[0][0:3] == ['category', 'name', 'count']
+        assert [r[0:3] for r in rows[1:]] == \
+            [['engine', 'frame', '2'], ['scene', 'Lobby', '1']]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for StatInkUploader, with a stub stat.ink server.
+#  Usage:
+#    python ./test_statink_uploader.py
+#  or
+#    py.test ./test_statink_uploader.py
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import umsgpack
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from ikalog.utils.statink_uploader import StatInkUploader
+
+
+class StubStatInkHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        payload = umsgpack.unpackb(body)
+
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            status = server.statuses.pop(0) if server.statuses else 200
+        try:
+            # Give the other workers time to overlap.
+            time.sleep(0.05)
+            if status == 200:
+                with server.lock:
+                    server.battles.append(payload)
+                    battle_id = len(server.battles)
+                response = {'id': battle_id,
+                            'url': 'https://stat.ink/u/test/%d' % battle_id}
+            else:
+                response = {'error': {'status': status}}
+
+            data = json.dumps(response).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubStatInkServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, statuses=None):
+        HTTPServer.__init__(self, ('localhost', 0), StubStatInkHandler)
+        self.lock = threading.Lock()
+        self.statuses = list(statuses or [])
+        self.battles = []
+        self.active = 0
+        self.max_active = 0
+
+
+class TestStatInkUploader(unittest.TestCase):
+
+    def start_server(self, statuses=None):
+        self.httpd = StubStatInkServer(statuses)
+        thread = threading.Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://localhost:%d/api/v1/battle' % \
+            self.httpd.server_address[1]
+
+    def setUp(self):
+        self.httpd = None
+        self.spool_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        shutil.rmtree(self.spool_dir)
+
+    def spooled_files(self, subdir=''):
+        path = os.path.join(self.spool_dir, subdir)
+        if not os.path.exists(path):
+            return []
+        return [f for f in os.listdir(path) if f.endswith('.msgpack')]
+
+    def test_upload(self):
+        self.start_server()
+        results = []
+        uploader = StatInkUploader(url=self.url, spool_dir=self.spool_dir,
+                                   max_workers=2)
+        for i in range(10):
+            uploader.submit(
+                {'kill': i}, 'API_KEY',
+                callback=lambda error, response: results.append(error))
+        self.assertTrue(uploader.flush(10))
+        uploader.stop()
+
+        self.assertEqual(results, [False] * 10)
+        self.assertEqual(sorted(b['kill'] for b in self.httpd.battles),
+                         list(range(10)))
+        self.assertEqual(self.httpd.battles[0]['apikey'], 'API_KEY')
+        self.assertLessEqual(self.httpd.max_active, 2)
+        self.assertEqual(self.spooled_files(), [])
+        self.assertEqual(uploader.get_stats()['uploaded'], 10)
+
+    def test_retry(self):
+        # Server errors are retried.
+        self.start_server(statuses=[500, 503])
+        results = []
+        uploader = StatInkUploader(url=self.url, spool_dir=self.spool_dir,
+                                   backoff_base=0.01)
+        uploader.submit({'kill': 1}, 'API_KEY',
+                        callback=lambda *args: results.append(args))
+        self.assertTrue(uploader.flush(10))
+        uploader.stop()
+
+        self.assertEqual(len(results), 1)
+        self.assertFalse(results[0][0])
+        self.assertEqual(results[0][1]['id'], 1)
+        self.assertEqual(uploader.get_stats()['retries'], 2)
+        self.assertEqual(self.spooled_files(), [])
+
+    def test_refused(self):
+        # Battles stat.ink refused are not retried.
+        self.start_server(statuses=[400])
+        results = []
+        uploader = StatInkUploader(url=self.url, spool_dir=self.spool_dir,
+                                   backoff_base=0.01)
+        uploader.submit({'kill': 1}, 'API_KEY',
+                        callback=lambda *args: results.append(args))
+        self.assertTrue(uploader.flush(10))
+        uploader.stop()
+
+        self.assertTrue(results[0][0])
+        self.assertEqual(uploader.get_stats()['failed'], 1)
+        self.assertEqual(self.spooled_files(), [])
+        self.assertEqual(len(self.spooled_files('failed')), 1)
+
+    def test_spool(self):
+        # The battles not posted are left in the spool, and posted by the
+        # next uploader.
+        uploader = StatInkUploader(spool_dir=self.spool_dir, start=False)
+        for i in range(3):
+            uploader.submit({'kill': i}, 'API_KEY')
+        uploader.stop()
+        self.assertEqual(len(self.spooled_files()), 3)
+
+        # The API key is not written in the spool.
+        for basename in self.spooled_files():
+            with open(os.path.join(self.spool_dir, basename), 'rb') as f:
+                self.assertNotIn('apikey', umsgpack.unpackb(f.read()))
+
+        # Posted with the key of the next uploader.
+        self.start_server()
+        uploader = StatInkUploader(url=self.url, spool_dir=self.spool_dir,
+                                   api_key='NEW_API_KEY')
+        self.assertTrue(uploader.flush(10))
+        uploader.stop()
+
+        # In the order of submission.
+        self.assertEqual([b['kill'] for b in self.httpd.battles], [0, 1, 2])
+        self.assertEqual([b['apikey'] for b in self.httpd.battles],
+                         ['NEW_API_KEY'] * 3)
+        self.assertEqual(self.spooled_files(), [])
+
+    def test_api_key(self):
+        # The retries are posted with the current key of the uploader.
+        self.start_server(statuses=[500])
+        uploader = StatInkUploader(url=self.url, spool_dir=self.spool_dir,
+                                   api_key='OLD_API_KEY', backoff_base=0.5)
+        uploader.submit({'kill': 1})
+        self.assertTrue(uploader.wait_in_flight(10))
+        uploader.api_key = 'NEW_API_KEY'
+        self.assertTrue(uploader.flush(10))
+        uploader.stop()
+        self.assertEqual(self.httpd.battles[0]['apikey'], 'NEW_API_KEY')
+
+        # Without a key, the battle is left in the spool.
+        uploader = StatInkUploader(url=self.url, spool_dir=self.spool_dir)
+        uploader.submit({'kill': 2})
+        self.assertTrue(uploader.flush(10))
+        uploader.stop()
+        self.assertEqual(len(self.httpd.battles), 1)
+        self.assertEqual(uploader.get_stats()['gave_up'], 1)
+        self.assertEqual(len(self.spooled_files()), 1)
+
+    def test_shared_spool(self):
+        # Two uploaders (e.g. batch mode with --jobs) on one spool post
+        # each battle only once.
+        uploader = StatInkUploader(spool_dir=self.spool_dir, start=False)
+        for i in range(20):
+            uploader.submit({'kill': i}, 'API_KEY')
+        uploader.stop()
+
+        self.start_server()
+        uploaders = [
+            StatInkUploader(url=self.url, spool_dir=self.spool_dir,
+                            api_key='API_KEY', start=False)
+            for i in range(2)]
+        threads = [threading.Thread(target=u.start) for u in uploaders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for uploader in uploaders:
+            self.assertTrue(uploader.flush(10))
+            uploader.stop()
+
+        self.assertEqual(sorted(b['kill'] for b in self.httpd.battles),
+                         list(range(20)))
+        self.assertEqual(
+            sum(u.get_stats()['uploaded'] for u in uploaders), 20)
+        self.assertEqual(self.spooled_files(), [])
+        self.assertEqual(os.listdir(os.path.join(self.spool_dir, 'inflight')),
+                         [])
+
+    def test_stale_claim(self):
+        # The battles claimed by a crashed uploader are taken over.
+        crashed = StatInkUploader(spool_dir=self.spool_dir, start=False)
+        crashed.submit({'kill': 1}, 'API_KEY')
+
+        self.start_server()
+        uploader = StatInkUploader(url=self.url, spool_dir=self.spool_dir,
+                                   api_key='API_KEY')
+        self.assertTrue(uploader.flush(10))
+        uploader.stop()
+        self.assertEqual(self.httpd.battles, [])
+
+        uploader = StatInkUploader(url=self.url, spool_dir=self.spool_dir,
+                                   api_key='API_KEY', stale_claim_sec=0.0)
+        self.assertTrue(uploader.flush(10))
+        uploader.stop()
+        self.assertEqual([b['kill'] for b in self.httpd.battles], [1])
+
+    def test_dead_claim(self):
+        # The battles claimed by a process which has exited are taken
+        # over on start, however fresh they are.
+        crashed = StatInkUploader(spool_dir=self.spool_dir, start=False)
+        crashed.submit({'kill': 1}, 'API_KEY')
+
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        inflight_dir = os.path.join(self.spool_dir, 'inflight')
+        os.rename(os.path.join(inflight_dir, crashed._owner),
+                  os.path.join(inflight_dir, '%d-dead' % process.pid))
+
+        self.start_server()
+        uploader = StatInkUploader(url=self.url, spool_dir=self.spool_dir,
+                                   api_key='API_KEY')
+        self.assertTrue(uploader.flush(10))
+        uploader.stop()
+        self.assertEqual([b['kill'] for b in self.httpd.battles], [1])
+        self.assertEqual(os.listdir(inflight_dir), [])
+
+    def test_wait_in_flight(self):
+        # Doesn't wait for the retries.
+        uploader = StatInkUploader(url='http://localhost:1/api/v1/battle',
+                                   spool_dir=self.spool_dir,
+                                   backoff_base=60.0)
+        uploader.submit({'kill': 1}, 'API_KEY')
+        self.assertTrue(uploader.wait_in_flight(10))
+        self.assertEqual(uploader.get_stats()['retries'], 1)
+        self.assertFalse(uploader.flush(0.1))
+        uploader.stop()
+
+        # Left in the spool for the next start.
+        self.assertEqual(len(self.spooled_files()), 1)
+
+    def test_give_up(self):
+        # No server is running.
+        results = []
+        uploader = StatInkUploader(url='http://localhost:1/api/v1/battle',
+                                   spool_dir=self.spool_dir,
+                                   max_retries=1, backoff_base=0.01)
+        uploader.submit({'kill': 1}, 'API_KEY',
+                        callback=lambda *args: results.append(args))
+        self.assertTrue(uploader.flush(10))
+        uploader.stop()
+
+        self.assertTrue(results[0][0])
+        self.assertEqual(uploader.get_stats()['gave_up'], 1)
+        # Retried on the next start.
+        self.assertEqual(len(self.spooled_files()), 1)
+
+    def test_backoff(self):
+        uploader = StatInkUploader(backoff_base=5.0, backoff_max=60.0,
+                                   start=False)
+        self.assertEqual(
+            [uploader.get_backoff(n) for n in range(1, 6)],
+            [5.0, 10.0, 20.0, 40.0, 60.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
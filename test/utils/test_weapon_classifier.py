@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+#  Unit test for WeaponClassifier.
+#  Usage:
+#    python ./test_weapon_classifier.py
+#  or
+#    py.test ./test_weapon_classifier.py
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+base_dir = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.append(base_dir)
+from ikalog.utils.neuralnet.functions import relu, quantize_layers, \
+    dequantize_layers, weight_bytes
+from ikalog.utils.neuralnet.weapon import WeaponClassifier
+
+
+class TestWeaponClassifier(unittest.TestCase):
+
+    def _create_classifier(self, rng, width=8, height=6, hidden=32,
+                           classes=10):
+        classifier = WeaponClassifier()
+        classifier._weapons_keys = ['weapon%d' % i for i in range(classes)]
+        classifier._layers = [
+            {'weight': rng.randn(hidden, width * height * 3).astype(np.float32),
+             'bias': rng.randn(hidden).astype(np.float32),
+             'activation': relu},
+            {'weight': rng.randn(classes, hidden).astype(np.float32)},
+        ]
+        return classifier
+
+    def _create_images(self, rng, n, width=8, height=6):
+        return [rng.randint(0, 256, (height, width, 3)).astype(np.uint8)
+                for i in range(n)]
+
+    def test_predict_batch(self):
+        rng = np.random.RandomState(0)
+        classifier = self._create_classifier(rng)
+        images = self._create_images(rng, 8)
+
+        results = classifier.predict_batch(images)
+        assert results == [classifier.predict(img) for img in images]
+        assert classifier.predict_batch([]) == []
+
+    def test_quantize_layers(self):
+        rng = np.random.RandomState(1)
+        layers = self._create_classifier(rng)._layers
+
+        layers_int8 = quantize_layers(layers, 'int8')
+        for layer, layer_int8 in zip(layers, layers_int8):
+            assert layer_int8['weight'].dtype == np.int8
+            w = layer_int8['weight'] * layer_int8['scale'][:, np.newaxis]
+            assert np.max(np.abs(w - layer['weight'])) <= \
+                np.max(layer_int8['scale']) / 2 + 1e-6
+
+        layers_f16 = quantize_layers(layers, 'float16')
+        assert layers_f16[0]['weight'].dtype == np.float16
+        assert layers_f16[0]['activation'] is relu
+        # The original layers are not modified.
+        assert layers[0]['weight'].dtype == np.float32
+
+        layers_dequantized = dequantize_layers(layers_int8)
+        for layer_int8, layer in zip(layers_int8, layers_dequantized):
+            assert layer['weight'].dtype == np.float32
+            assert 'scale' not in layer
+            assert np.allclose(
+                layer['weight'],
+                layer_int8['weight'] * layer_int8['scale'][:, np.newaxis])
+        assert weight_bytes(layers_int8) * 4 >= weight_bytes(layers) > \
+            weight_bytes(layers_int8) * 3
+
+    def test_precision(self):
+        rng = np.random.RandomState(2)
+        classifier = self._create_classifier(rng)
+        images = self._create_images(rng, 64)
+        expected = classifier.predict_batch(images)
+
+        for precision in ('float16', 'int8'):
+            report = classifier.compare_precision(images, precision)
+            assert report['samples'] == 64
+            assert report['agreement'] >= 0.9, report
+            assert report['quantized_weight_bytes'] < report['weight_bytes']
+            assert report['msec'] >= 0 and report['quantized_msec'] >= 0
+
+            classifier.set_precision(precision)
+            # Converted once; prediction uses float32 weights.
+            for layer in classifier._layers_predict:
+                assert layer['weight'].dtype == np.float32
+            results = classifier.predict_batch(images)
+            agreement = np.mean([r == e for r, e in zip(results, expected)])
+            assert agreement == report['agreement']
+
+        classifier.set_precision('float32')
+        assert classifier.predict_batch(images) == expected
+
+if __name__ == '__main__':
+    unittest.main()
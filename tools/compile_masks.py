@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  This is a tool to compile the masks of the scenes into a mask bundle
+#  (see ikalog/utils/ikamatcher2/mask_bundle.py), to speed up startup.
+#  Usage:
+#    ./tools/compile_masks.py [--lang ja en_NA en_EU] [--kernel Numpy_1bit]
+#
+#  Run this again after changing the masks. Modified masks are ignored
+#  in the bundle and loaded from the images.
+#
+import argparse
+import os.path
+import sys
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from ikalog.engine import IkaEngine
+from ikalog.utils import Localization
+from ikalog.utils.ikamatcher2 import matcher, mask_bundle
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lang', type=str, nargs='*',
+                        default=['ja', 'en_NA', 'en_EU'])
+    parser.add_argument('--kernel', type=str, default=None)
+    parser.add_argument('--output', type=str, default=None,
+                        help='the filename of the bundle, without extension')
+    return vars(parser.parse_args())
+
+if __name__ == '__main__':
+    args = get_args()
+    matcher.load_kernel(args['kernel'])
+    kernel_class = matcher.default_kernel
+
+    # A bundle is keyed by the mask files, so one bundle holds the masks
+    # of all the languages.
+    writer = mask_bundle.start_recording()
+    for lang in args['lang']:
+        Localization.set_game_languages(lang)
+        IkaEngine()
+        print('%s: %d masks' % (lang, len(writer)))
+    mask_bundle.stop_recording()
+
+    filename = args['output'] or mask_bundle.get_bundle_filename(kernel_class)
+    writer.save(filename)
+    print('Wrote %d masks (%s) to %s' % (
+        len(writer), kernel_class.__name__, filename))
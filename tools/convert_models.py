@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  This is a tool to convert the pickled recognizer models in data/ to
+#  the memory-mappable model files (see ikalog/utils/model_file.py).
+#  The recognizers load either format.
+#  Usage:
+#    ./tools/convert_models.py [--output_dir DIR]
+#
+import argparse
+import os.path
+import sys
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from ikalog.utils import IkaUtils, model_file
+from ikalog.utils.character_recoginizer import \
+    CharacterRecoginizer, DeadlyWeaponRecoginizer
+from ikalog.utils.icon_recoginizer.icon import IconRecoginizer
+from ikalog.utils.neuralnet.weapon import WeaponClassifier
+
+# Models and the recognizers to load and save them.
+models = [
+    ('number.model', CharacterRecoginizer),
+    ('udemae.model', CharacterRecoginizer),
+    ('fes_gender.model', CharacterRecoginizer),
+    ('fes_level.model', CharacterRecoginizer),
+    ('deadly_weapons.ja.model', DeadlyWeaponRecoginizer),
+    ('deadly_weapons.en_NA.model', DeadlyWeaponRecoginizer),
+    ('deadly_weapons.en_EU.model', DeadlyWeaponRecoginizer),
+    ('gearpowers.knn.data', IconRecoginizer),
+    ('gear_brands.knn.data', IconRecoginizer),
+    ('weapons.knn.data', IconRecoginizer),
+    ('weapons.nn.data', WeaponClassifier),
+]
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output_dir', type=str, default=None,
+                        help='default: overwrite the models in data/')
+    return vars(parser.parse_args())
+
+
+def convert_models(output_dir=None):
+    for filename, recoginizer_class in models:
+        src = IkaUtils.get_path('data', filename)
+        dest = os.path.join(output_dir, filename) if output_dir else src
+
+        if not os.path.exists(src):
+            print('%s: not found' % src)
+            continue
+
+        if model_file.is_model_file(src) and (src == dest):
+            print('%s: already converted' % src)
+            continue
+
+        # DeadlyWeaponRecoginizer loads the model of the game language
+        # on construction. It is overwritten by the following load.
+        recoginizer = recoginizer_class()
+        recoginizer.load_model_from_file(src)
+        recoginizer.save_model_to_file(dest)
+        print('%s: wrote %s' % (src, dest))
+
+if __name__ == '__main__':
+    args = get_args()
+    if args['output_dir']:
+        os.makedirs(args['output_dir'], exist_ok=True)
+    convert_models(args['output_dir'])
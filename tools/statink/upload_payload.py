@@ -26,7 +26,7 @@ import umsgpack
 
 # Append the Ikalog root dir to sys.path to import IkaUtils.
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
-from ikalog.utils.statink_uploader import UploadToStatInk
+from ikalog.utils.statink_uploader import StatInkUploader
 
 
 def get_args():
@@ -35,23 +35,25 @@ def get_args():
     )
 
     parser.add_argument(
-        dest='payload', metavar='STATINK_PAYLOAD_FILE', type=str)
+        dest='payloads', metavar='STATINK_PAYLOAD_FILE', type=str, nargs='+')
     parser.add_argument(
         '--api_key', dest='api_key', metavar='YOUR_API_KEY', type=str)
     parser.add_argument(
         '--video_id', dest='video_id', metavar='YOUTUBE_VIDEO_ID', type=str)
     parser.add_argument(
         '--endpoint', dest='endpoint', metavar='API_ENDPOINT_URL', type=str)
+    parser.add_argument(
+        '--workers', dest='workers', metavar='N', type=int, default=4,
+        help='Number of concurrent uploads')
+    parser.add_argument(
+        '--spool', dest='spool_dir', metavar='DIR', type=str,
+        help='Keep the payloads not uploaded yet in the directory')
 
     return vars(parser.parse_args())
 
 
 def main():
     args = get_args()
-    f = open(args['payload'], 'rb')
-    payload = umsgpack.unpack(f)
-    f.close()
-
     url = args['endpoint'] or 'https://stat.ink/api/v1/battle'
 
     api_key = args['api_key']
@@ -59,8 +61,24 @@ def main():
         import IkaConfig
         api_key = IkaConfig.OUTPUT_ARGS['StatInk']['api_key']
 
-    error, response = UploadToStatInk(payload, api_key, url, args['video_id'])
-    print(response.get('url'))
+    uploader = StatInkUploader(
+        url=url, spool_dir=args['spool_dir'], api_key=api_key,
+        max_workers=args['workers'])
+
+    for filename in args['payloads']:
+        f = open(filename, 'rb')
+        payload = umsgpack.unpack(f)
+        f.close()
+
+        def callback(error, response, filename=filename):
+            print('%s: %s' % (filename, response.get('url')))
+
+        uploader.submit(payload, video_id=args['video_id'],
+                        callback=callback)
+
+    uploader.flush()
+    uploader.stop()
+    print(uploader.get_stats())
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  IkaLog
+#  ======
+#  Copyright (C) 2016 Takeshi HASEGAWA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  This is a tool to check the accuracy of WeaponClassifier with quantized
+#  (float16/int8) weights against the float32 model.
+#  Usage:
+#    ./tools/weapons_nn_precision.py [--model data/weapons.nn.data] DIR...
+#
+import argparse
+import os
+import sys
+
+import cv2
+
+# Append the Ikalog root dir to sys.path to import IkaUtils.
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from ikalog.utils.neuralnet.weapon import WeaponClassifier
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default=None)
+    parser.add_argument('dirs', nargs='+',
+                        help='directories of the weapon images (*.png)')
+    return vars(parser.parse_args())
+
+
+def load_images(dirs):
+    images = []
+    for base_dir in dirs:
+        for root, dirs, files in os.walk(base_dir):
+            for file in sorted(files):
+                if file.endswith('.png'):
+                    filename = os.path.join(root, file)
+                    images.append((filename, cv2.imread(filename, 1)))
+    return images
+
+if __name__ == '__main__':
+    args = get_args()
+
+    classifier = WeaponClassifier()
+    classifier.load_model_from_file(args['model'])
+
+    images = load_images(args['dirs'])
+    print('%d images' % len(images))
+    if not images:
+        sys.exit(1)
+
+    for precision in ('float16', 'int8'):
+        report = classifier.compare_precision(
+            [img for filename, img in images], precision)
+        print('%s: agreement %.4f (%d mismatches), max output diff %f' % (
+            precision, report['agreement'], len(report['mismatches']),
+            report['max_output_diff']))
+        # The quantized weights are converted back to float32 for numpy,
+        # so the prediction is not faster, and set_precision() keeps a
+        # float32 copy of the weights in addition to the model.
+        print('  prediction %.2fms (float32 %.2fms), weights %d bytes '
+              '(%d bytes if stored as %s; %d bytes more in memory)' % (
+                  report['quantized_msec'], report['msec'],
+                  report['weight_bytes'], report['quantized_weight_bytes'],
+                  precision, report['weight_bytes']))
+        for i, expected, result in report['mismatches']:
+            print('  %s: %s -> %s' % (images[i][0], expected, result))